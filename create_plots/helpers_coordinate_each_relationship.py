@@ -13,18 +13,24 @@ import pandas as pd
 import os
 
 from create_plots.helpers_reformat_sim_ref_dfs import prepare_inc_df, prepare_prev_df, prepare_dens_df, \
-    prepare_infect_df, get_available_sites_for_relationship, get_sim_survey
+    prepare_infect_df, get_available_sites_for_relationship, get_sim_survey, index_coordinator_by_site
+from create_plots.helpers_reference_store import get_reference_site_df
+from create_plots.helpers_plot_rendering import render_plots
+from create_plots.helpers_timing import record_timing
 from create_plots.helpers_plot_ref_sim_comparisons import plot_inc_ref_sim_comparison, plot_prev_ref_sim_comparison, \
     compare_benchmark, plot_par_dens_ref_sim_comparison, plot_infectiousness_ref_sim_comparison, \
     plot_infection_duration_dist, plot_infection_duration_dist_by_age, create_barplot_frac_comparison
 from create_plots.helpers_likelihood_and_metrics import calc_mean_rel_diff, calc_mean_rel_slope_diff, \
-    get_prev_loglikelihood, get_dens_loglikelihood, corr_ref_sim_points, corr_ref_deriv_sim_points, add_to_summary_table
+    get_prev_loglikelihood_table, get_dens_loglikelihood_table, corr_ref_sim_points, corr_ref_deriv_sim_points, \
+    add_to_summary_table
 
 
 # todo: create one base generate output function for all
 # Incidence by age
+@record_timing
 def generate_age_incidence_outputs(coord_csv, simulation_output_filepath, base_reference_filepath, plot_output_filepath,
-                                   benchmark_simulation_filepath=None):
+                                   benchmark_simulation_filepath=None,
+                                   merge_summary_table=True, plot_workers=1, plot_cache_dir=None):
     """
     From simulation output and matched reference data, create plots and quantitative comparisons for all sites
     associated with the incidence-by-age validation relationship.
@@ -36,6 +42,11 @@ def generate_age_incidence_outputs(coord_csv, simulation_output_filepath, base_r
         plot_output_filepath (): The filepath to the directory where plots should be created
         benchmark_simulation_filepath (): The filepath where benchmark simulation output is located. If None, no
                                           comparisons are made against benchmark simulations
+        merge_summary_table (): Whether to add the summary comparisons to the summary table right away. If False, they
+                                are only saved to a shard (to be merged once all relationships are created)
+        plot_workers (): The number of processes used to render the plots (None for the number of processors)
+        plot_cache_dir (): Directory of the plot cache, from which unchanged plots are copied instead of rendered. If
+                           None, all plots are rendered
 
     Returns:
 
@@ -46,14 +57,15 @@ def generate_age_incidence_outputs(coord_csv, simulation_output_filepath, base_r
 
     # create plots comparing reference and simulation outputs
     gg_plot = plot_inc_ref_sim_comparison(combined_df)
-    gg_plot.save(filename=os.path.join(plot_output_filepath, 'site_compare_incidence_age.png'))
+    plot_jobs = [(gg_plot, os.path.join(plot_output_filepath, 'site_compare_incidence_age.png'), dict())]
                  # height=2 * math.ceil(len(combined_df['Site'].unique()) / 4), width=7.5, units='in')
 
     # additional quantitative comparisons and metrics between simulation and reference data
     # correlations between new simulation and reference dataset values
     correlation_output = corr_ref_sim_points(combined_df)
-    correlation_output[0].save(filename=os.path.join(plot_output_filepath, 'corr_ref_sim_points_incidence_age.png'), height=9, width=8,
-                 units='in')
+    plot_jobs.append((correlation_output[0],
+                      os.path.join(plot_output_filepath, 'corr_ref_sim_points_incidence_age.png'),
+                      dict(height=9, width=8, units='in')))
     correlation_df = correlation_output[1]
     slope_correlation_output = corr_ref_deriv_sim_points(combined_df)
     slope_correlation_df = slope_correlation_output[1]
@@ -63,11 +75,12 @@ def generate_age_incidence_outputs(coord_csv, simulation_output_filepath, base_r
     #                               common.legend = TRUE)  # , legend.grob=get_legend(correlation_output[[1]], position = 'bottom'))
     # correlation_plots.save(filename=os.path.join(plot_output_filepath, 'scatter_regression_incidence_age.png'),
     #                        height=4.5, width=8, units='in')
-    correlation_output[0].save(filename=os.path.join(plot_output_filepath, 'scatter_regression_incidence_age_correlation.png'),
-                               height=4.5, width=8, units='in')
-    slope_correlation_output[0].save(
-        filename=os.path.join(plot_output_filepath, 'scatter_regression_incidence_age_slope_correlation.png'),
-        height=4.5, width=8, units='in')
+    plot_jobs.append((correlation_output[0],
+                      os.path.join(plot_output_filepath, 'scatter_regression_incidence_age_correlation.png'),
+                      dict(height=4.5, width=8, units='in')))
+    plot_jobs.append((slope_correlation_output[0],
+                      os.path.join(plot_output_filepath, 'scatter_regression_incidence_age_slope_correlation.png'),
+                      dict(height=4.5, width=8, units='in')))
 
     # metrics comparing simulation to reference VALUE
     mean_diff_df = calc_mean_rel_diff(combined_df)
@@ -89,19 +102,23 @@ def generate_age_incidence_outputs(coord_csv, simulation_output_filepath, base_r
     # compare simulation and benchmark simulation results
     if 'benchmark' in combined_df.columns:
         compare_benchmarks_output = compare_benchmark(combined_df)
-        compare_benchmarks_output.save(filename=os.path.join(plot_output_filepath,
-                                                             'scatter_benchmark_incidence_age.png'),
-                                       height=4.5, width=8, units='in')
+        plot_jobs.append((compare_benchmarks_output,
+                          os.path.join(plot_output_filepath, 'scatter_benchmark_incidence_age.png'),
+                          dict(height=4.5, width=8, units='in')))
         # comment out the following line since it's not being used.
         # mean_diff_df_bench = calc_mean_rel_diff(combined_df, sim_colname='benchmark')
 
         add_to_summary_table(combined_df=combined_df, plot_output_filepath=plot_output_filepath,
-                             validation_relationship_name='age_incidence')
+                             validation_relationship_name='age_incidence',
+                             merge_summary_table=merge_summary_table)
+    render_plots(plot_jobs, plot_workers=plot_workers, plot_cache_dir=plot_cache_dir)
 
 
 # Prevalence by age
+@record_timing
 def generate_age_prevalence_outputs(coord_csv, simulation_output_filepath, base_reference_filepath,
-                                    plot_output_filepath, benchmark_simulation_filepath=None):
+                                    plot_output_filepath, benchmark_simulation_filepath=None,
+                                    merge_summary_table=True, plot_workers=1, plot_cache_dir=None):
     """
     From simulation output and matched reference data, create plots and quantitative comparisons for all sites
     associated with the prevalence-by-age validation relationship.
@@ -113,6 +130,11 @@ def generate_age_prevalence_outputs(coord_csv, simulation_output_filepath, base_
         plot_output_filepath (): The filepath to the directory where plots should be created
         benchmark_simulation_filepath (): The filepath where benchmark simulation output is located. If None, no
                                           comparisons are made against benchmark simulations
+        merge_summary_table (): Whether to add the summary comparisons to the summary table right away. If False, they
+                                are only saved to a shard (to be merged once all relationships are created)
+        plot_workers (): The number of processes used to render the plots (None for the number of processors)
+        plot_cache_dir (): Directory of the plot cache, from which unchanged plots are copied instead of rendered. If
+                           None, all plots are rendered
 
     Returns:
 
@@ -123,14 +145,15 @@ def generate_age_prevalence_outputs(coord_csv, simulation_output_filepath, base_
 
     # create plots comparing reference and simulation outputs
     gg_plot = plot_prev_ref_sim_comparison(combined_df)
-    gg_plot.save(filename=os.path.join(plot_output_filepath, 'site_compare_prevalence_age.png'), height=9, width=10,
-                 units='in')
+    plot_jobs = [(gg_plot, os.path.join(plot_output_filepath, 'site_compare_prevalence_age.png'),
+                  dict(height=9, width=10, units='in'))]
 
     # additional quantitative comparisons and metrics
     # correlations between new simulation and reference dataset values
     correlation_output = corr_ref_sim_points(combined_df)
-    correlation_output[0].save(filename=os.path.join(plot_output_filepath, 'corr_ref_sim_points_prevalence_age.png'), height=9, width=8,
-                                units='in')
+    plot_jobs.append((correlation_output[0],
+                      os.path.join(plot_output_filepath, 'corr_ref_sim_points_prevalence_age.png'),
+                      dict(height=9, width=8, units='in')))
     correlation_df = correlation_output[1]
     slope_correlation_output = corr_ref_deriv_sim_points(combined_df)
     slope_correlation_df = slope_correlation_output[1]
@@ -141,12 +164,12 @@ def generate_age_prevalence_outputs(coord_csv, simulation_output_filepath, base_
     # correlation_plots.save(filename=os.path.join(plot_output_filepath, 'scatter_regression_prevalence_age.png'),
     #                        height=4.5, width=8, units='in'
     #                        )
-    correlation_output[0].save(
-        filename=os.path.join(plot_output_filepath, 'scatter_regression_prevalence_age_correlation.png'),
-        height=4.5, width=8, units='in')
-    slope_correlation_output[0].save(
-        filename=os.path.join(plot_output_filepath, 'scatter_regression_prevalence_age_slope_correlation.png'),
-        height=4.5, width=8, units='in')
+    plot_jobs.append((correlation_output[0],
+                      os.path.join(plot_output_filepath, 'scatter_regression_prevalence_age_correlation.png'),
+                      dict(height=4.5, width=8, units='in')))
+    plot_jobs.append((slope_correlation_output[0],
+                      os.path.join(plot_output_filepath, 'scatter_regression_prevalence_age_slope_correlation.png'),
+                      dict(height=4.5, width=8, units='in')))
 
     # metrics comparing simulation to reference VALUE
     mean_diff_df = calc_mean_rel_diff(combined_df)
@@ -168,24 +191,27 @@ def generate_age_prevalence_outputs(coord_csv, simulation_output_filepath, base_
     # compare simulation and benchmark simulation results
     if 'benchmark' in combined_df.columns:
         compare_benchmarks_output = compare_benchmark(combined_df)
-        compare_benchmarks_output.save(filename=os.path.join(plot_output_filepath,
-                                                             'scatter_benchmark_prevalence_age.png'),
-                                       height=4.5, width=8, units='in')
+        plot_jobs.append((compare_benchmarks_output,
+                          os.path.join(plot_output_filepath, 'scatter_benchmark_prevalence_age.png'),
+                          dict(height=4.5, width=8, units='in')))
         # add likelihood component
-        new_sim_loglik = get_prev_loglikelihood(combined_df, sim_column='simulation')
-        bench_sim_loglik = get_prev_loglikelihood(combined_df, sim_column='benchmark')
-        new_sim_loglik.rename(columns={"loglikelihood": "loglikelihood_new_sim"}, inplace=True)
-        bench_sim_loglik.rename(columns={"loglikelihood": "loglikelihood_benchmark_sim"}, inplace=True)
-        loglikelihood_comparison = pd.merge(new_sim_loglik, bench_sim_loglik)
+        loglikelihood_comparison = get_prev_loglikelihood_table(combined_df, sim_columns=['simulation', 'benchmark'])
+        loglikelihood_comparison = loglikelihood_comparison.T.reset_index().rename_axis(columns=None)
+        loglikelihood_comparison.rename(columns={"simulation": "loglikelihood_new_sim",
+                                                 "benchmark": "loglikelihood_benchmark_sim"}, inplace=True)
         loglikelihood_comparison.to_csv(os.path.join(plot_output_filepath, 'loglikelihood_prevalence_age.csv'),
                                         index=False)
         add_to_summary_table(combined_df=combined_df, plot_output_filepath=plot_output_filepath,
-                             validation_relationship_name='age_prevalence')
+                             validation_relationship_name='age_prevalence',
+                             merge_summary_table=merge_summary_table)
+    render_plots(plot_jobs, plot_workers=plot_workers, plot_cache_dir=plot_cache_dir)
 
 
 # Parasite density by age
+@record_timing
 def generate_parasite_density_outputs(coord_csv, simulation_output_filepath, base_reference_filepath,
-                                      plot_output_filepath, benchmark_simulation_filepath=None):
+                                      plot_output_filepath, benchmark_simulation_filepath=None,
+                                      merge_summary_table=True, plot_workers=1, plot_cache_dir=None):
     """
     From simulation output and matched reference data, create plots and quantitative comparisons for all sites
     associated with the parasite density-by-age validation relationship.
@@ -197,6 +223,11 @@ def generate_parasite_density_outputs(coord_csv, simulation_output_filepath, bas
         plot_output_filepath (): The filepath to the directory where plots should be created
         benchmark_simulation_filepath (): The filepath where benchmark simulation output is located. If None, no
                                           comparisons are made against benchmark simulations
+        merge_summary_table (): Whether to add the summary comparisons to the summary table right away. If False, they
+                                are only saved to a shard (to be merged once all relationships are created)
+        plot_workers (): The number of processes used to render the plots (None for the number of processors)
+        plot_cache_dir (): Directory of the plot cache, from which unchanged plots are copied instead of rendered. If
+                           None, all plots are rendered
     Returns:
 
     """
@@ -216,61 +247,65 @@ def generate_parasite_density_outputs(coord_csv, simulation_output_filepath, bas
     gg_barplot = plot_output[0]
     line_plot_list = plot_output[1]
     all_sites = plot_output[2]
-    gg_barplot.save(filename=os.path.join(plot_output_filepath, 'site_compare_barplot_asex_dens_age.png'), width=10,
-                    height=20, units='in')
+    plot_jobs = [(gg_barplot, os.path.join(plot_output_filepath, 'site_compare_barplot_asex_dens_age.png'),
+                  dict(width=10, height=20, units='in'))]
     for ss in range(len(all_sites)):
-        line_plot_list[ss].save(filename=os.path.join(plot_output_filepath,
-                                                      'site_compare_asex_dens_age_' + all_sites[ss] + '.png'),
-                                width=8, height=6, units='in')
+        plot_jobs.append((line_plot_list[ss],
+                          os.path.join(plot_output_filepath, 'site_compare_asex_dens_age_' + all_sites[ss] + '.png'),
+                          dict(width=8, height=6, units='in')))
 
     # gametocyte density
     plot_output = plot_par_dens_ref_sim_comparison(combined_df = combined_df_gamet)
     gg_barplot = plot_output[0]
     line_plot_list = plot_output[1]
     all_sites = plot_output[2]
-    gg_barplot.save(filename=os.path.join(plot_output_filepath, 'site_compare_barplot_gamet_dens_age.png'), width=5,
-                    height=15, units='in')
+    plot_jobs.append((gg_barplot, os.path.join(plot_output_filepath, 'site_compare_barplot_gamet_dens_age.png'),
+                      dict(width=5, height=15, units='in')))
     for ss in range(len(all_sites)):
-        line_plot_list[ss].save(filename=os.path.join(plot_output_filepath,
-                                                      'site_compare_gamet_dens_age_' + all_sites[ss] + '.png'),
-                                width=8, height=6, units='in')
+        plot_jobs.append((line_plot_list[ss],
+                          os.path.join(plot_output_filepath, 'site_compare_gamet_dens_age_' + all_sites[ss] + '.png'),
+                          dict(width=8, height=6, units='in')))
 
     # compare simulation and benchmark simulation results
     if 'benchmark' in combined_df_asex.columns:
         compare_benchmarks_output = compare_benchmark(combined_df_asex)
-        compare_benchmarks_output.save(filename=os.path.join(plot_output_filepath,
-                                                             'scatter_benchmark_asex_dens.png'),
-                                       height=4.5, width=8, units='in')
+        plot_jobs.append((compare_benchmarks_output,
+                          os.path.join(plot_output_filepath, 'scatter_benchmark_asex_dens.png'),
+                          dict(height=4.5, width=8, units='in')))
         compare_benchmarks_output = compare_benchmark(combined_df_gamet)
-        compare_benchmarks_output.save(filename=os.path.join(plot_output_filepath,
-                                                             'scatter_benchmark_gamet_dens.png'),
-                                       height=4.5, width=8, units='in')
+        plot_jobs.append((compare_benchmarks_output,
+                          os.path.join(plot_output_filepath, 'scatter_benchmark_gamet_dens.png'),
+                          dict(height=4.5, width=8, units='in')))
         # add likelihood component
-        loglik_df_asex = get_dens_loglikelihood(combined_df=combined_df_asex, sim_column='simulation')
-        loglik_df_asex.rename(columns={"loglikelihood": "loglike_asex"}, inplace=True)
-        loglik_df_asex_bench = get_dens_loglikelihood(combined_df=combined_df_asex, sim_column='benchmark')
-        loglik_df_asex_bench.rename(columns={"loglikelihood": "benchmark_loglike_asex"}, inplace=True)
-        # todo: need review, this dataframe is created but not used. Should we use it in line 234(loglik_df = pd.merge(...))
-        loglik_df_asex = pd.merge(loglik_df_asex, loglik_df_asex_bench, how="outer")
-
-        loglik_df_gamet = get_dens_loglikelihood(combined_df=combined_df_gamet, sim_column='simulation')
-        loglik_df_gamet.rename(columns={"loglikelihood": "loglike_gamet"}, inplace=True)
-        loglik_df_gamet_bench = get_dens_loglikelihood(combined_df=combined_df_gamet, sim_column='benchmark')
-        loglik_df_gamet_bench.rename(columns={"loglikelihood": "benchmark_loglike_gamet"}, inplace=True)
-        loglik_df_gamet = pd.merge(loglik_df_gamet, loglik_df_gamet_bench, how="outer")
+        loglik_df_asex = get_dens_loglikelihood_table(combined_df=combined_df_asex,
+                                                      sim_columns=['simulation', 'benchmark'])
+        loglik_df_asex = loglik_df_asex.T.dropna(how='all').reset_index().rename_axis(columns=None)
+        loglik_df_asex.rename(columns={"simulation": "loglike_asex", "benchmark": "benchmark_loglike_asex"},
+                              inplace=True)
+
+        loglik_df_gamet = get_dens_loglikelihood_table(combined_df=combined_df_gamet,
+                                                       sim_columns=['simulation', 'benchmark'])
+        loglik_df_gamet = loglik_df_gamet.T.dropna(how='all').reset_index().rename_axis(columns=None)
+        loglik_df_gamet.rename(columns={"simulation": "loglike_gamet", "benchmark": "benchmark_loglike_gamet"},
+                               inplace=True)
 
         loglik_df = pd.merge(loglik_df_asex, loglik_df_gamet, how="outer")
         loglik_df.to_csv(os.path.join(plot_output_filepath, 'loglikelihoods_par_dens.csv'),
                                         index=False)
         add_to_summary_table(combined_df=combined_df_asex, plot_output_filepath=plot_output_filepath,
-                             validation_relationship_name='asexual_par_dens')
+                             validation_relationship_name='asexual_par_dens',
+                             merge_summary_table=merge_summary_table)
         add_to_summary_table(combined_df=combined_df_gamet, plot_output_filepath=plot_output_filepath,
-                             validation_relationship_name='gamet_par_dens')
+                             validation_relationship_name='gamet_par_dens',
+                             merge_summary_table=merge_summary_table)
+    render_plots(plot_jobs, plot_workers=plot_workers, plot_cache_dir=plot_cache_dir)
 
 
 # Infectiousness to vectors
+@record_timing
 def generate_infectiousness_outputs(coord_csv, simulation_output_filepath, base_reference_filepath,
-                                      plot_output_filepath, benchmark_simulation_filepath=None):
+                                      plot_output_filepath, benchmark_simulation_filepath=None,
+                                      merge_summary_table=True, plot_workers=1, plot_cache_dir=None):
 
     """
     From simulation output and matched reference data, create plots and quantitative comparisons for all sites
@@ -283,6 +318,11 @@ def generate_infectiousness_outputs(coord_csv, simulation_output_filepath, base_
         plot_output_filepath (): The filepath to the directory where plots should be created
         benchmark_simulation_filepath (): The filepath where benchmark simulation output is located. If None, no
                                           comparisons are made against benchmark simulations
+        merge_summary_table (): Whether to add the summary comparisons to the summary table right away. If False, they
+                                are only saved to a shard (to be merged once all relationships are created)
+        plot_workers (): The number of processes used to render the plots (None for the number of processors)
+        plot_cache_dir (): Directory of the plot cache, from which unchanged plots are copied instead of rendered. If
+                           None, all plots are rendered
 
     Returns:
 
@@ -296,26 +336,29 @@ def generate_infectiousness_outputs(coord_csv, simulation_output_filepath, base_
     plot_output = plot_infectiousness_ref_sim_comparison(combined_df)
     plot_list = plot_output[0]
     all_sites = plot_output[1]
-    for ss in range(len(all_sites)):
-        plot_list[ss].save(filename=os.path.join(plot_output_filepath,
-                                                 'site_compare_infectiousness_' + all_sites[ss] + '.png'),
-                           width=7.5, height=6, units='in')
+    plot_jobs = [(plot_list[ss],
+                  os.path.join(plot_output_filepath, 'site_compare_infectiousness_' + all_sites[ss] + '.png'),
+                  dict(width=7.5, height=6, units='in')) for ss in range(len(all_sites))]
 
     # compare simulation and benchmark simulation results
     if 'benchmark' in combined_df.columns:
         compare_benchmarks_output = compare_benchmark(combined_df)
-        compare_benchmarks_output.save(filename=os.path.join(plot_output_filepath,
-                                                             'scatter_benchmark_infectiousness.png'),
-                                       height=4.5, width=8, units='in')
+        plot_jobs.append((compare_benchmarks_output,
+                          os.path.join(plot_output_filepath, 'scatter_benchmark_infectiousness.png'),
+                          dict(height=4.5, width=8, units='in')))
         # todo: add likelihood and other quantitative comparisons
         add_to_summary_table(combined_df=combined_df, plot_output_filepath=plot_output_filepath,
-                             validation_relationship_name='infectiousness')
+                             validation_relationship_name='infectiousness',
+                             merge_summary_table=merge_summary_table)
+    render_plots(plot_jobs, plot_workers=plot_workers, plot_cache_dir=plot_cache_dir)
 
 
 # Duration of infection
+@record_timing
 def generate_age_infection_duration_outputs(coord_csv, simulation_output_filepath, base_reference_filepath,
                                             plot_output_filepath, pos_thresh_dens=0.5, duration_bins=None,
-                                            benchmark_simulation_filepath=None):
+                                            benchmark_simulation_filepath=None, sites=None, plot_workers=1,
+                                            plot_cache_dir=None, resample=False, survey_workers=1):
     """
     From simulation output and matched reference data, create plots and quantitative comparisons for all sites
     associated with the duration-of-infection validation relationship.
@@ -331,6 +374,14 @@ def generate_age_infection_duration_outputs(coord_csv, simulation_output_filepat
                           (in days) individuals remain infected
         benchmark_simulation_filepath (): The filepath where benchmark simulation output is located. If None, no
                                           comparisons are made against benchmark simulations
+        sites (): The sites to create plots for (e.g., the sites whose inputs changed since the last run). If None,
+                  plots are created for all sites with simulation output
+        plot_workers (): The number of processes used to render the plots (None for the number of processors)
+        plot_cache_dir (): Directory of the plot cache, from which unchanged plots are copied instead of rendered. If
+                           None, all plots are rendered
+        resample (): If True, the simulation survey of each site is subsampled again from its patient report instead of
+                     being read from the sampling saved by an earlier run (e.g., because the patient report changed)
+        survey_workers (): The number of processes used to subsample the simulation seeds of each site
 
 
     Returns:
@@ -345,18 +396,17 @@ def generate_age_infection_duration_outputs(coord_csv, simulation_output_filepat
     available_sites = get_available_sites_for_relationship(coord_csv, simulation_output_filepath,
                                                            relationship_name='infection_duration',
                                                            relationship_sim_filename='patient_reports.csv')
+    if sites is not None:
+        available_sites = [site for site in available_sites if site in sites]
 
-    for ss in range(len(available_sites)):
-        cur_site = available_sites[ss]
-
-        filepath_ref = os.path.join(base_reference_filepath, coord_csv[coord_csv['site'] == cur_site][
-            'infection_duration_ref'].iloc[0])
-        ref_df = pd.read_csv(filepath_ref)
-        ref_df = ref_df[ref_df['site'].str.lower() == cur_site.lower()]
-        ref_df['date'] = pd.to_datetime(ref_df['date'])
+    coord_by_site = index_coordinator_by_site(coord_csv)
+    plot_jobs = []
+    for cur_site in available_sites:
+        ref_df = get_reference_site_df(base_reference_filepath, coord_by_site.at[cur_site, 'infection_duration_ref'],
+                                       relationship_name='infection_duration', site=cur_site)
 
         sim_dir = os.path.join(simulation_output_filepath, cur_site)
-        sim_data = get_sim_survey(sim_dir=sim_dir, ref_df=ref_df)
+        sim_data = get_sim_survey(sim_dir=sim_dir, ref_df=ref_df, resample=resample, jobs=survey_workers)
 
         # create and save comparison plots
         gg1 = plot_infection_duration_dist(ref_df=ref_df, sim_data=sim_data, pos_thresh_dens=pos_thresh_dens,
@@ -365,9 +415,12 @@ def generate_age_infection_duration_outputs(coord_csv, simulation_output_filepat
                                                   duration_bins=duration_bins)
         gg3 = create_barplot_frac_comparison(ref_df=ref_df, sim_data=sim_data, pos_thresh_dens=pos_thresh_dens)
 
-        gg1.save(filename=os.path.join(plot_output_filepath, 'site_compare_infect_duration_' + cur_site + '.png'),
-                 height=4, width=8, units='in')
-        gg2.save(filename=os.path.join(plot_output_filepath, 'site_compare_infect_duration_age_' + cur_site + '.png'),
-                 height=5, width=8, units='in')
-        gg3.save(filename=os.path.join(plot_output_filepath, 'site_compare_infect_duration_measures_' + cur_site +'.png'),
-                 height=4, width=8, units='in')
+        plot_jobs.append((gg1, os.path.join(plot_output_filepath, 'site_compare_infect_duration_' + cur_site + '.png'),
+                          dict(height=4, width=8, units='in')))
+        plot_jobs.append((gg2, os.path.join(plot_output_filepath,
+                                            'site_compare_infect_duration_age_' + cur_site + '.png'),
+                          dict(height=5, width=8, units='in')))
+        plot_jobs.append((gg3, os.path.join(plot_output_filepath,
+                                            'site_compare_infect_duration_measures_' + cur_site + '.png'),
+                          dict(height=4, width=8, units='in')))
+    render_plots(plot_jobs, plot_workers=plot_workers, plot_cache_dir=plot_cache_dir)
@@ -11,18 +11,138 @@
 
 import os
 import pandas as pd
-from scipy import stats
+from scipy import sparse, stats
+from scipy.special import gammaln, xlogy, xlog1py
 import warnings
 import numpy as np
 from plotnine import ggplot, aes, geom_point, xlab, ylab, coord_fixed, geom_abline, theme_classic, themes, \
     ggtitle, geom_smooth, element_text
 import collections
 
+from create_plots.helpers_timing import record_timing
+
 
 # region: loglikelihood functions for each validation relationship
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+# shared helpers
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+def get_sim_matrix(combined_df, sim_columns=None, sim_values=None):
+    """
+    Get the simulation output to score against the reference data as a (rows x N) array, where each of the N columns
+    corresponds to a different simulation (for example, different parameter sets of a calibration sweep)
+    Args:
+        combined_df (): A dataframe containing the reference data (and possibly the matched simulation output)
+        sim_columns (): The names of the columns of combined_df to use as the simulation output
+        sim_values (): Alternatively to sim_columns, a (rows x N) array or dataframe of simulation output aligned with
+            the rows of combined_df
+
+    Returns: The (rows x N) array of simulation output and the list of names of the N simulations (the column names,
+        or 0 to N-1 if sim_values is an array)
+
+    """
+    if (sim_columns is None) == (sim_values is None):
+        raise ValueError('Exactly one of sim_columns and sim_values must be specified.')
+    if sim_columns is not None:
+        sim_columns = list(sim_columns)
+        return combined_df[sim_columns].to_numpy(dtype=float), sim_columns
+    sim_names = list(sim_values.columns) if isinstance(sim_values, pd.DataFrame) else None
+    sim_values = np.asarray(sim_values, dtype=float)
+    if sim_values.ndim == 1:
+        sim_values = sim_values[:, np.newaxis]
+    if sim_values.shape[0] != len(combined_df):
+        raise ValueError(f'sim_values has {sim_values.shape[0]} rows but combined_df has {len(combined_df)} rows.')
+    return sim_values, sim_names or list(range(sim_values.shape[1]))
+
+
+def sum_by_group(values, group_codes, ngroups):
+    """
+    Sum the rows of a 1-D array or of a (rows x N) array within each group. NaN and -inf values propagate to the total
+    of their group.
+    Args:
+        values (): Array to sum
+        group_codes (): Integer array with the group of each row, with values between 0 and ngroups-1
+        ngroups (): Number of groups
+
+    Returns: Array with one row per group
+
+    """
+    nrows = len(group_codes)
+    indicator = sparse.csr_matrix((np.ones(nrows), (group_codes, np.arange(nrows))), shape=(ngroups, nrows))
+    return indicator @ values
+
+
+def get_loglikelihood_table(loglik_by_site, site_months, sim_names):
+    """
+    Format an array of log-likelihoods with one row per site-month and one column per simulation as a dataframe with
+    one row per simulation and one column per site-month
+    """
+    return pd.DataFrame(np.asarray(loglik_by_site).T, index=pd.Index(sim_names, name='sim_column'),
+                        columns=pd.Index(site_months, name='site_month'))
+
+
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
 # prevalence
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+def binomial_logpmf(k, n, p):
+    """
+    Element-wise binomial log-probability of observing k successes out of n trials with success probability p. This
+    gives the same values as scipy.stats.binom.logpmf (including -inf outside of the support and NaN for invalid n or
+    p), but in a single array operation without the per-call overhead of scipy's distribution objects. The terms that
+    only depend on k and n are evaluated at the shape of k and n, so a (rows x 1) k and n can be broadcast against a
+    (rows x N) p without recomputing them for each column.
+    Args:
+        k (): Array of numbers of successes
+        n (): Array of numbers of trials
+        p (): Array of success probabilities
+
+    Returns: An array of log-probabilities
+
+    """
+    k, n = np.broadcast_arrays(np.asarray(k, dtype=float), np.asarray(n, dtype=float))
+    p = np.asarray(p, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_binomial_coefficient = gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
+        logpmf = log_binomial_coefficient + xlogy(k, p) + xlog1py(n - k, -p)
+    in_support = (k >= 0) & (k <= n) & (k == np.floor(k))
+    logpmf = np.where(in_support, logpmf, -np.inf)
+    valid_parameters = (n >= 0) & (n == np.floor(n)) & (p >= 0) & (p <= 1)
+    return np.where(valid_parameters, logpmf, np.nan)
+
+
+@record_timing
+def get_prev_loglikelihood_table(combined_df, sim_columns=None, sim_values=None):
+    """
+    Calculate the approximate likelihood used by get_prev_loglikelihood for many simulations at once (for example, all
+    parameter sets of a sweep), with all simulations scored against the same reference data in one array operation.
+    Args:
+        combined_df (): A dataframe containing the reference data (and possibly the matched simulation output)
+        sim_columns (): The names of the columns of combined_df to use as the simulation output
+        sim_values (): Alternatively to sim_columns, a (rows x N) array or dataframe of simulation output aligned with
+            the rows of combined_df
+
+    Returns: A dataframe of loglikelihoods with one row per simulation and one column per site-month
+
+    """
+    sim_values, sim_names = get_sim_matrix(combined_df, sim_columns=sim_columns, sim_values=sim_values)
+    # only include reference sites where the sample sizes were reported
+    has_sample_size = combined_df['total_sampled'].notna().to_numpy()
+    combined_df = combined_df[has_sample_size]
+    sim_values = sim_values[has_sample_size]
+    site_codes, sites = pd.factorize(combined_df['site_month'], use_na_sentinel=False)
+
+    # likelihood approximated for each age group as probability of obtaining observed num_pos from total_sampled if
+    # simulation is true prevalence (each row corresponds to a different age group)
+    loglik_by_row = binomial_logpmf(k=combined_df['num_pos'].to_numpy()[:, np.newaxis],
+                                    n=combined_df['total_sampled'].to_numpy()[:, np.newaxis],
+                                    p=sim_values)
+    # get product of probabilities for each age group (sum of log-likelihoods). If any age groups don't match, entire
+    # site is NaN.
+    loglik_by_site = sum_by_group(loglik_by_row, site_codes, len(sites))
+
+    return get_loglikelihood_table(loglik_by_site, site_months=sites, sim_names=sim_names)
+
+
+@record_timing
 def get_prev_loglikelihood(combined_df, sim_column='simulation'):
     """
     Calculate an approximate likelihood for the simulation parameters for each site. This is estimated as the product,
@@ -34,33 +154,8 @@ def get_prev_loglikelihood(combined_df, sim_column='simulation'):
     Returns: A dataframe of loglikelihoods where each row corresponds to a site-month
 
     """
-
-    combined_df['prob_pos_sim'] = combined_df[sim_column]
-    # only include reference sites where the sample sizes were reported
-    combined_df = combined_df.dropna(subset=['total_sampled'])
-    sites = combined_df['site_month'].unique()
-
-    # likelihood approximated for each age group as probability of obtaining observed num_pos from total_sampled if simulation is true prevalence
-    loglik_by_site = [None] * len(sites)
-    for ss in range(len(sites)):
-        cur_df = combined_df[combined_df['site_month'] == sites[ss]]
-        # get product of probabilities for each age group. If any age groups don't match, entire site is Nan.
-        # todo: need code review for this if condition
-        # if (!any( is.na(cur_df$prob_pos_sim))){
-        if not cur_df['prob_pos_sim'].isna().values.any():
-            loglik_total=0
-            for rr in range(len(cur_df)): # iterate through age groups (each row corresponds to a different age group)
-                # todo: need code review for this math
-                # https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.binom.html
-                # loglik_total = loglik_total + math.log(dbinom(x=cur_df$num_pos[rr], size = cur_df$total_sampled[rr],
-                #                                           prob = cur_df$prob_pos_sim[rr]))
-                loglik_total = loglik_total + stats.binom.logpmf(k=cur_df['num_pos'].iloc[rr],
-                                                                 n=cur_df['total_sampled'].iloc[rr],
-                                                                 p=cur_df['prob_pos_sim'].iloc[rr])
-
-            loglik_by_site[ss] = loglik_total
-
-    loglik_df = pd.DataFrame({'site_month': sites, 'loglikelihood': loglik_by_site})
+    loglik = get_prev_loglikelihood_table(combined_df, sim_columns=[sim_column]).iloc[0]
+    loglik_df = pd.DataFrame({'site_month': loglik.index.to_numpy(), 'loglikelihood': loglik.to_numpy()})
 
     return loglik_df
 
@@ -68,78 +163,110 @@ def get_prev_loglikelihood(combined_df, sim_column='simulation'):
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
 # parasite density
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
-def get_dens_loglikelihood(combined_df, sim_column='simulation'):
+def grouped_multinomial_logpmf(counts, probs, group_codes, ngroups):
     """
-    Calculate an approximate likelihood for the simulation parameters for each site. This is estimated as the product,
-    across age groups, of the probability of observing the reference values if the simulation means represented the
-    true population mean
+    Multinomial log-probabilities of many groups of observed counts at once, computed in log space throughout (the
+    equivalent of summing stats.multinomial.logpmf for each group, or log(dmultinom()) in R, without underflowing for
+    unlikely count distributions). Each row holds the count and probability of one category, and group_codes gives the
+    group (multinomial draw) each row belongs to. probs may also be a (rows x N) array to evaluate N sets of
+    probabilities against the same counts; rows with a NaN probability are left out of their group for that column.
     Args:
-        combined_df (): A dataframe containing both the reference and matched simulation output
-        sim_column (): The name of the column of combined_df to use as the simulation output
+        counts (): Array with the observed count of each row
+        probs (): Array with the probability of each row, or (rows x N) array of probabilities
+        group_codes (): Integer array with the group of each row, with values between 0 and ngroups-1
+        ngroups (): Number of groups
 
-    Returns: A dataframe of loglikelihoods where each row corresponds to a site-month
+    Returns: Array with the total count and array with the log-probability of each group (with one column for each
+        column of probs)
+
+    """
+    probs = np.asarray(probs, dtype=float)
+    counts = np.asarray(counts, dtype=float).reshape((-1,) + (1,) * (probs.ndim - 1))
+    included = ~np.isnan(probs)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        row_terms = np.where(included, xlogy(counts, probs) - gammaln(counts + 1), 0)
+    group_totals = sum_by_group(np.where(included, counts, 0), group_codes, ngroups)
+    group_logpmf = gammaln(group_totals + 1) + sum_by_group(row_terms, group_codes, ngroups)
+    return group_totals, group_logpmf
+
+
+@record_timing
+def get_dens_loglikelihood_table(combined_df, sim_columns=None, sim_values=None):
+    """
+    Calculate the approximate likelihood used by get_dens_loglikelihood for many simulations at once (for example, all
+    parameter sets of a sweep), with all simulations scored against the same reference data in one array operation.
+    Args:
+        combined_df (): A dataframe containing the reference data (and possibly the matched simulation output)
+        sim_columns (): The names of the columns of combined_df to use as the simulation output
+        sim_values (): Alternatively to sim_columns, a (rows x N) array or dataframe of simulation output aligned with
+            the rows of combined_df
+
+    Returns: A dataframe of loglikelihoods with one row per simulation and one column per site-month. Site-months
+        without any simulation output are NaN.
 
     """
+    sim_values, sim_names = get_sim_matrix(combined_df, sim_columns=sim_columns, sim_values=sim_values)
 
     # remove rows where there is no reference data (sometimes there are different density bins in different sites, so
     # rows with NA are created for the 'missing' bins - but check that there aren't values in the simulation either)
-    # todo: need code review
-    ref_rows_na = combined_df['ref_bin_count'].isna()
+    ref_rows_na = combined_df['ref_bin_count'].isna().to_numpy()
     if any(ref_rows_na):
-        sim_rows_0 = sum(combined_df[sim_column] < 0.0001)
-        if ref_rows_na.equals(sum(sim_rows_0)):
-            combined_df = combined_df[~ref_rows_na]
-        else:
+        remove_ref_rows_na = np.all(np.nan_to_num(sim_values[ref_rows_na]) < 0.0001, axis=0)
+        if not all(remove_ref_rows_na):
             warnings.warn("There may be a mismatch in the age bins from the reference data and simulation data for at "
                           "least one site. No rows were removed.")
-
-    # remove rows without simulation output
-    combined_df = combined_df[~combined_df[sim_column].isna()]
+        # rows without simulation output are left out of the likelihood
+        sim_values = np.where(ref_rows_na[:, np.newaxis] & remove_ref_rows_na, np.nan, sim_values)
 
     # assuming reference data comes from a multinomial draw: likelihood of getting the observed distribution of
-    # parasite densities assuming the simulations show the true population-level frequencies
-    # iterate through groups of month-age-site
-    loglik_df = pd.DataFrame(columns =['site_month', 'loglikelihood'])
-    site_months = combined_df['site_month'].unique()
-    for ss in site_months:
-        loglikelihood = 0
-        cur_agebins = combined_df[combined_df['site_month'] == ss]['agebin'].unique()
-        for aa in cur_agebins:
-            cur_df = combined_df[(combined_df['site_month'] == ss) & (combined_df['agebin'] == aa)]
-            # check that the sum of counts matches the sum column
-            if sum(cur_df['ref_bin_count']) == cur_df['ref_total'].iloc[0] and len(cur_df['ref_total'].unique()) == 1:
-                # todo: need code review for this math
-                # https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.multinomial.html
-                # in Python:
-                # stats.multinomial.logpmf([3, 4], n=7, p=[.3, .7])
-                # Out[29]: array(-1.48327013)
-                # in R:
-                # log(dmultinom(c(3, 4), prob=c(0.3, 0.7)))
-                # [1] - 1.48327
-                # loglikelihood = loglikelihood + log(dmultinom(x=cur_df$ref_bin_count, prob=cur_df[[sim_column]]))
-                import numpy as np
-                from scipy.special import xlogy, gammaln
-                import math
-
-                x = np.array(list(cur_df['ref_bin_count']))
-                n = sum(cur_df['ref_bin_count'])
-                p = np.array(list(cur_df[sim_column]))
-
-                # stats.multinomial.logpmf(x=x, n=n, p =p)
-                # state.multinomial sometimes return nan value, replace it with the following line
-                try:
-                    result = math.log(np.exp(gammaln(n + 1) + np.sum(xlogy(x, p) - gammaln(x + 1), axis=-1)))
-                    loglikelihood += result
-                except Exception as ex:
-                    print(x, n, p)
-                    print(ex)
-                    loglikelihood = -np.inf
-            else:
-                warnings.warn(f'Either the sum of individuals across bins in the reference dataset does not match the '
-                              f'reported total number of individuals included or different density bins are used in '
-                              f'the reference and simulation. This site-age is being skipped: {ss} - {aa}')
-
-        loglik_df = pd.concat([loglik_df, pd.DataFrame({'site_month': [ss], 'loglikelihood': [loglikelihood]})])
+    # parasite densities assuming the simulations show the true population-level frequencies. Each month-age-site
+    # group is one draw, and all groups are evaluated together.
+    site_codes, site_months = pd.factorize(combined_df['site_month'])
+    group_codes = combined_df.groupby(['site_month', 'agebin'], sort=False, dropna=False).ngroup().to_numpy()
+    ngroups = group_codes.max() + 1 if len(group_codes) > 0 else 0
+    group_totals, group_loglik = grouped_multinomial_logpmf(counts=combined_df['ref_bin_count'].to_numpy(),
+                                                            probs=sim_values, group_codes=group_codes,
+                                                            ngroups=ngroups)
+    group_has_sim = sum_by_group((~np.isnan(sim_values)).astype(float), group_codes, ngroups) > 0
+
+    # check that the sum of counts matches the sum column (which should have a single value in each group)
+    group_first_row = np.unique(group_codes, return_index=True)[1]
+    ref_total = combined_df['ref_total'].to_numpy()[group_first_row]
+    ref_total_unique = combined_df.groupby(group_codes)['ref_total'].nunique(dropna=False).to_numpy() == 1
+    group_valid = (group_totals == ref_total[:, np.newaxis]) & ref_total_unique[:, np.newaxis]
+    for gg in np.flatnonzero(np.any(group_has_sim & ~group_valid, axis=1)):
+        warnings.warn(f'Either the sum of individuals across bins in the reference dataset does not match the '
+                      f'reported total number of individuals included or different density bins are used in '
+                      f'the reference and simulation. This site-age is being skipped: '
+                      f'{site_months[site_codes[group_first_row[gg]]]} - '
+                      f'{combined_df["agebin"].iloc[group_first_row[gg]]}')
+
+    # get product of probabilities across age groups (sum of log-likelihoods) for each site-month
+    group_site_codes = site_codes[group_first_row]
+    loglik_by_site = sum_by_group(np.where(group_valid & group_has_sim, group_loglik, 0), group_site_codes,
+                                  len(site_months))
+    site_has_sim = sum_by_group(group_has_sim.astype(float), group_site_codes, len(site_months)) > 0
+    loglik_by_site = np.where(site_has_sim, loglik_by_site, np.nan)
+
+    return get_loglikelihood_table(loglik_by_site, site_months=site_months, sim_names=sim_names)
+
+
+@record_timing
+def get_dens_loglikelihood(combined_df, sim_column='simulation'):
+    """
+    Calculate an approximate likelihood for the simulation parameters for each site. This is estimated as the product,
+    across age groups, of the probability of observing the reference values if the simulation means represented the
+    true population mean
+    Args:
+        combined_df (): A dataframe containing both the reference and matched simulation output
+        sim_column (): The name of the column of combined_df to use as the simulation output
+
+    Returns: A dataframe of loglikelihoods where each row corresponds to a site-month
+
+    """
+    # site-months without simulation output are not included
+    loglik = get_dens_loglikelihood_table(combined_df, sim_columns=[sim_column]).iloc[0].dropna()
+    loglik_df = pd.DataFrame({'site_month': loglik.index.to_numpy(), 'loglikelihood': loglik.to_numpy()})
 
     return loglik_df
 # endregion
@@ -204,6 +331,7 @@ def calc_mean_rel_slope_diff(combined_df):
     return mean_slope_diff_df
 
 
+@record_timing
 def corr_ref_sim_points(combined_df):
     """
     Calculate the correlation between reference and matched simulation data points.
@@ -248,6 +376,7 @@ def corr_ref_sim_points(combined_df):
     return gg, lm_summary
 
 
+@record_timing
 def corr_ref_deriv_sim_points(combined_df):
     """
     Calculate the correlation between reference and matched simulation slopes (derivatives) when moving from the
@@ -318,8 +447,66 @@ def corr_ref_deriv_sim_points(combined_df):
 
 
 # region summarize new simulation success against benchmark simulation
+summary_table_filename = 'summary_table_sim_benchmark.csv'
+summary_table_shard_dirname = 'summary_table_shards'
+# order of the rows added to a new summary table (relationships that are not listed are added after these)
+summary_table_row_order = ['age_incidence', 'age_prevalence', 'asexual_par_dens', 'gamet_par_dens', 'infectiousness']
+
+
+def merge_summary_table_shards(plot_output_filepath):
+    """
+    Combine the summary rows written by each validation relationship (one shard file per relationship) into the summary
+    table. Rows of relationships already in the table are replaced in place and rows of new relationships are added
+    following summary_table_row_order. The merged shard files are removed (other files in the shard folder, such as
+    shards being written by other processes, are kept).
+    Args:
+        plot_output_filepath (): The filepath to the directory where plots and the summary table are created
+
+    Returns: The summary table dataframe (None if there is no summary table and no shards)
+
+    """
+    shard_dir = os.path.join(plot_output_filepath, summary_table_shard_dirname)
+    shard_filenames = sorted(filename for filename in os.listdir(shard_dir)
+                             if filename.endswith('.csv')) if os.path.isdir(shard_dir) else []
+    # modification time of each shard when it was read, so a shard rewritten since is not removed
+    shard_mtimes = {filename: os.stat(os.path.join(shard_dir, filename)).st_mtime_ns for filename in shard_filenames}
+    shards = {os.path.splitext(filename)[0]: pd.read_csv(os.path.join(shard_dir, filename))
+              for filename in shard_filenames}
+    summary_filepath = os.path.join(plot_output_filepath, summary_table_filename)
+    if os.path.exists(summary_filepath):
+        summary_df = pd.read_csv(summary_filepath)
+    elif shards:
+        summary_df = None
+    else:
+        return None
+
+    new_relationships = sorted(shards.keys(), key=lambda name: (summary_table_row_order.index(name)
+                                                                 if name in summary_table_row_order
+                                                                 else len(summary_table_row_order), name))
+    for validation_relationship_name in new_relationships:
+        shard_df = shards[validation_relationship_name]
+        if summary_df is None:
+            summary_df = shard_df
+        elif validation_relationship_name in summary_df['validation_relationship'].values and len(shard_df) > 0:
+            # replace the row of a relationship that was regenerated (e.g., in an incremental run)
+            summary_df.loc[summary_df['validation_relationship'] == validation_relationship_name,
+                           shard_df.columns] = shard_df.iloc[0].values
+        elif validation_relationship_name not in summary_df['validation_relationship'].values:
+            summary_df = pd.concat([summary_df, shard_df])
+
+    summary_df.to_csv(summary_filepath + '.tmp', header=True, index=False)
+    os.replace(summary_filepath + '.tmp', summary_filepath)
+    for filename in shard_filenames:
+        shard_filepath = os.path.join(shard_dir, filename)
+        if os.stat(shard_filepath).st_mtime_ns == shard_mtimes[filename]:
+            os.remove(shard_filepath)
+    if os.path.isdir(shard_dir) and len(os.listdir(shard_dir)) == 0:
+        os.rmdir(shard_dir)
+    return summary_df
+
+
 def add_to_summary_table(combined_df, plot_output_filepath, validation_relationship_name,
-                         rel_change_threshold=0.1):
+                         rel_change_threshold=0.1, merge_summary_table=True):
 
     mean_diff_df_new = calc_mean_rel_diff(combined_df, sim_colname='simulation')
     mean_diff_df_bench = calc_mean_rel_diff(combined_df, sim_colname='benchmark')
@@ -348,17 +535,13 @@ def add_to_summary_table(combined_df, plot_output_filepath, validation_relations
                                'num_sites_similar': len(mean_diff_df[(mean_diff_df['Site'] != 'all_sites') & (mean_diff_df['change_type'] == 'similar')]),
                                'num_sites_worse': len(mean_diff_df[(mean_diff_df['Site'] != 'all_sites') & (mean_diff_df['change_type'] == 'worse')])})
 
-    # write to csv, adding as new row if csv already exists but relationship doesn't
-    summary_filepath = os.path.join(plot_output_filepath, 'summary_table_sim_benchmark.csv')
-    if os.path.exists(summary_filepath):
-        # add rows to existing csv
-        existing_summaries = pd.read_csv(summary_filepath)
-        if validation_relationship_name in existing_summaries['validation_relationship']:
-            existing_summaries[existing_summaries['validation_relationship'] == validation_relationship_name] = \
-                summary_df.iloc[0]
-            summary_df = existing_summaries
-        else:
-            summary_df = pd.concat([existing_summaries, summary_df])
-
-    summary_df.to_csv(summary_filepath, header=True, index=False)
+    # write to a shard for this relationship, so that relationships created in parallel do not write to the same
+    #    file, then add it to the summary table (as a new row if the relationship isn't in the csv already)
+    shard_dir = os.path.join(plot_output_filepath, summary_table_shard_dirname)
+    os.makedirs(shard_dir, exist_ok=True)
+    shard_filepath = os.path.join(shard_dir, validation_relationship_name + '.csv')
+    summary_df.to_csv(shard_filepath + '.tmp', header=True, index=False)
+    os.replace(shard_filepath + '.tmp', shard_filepath)
+    if merge_summary_table:
+        merge_summary_table_shards(plot_output_filepath)
 # endregion
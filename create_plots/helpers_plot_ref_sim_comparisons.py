@@ -10,7 +10,8 @@ import numpy as np
 import pandas as pd
 from scipy.stats import beta
 from pandas.api.types import CategoricalDtype
-from datetime import datetime
+
+from create_plots.helpers_timing import record_timing
 
 
 # todo: not sure how to define color with rbg numbers. using the builtin colors for now
@@ -34,6 +35,7 @@ fill_manual = {"reference": 'red',
 
 
 # compare new and benchmark simulation values
+@record_timing
 def compare_benchmark(combined_df):
     """
     Create scatter plots with new versus benchmark simulation output
@@ -62,6 +64,7 @@ def compare_benchmark(combined_df):
     return gg
 
 
+@record_timing
 def plot_ref_sim_comparison(combined_df, data_column_name):
     """
     Create a panel of line plots (one for each site-month) showing the data-by-age relationship seen in the
@@ -125,6 +128,7 @@ def plot_ref_sim_comparison(combined_df, data_column_name):
 
 
 # plot age-incidence comparisons with reference
+@record_timing
 def plot_inc_ref_sim_comparison(combined_df):
     """
         Create a panel of line plots (one for each site-month) showing the incidence-by-age relationship seen in the
@@ -139,6 +143,7 @@ def plot_inc_ref_sim_comparison(combined_df):
 
 
 # plot age-prevalence comparisons with reference
+@record_timing
 def plot_prev_ref_sim_comparison(combined_df):
     """
     Create a panel of line plots (one for each site-month) showing the prevalence-by-age relationship seen in the
@@ -153,6 +158,7 @@ def plot_prev_ref_sim_comparison(combined_df):
 
 
 # plot parasite density comparisons with reference
+@record_timing
 def plot_par_dens_ref_sim_comparison(combined_df):
     """
     Create a plots (one for each site-month) showing the parasite density-by-age relationship seen in the reference
@@ -262,6 +268,7 @@ def plot_par_dens_ref_sim_comparison(combined_df):
 
 
 #create infectiousness plots
+@record_timing
 def plot_infectiousness_ref_sim_comparison(combined_df):
     """
     Create a plots (one for each site-month) showing the infectiousness-to-vectors by age and parasite density
@@ -326,50 +333,68 @@ def plot_infectiousness_ref_sim_comparison(combined_df):
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
 # helper functions for pre-plotting data processing
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
-def get_frac_state_swaps(data, pos_thresh_dens):
+def sort_samples_by_individual(data, pos_thresh_dens):
+    """
+    Sort test results by (seed, individual, date) and find where each individual's series of tests starts and ends.
+    Seeds and individuals are kept in order of first appearance.
+    Args:
+        data (): A dataframe of test results for all individuals and survey days
+        pos_thresh_dens (): A number giving the minimum true asexual parasite density a simulated individual must have
+                            to be considered positive
+
+    Returns: A dictionary of arrays (all in sorted order): the row order, seed, date, and positivity of each sample,
+             and whether each sample is the first or last sample of its individual
+
+    """
+    seeds = data['seed'].to_numpy() if 'seed' in data.columns else np.zeros(len(data), dtype=int)
+    dates = pd.to_datetime(data['date']).to_numpy()
+    seed_codes = pd.factorize(seeds)[0]
+    sid_codes = pd.factorize(data['SID'])[0]
+    order = np.lexsort((dates, sid_codes, seed_codes))
+    group_codes = seed_codes[order].astype(np.int64) * (sid_codes.max(initial=0) + 1) + sid_codes[order]
+    return {'order': order,
+            'seed': seeds[order],
+            'date': dates[order],
+            'pos': (data['DENSITY'] > pos_thresh_dens).to_numpy()[order],
+            'first_sample': np.diff(group_codes, prepend=-1) != 0,
+            'last_sample': np.diff(group_codes, append=-1) != 0}
+
+
+def get_frac_state_swaps(data, pos_thresh_dens, by_seed=False):
     """
     Calculate probability of going from negative to positive or from positive to negative between sample dates (among
     surveyed individuals)
     Args:
         data (): A dataframe of test results for all individuals and survey days
         pos_thresh_dens ():
+        by_seed (): If True, return the fractions separately for each simulation seed
 
     Returns: A vector where the first element is the fraction of the time a positive test was followed by a negative
-    result and the second element is the fraction of time a negative test was followed by a positive test
+    result and the second element is the fraction of time a negative test was followed by a positive test. If by_seed,
+    a dataframe with one row per seed and these two fractions as the columns frac_pos_turn_neg_next_time and
+    frac_neg_turn_pos_next_time.
 
     """
-    # brute force approach iterating through people and dates
-    indIDs = data['SID'].unique()
-    sum_denom_pos = 0
-    sum_turn_neg = 0
-    sum_denom_neg = 0
-    sum_turn_pos = 0
-
-    for ii in range(len(indIDs)):
-        data_cur = data[data['SID'] == indIDs[ii]]
-        data_cur = data_cur.sort_values(by=['date'])
-        # todo: need code review
-        # get tests results as a series of bool values
-        ind_pos = data_cur['DENSITY'] > pos_thresh_dens
-        pos_count = sum(ind_pos)
-        neg_count = len(ind_pos) - pos_count
-
-        # denominators for each (number of each type that had an observation after then (i.e., they could have been observed to change))
-        last_obs_pos = (data_cur['DENSITY'].iloc[len(data_cur) - 1] > pos_thresh_dens)
-        sum_denom_pos = sum_denom_pos + pos_count - 1 if last_obs_pos else sum_denom_pos + pos_count
-        sum_denom_neg = sum_denom_neg + neg_count if last_obs_pos else sum_denom_neg + neg_count -1
-
-        # find how many tests change from neg to pos or pos to neg across timesteps
-        for i in range(len(ind_pos) - 1):
-            if ind_pos.iloc[i] and not ind_pos.iloc[i + 1]: # change from positive to negative
-                sum_turn_neg += 1
-            elif not ind_pos.iloc[i] and ind_pos.iloc[i + 1]: # change from negative to positive
-                sum_turn_pos += 1
-
-    frac_pos_turn_neg_next_time = sum_turn_neg / sum_denom_pos
-    frac_neg_turn_pos_next_time = sum_turn_pos / sum_denom_neg
-
-    return [frac_pos_turn_neg_next_time, frac_neg_turn_pos_next_time]
+    samples = sort_samples_by_individual(data, pos_thresh_dens)
+    ind_pos = samples['pos']
+    # only tests that had an observation after them could have been observed to change
+    has_next = ~samples['last_sample']
+    next_pos = np.append(ind_pos[1:], False)
+    counts = pd.DataFrame({'seed': samples['seed'],
+                           'denom_pos': ind_pos & has_next,
+                           'turn_neg': ind_pos & has_next & ~next_pos,  # change from positive to negative
+                           'denom_neg': ~ind_pos & has_next,
+                           'turn_pos': ~ind_pos & has_next & next_pos})  # change from negative to positive
+    if not by_seed:
+        totals = counts[['denom_pos', 'turn_neg', 'denom_neg', 'turn_pos']].sum()
+        frac_pos_turn_neg_next_time = totals['turn_neg'] / totals['denom_pos']
+        frac_neg_turn_pos_next_time = totals['turn_pos'] / totals['denom_neg']
+        return [frac_pos_turn_neg_next_time, frac_neg_turn_pos_next_time]
+
+    totals = counts.groupby('seed', sort=False).sum()
+    return pd.DataFrame({'seed': totals.index,
+                         'frac_pos_turn_neg_next_time': (totals['turn_neg'] / totals['denom_pos']).to_numpy(),
+                         'frac_neg_turn_pos_next_time': (totals['turn_pos'] / totals['denom_neg']).to_numpy()})
 
 
 def get_time_pos(data, pos_thresh_dens):
@@ -384,86 +409,32 @@ def get_time_pos(data, pos_thresh_dens):
     Returns: A dataframe where each row corresponds to a stretch of time when an individual has uninterrupted positive tests
 
     """
-    # brute force approach iterating through people and dates
-    indIDs = data['SID'].unique()
-    days_positive = list()  # number of days between the first and last sample date in a run of positive samples
-    sample_censored = list()  # Boolean indicating whether the positivity duration might have been longer unobserved
-    sample_ages = list()
-    sample_seeds = list()
-
-    if not ('seed' in data.columns):
-        data['seed'] = 0
-    for ss in data['seed'].unique():
-        data_ss = data[data['seed'] == ss]
-        for ii in range(len(indIDs)):
-            data_cur = data_ss[data_ss['SID'] == indIDs[ii]]
-            data_cur = data_cur.sort_values(by='date')
-            cur_age = data_cur['age'].mean()
-            # which samples had positive tests
-            pos_bool = data_cur['DENSITY'] > pos_thresh_dens # todo, unresolved reference, maybe add it as an argument
-
-            # todo: need code review
-            def rle(series):
-                """
-                implement the rle(Run Length Encoding) function in Python for pandas series
-                Args:
-                    series (): A Pandas series
-
-                Returns: a dictionary contains 2 keys lengths and values:
-                        Value of key lengths is an integer list containing the length of each run.
-                        Value of key values is a list of the same length as lengths with the corresponding values.
-
-                """
-                i = 0
-                res_dict = {'lengths': [], 'values': []}
-                while i <= len(series) - 1:
-                    count = 1
-                    value = series.iloc[i]
-                    j = i
-                    while j < len(series) - 1:
-                        if series.iloc[j] == series.iloc[j + 1]:
-                            count = count + 1
-                            j = j + 1
-                        else:
-                            break
-                    res_dict['lengths'].append(count)
-                    res_dict['values'].append(value)
-                    i = j + 1
-                return res_dict
-
-            # get the length of spans of positive and of negative tests in a row
-            num_in_a_row = rle(pos_bool)
-            start_index_num_in_a_row = [0] + list(np.cumsum(num_in_a_row['lengths']))[:-1]
-
-            # for each span of positives, determine the length before turning negative as well as whether it was censored or not
-            # if it includes the first or last sample, it's censored (it's at least that many days but may have been longer)
-            # todo: figure out what the next line is for
-            # num_in_a_row['lengths'][num_in_a_row['values']
-
-            # iterate through periods of positivity
-            pos_index = np.where(np.array(num_in_a_row['values']))[0]
-            for tt in pos_index:
-                # indicate whether this period of positivity was censored
-                # todo: need code review: the 4 lists are empty lists, should use append() instead of assigning by index
-                sample_censored.append(tt == 0 or tt == len(num_in_a_row['lengths']))
-                sample_ages.append(cur_age)
-                sample_seeds.append(ss)
-
-                # get the first and last positive sample day observed for this period of positivity
-                first_index = start_index_num_in_a_row[tt]
-                last_index = first_index + num_in_a_row['lengths'][tt] - 1  # todo: why -1
-                first_positive_sample_day = data_cur['date'].iloc[first_index]
-                last_positive_sample_day = data_cur['date'].iloc[last_index]
-                if isinstance(last_positive_sample_day, str):
-                    last_positive_sample_day = datetime.strptime(last_positive_sample_day, '%Y-%m-%d')
-                if isinstance(first_positive_sample_day, str):
-                    first_positive_sample_day = datetime.strptime(first_positive_sample_day, '%Y-%m-%d')
-                days_positive.append((last_positive_sample_day - first_positive_sample_day).days)
-
-    return pd.DataFrame({'days_positive': days_positive,
-                         'censored': sample_censored,
-                         'age': sample_ages,
-                         'seed': sample_seeds})
+    # sort once by (seed, individual, date) and find which samples had positive tests
+    samples = sort_samples_by_individual(data, pos_thresh_dens)
+    pos_bool = samples['pos']
+    dates = samples['date']
+    group_start = samples['first_sample']
+
+    # boundaries of each run of positive or negative tests within an individual's samples
+    run_start = group_start | (np.diff(pos_bool.astype(np.int8), prepend=-1) != 0)
+    run_end = samples['last_sample'] | (np.diff(pos_bool.astype(np.int8), append=-1) != 0)
+    first_index = np.flatnonzero(run_start)
+    last_index = np.flatnonzero(run_end)
+
+    # mean age of each individual, assigned to each of their runs
+    group_index = np.cumsum(group_start) - 1
+    group_ages = pd.Series(data['age'].to_numpy()[samples['order']]).groupby(group_index).mean().to_numpy()
+
+    # for each span of positives, determine the length before turning negative (number of days between the first and
+    # last sample date in the run) as well as whether it was censored or not: if it includes the first or last sample,
+    # it's censored (it's at least that many days but may have been longer)
+    pos_runs = pos_bool[first_index]
+    first_index = first_index[pos_runs]
+    last_index = last_index[pos_runs]
+    return pd.DataFrame({'days_positive': (dates[last_index] - dates[first_index]) // np.timedelta64(1, 'D'),
+                         'censored': group_start[first_index] | samples['last_sample'][last_index],
+                         'age': group_ages[group_index[first_index]],
+                         'seed': samples['seed'][first_index]})
 
 
 def bin_durations_all_seeds(days_positive, duration_bins):
@@ -600,10 +571,12 @@ def get_duration_bins(ind_data, duration_bins, pos_thresh_dens, facet_censored=T
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
 # plotting functions
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+@record_timing
 def create_barplot_frac_comparison(ref_df, sim_data, pos_thresh_dens):
     """
     Create a gg barplot comparing the reference dataset and matching subsampled simulations for fraction of samples
-    positive and fractions of samples switching from neg--> pos or pos--> neg
+    positive and fractions of samples switching from neg--> pos or pos--> neg. Simulation bars show the mean across
+    simulation seeds, with error bars spanning the range of seed values.
     Args:
         ref_df (): A dataframe with the reference values.
         sim_data (): A dataframe with the subsampled simulation values (may include results from multiple seeds)
@@ -615,33 +588,40 @@ def create_barplot_frac_comparison(ref_df, sim_data, pos_thresh_dens):
     """
 
     frac_swap_ref = get_frac_state_swaps(data=ref_df, pos_thresh_dens=pos_thresh_dens)
-    frac_swap_sim = get_frac_state_swaps(data=sim_data, pos_thresh_dens=pos_thresh_dens)
+    # fractions for each simulation seed, summarized by their mean and range across seeds
+    frac_swap_sim = get_frac_state_swaps(data=sim_data, pos_thresh_dens=pos_thresh_dens, by_seed=True)
 
     ref_df['pos'] = ref_df['DENSITY'] > pos_thresh_dens
     frac_samples_pos_ref = sum(ref_df['pos']) / sum((ref_df['DENSITY'] > -1))
 
     sim_data['pos'] = sim_data['DENSITY'] > pos_thresh_dens
-    frac_samples_pos_sim = sum(sim_data['pos']) / sum(sim_data['DENSITY'] > -1)
+    sim_seeds = sim_data['seed'] if 'seed' in sim_data.columns else pd.Series(0, index=sim_data.index)
+    frac_samples_pos_sim = (sim_data['pos'].groupby(sim_seeds, sort=False).sum()
+                            / (sim_data['DENSITY'] > -1).groupby(sim_seeds, sort=False).sum())
 
+    sim_measures = [frac_swap_sim['frac_neg_turn_pos_next_time'],
+                    frac_swap_sim['frac_pos_turn_neg_next_time'],
+                    frac_samples_pos_sim]
     df = pd.DataFrame({'source': ['reference'] * 3 + ['simulation'] * 3,
                        'measure': ['negative to positive next time',
                                    'positive to negative next time',
                                    'total samples positive'] * 2,
                        'value': [frac_swap_ref[1],
                                  frac_swap_ref[0],
-                                 frac_samples_pos_ref,
-                                 frac_swap_sim[1],
-                                 frac_swap_sim[0],
-                                 frac_samples_pos_sim]})
+                                 frac_samples_pos_ref] + [x.mean() for x in sim_measures],
+                       'quant_low': [np.nan] * 3 + [x.min() for x in sim_measures],
+                       'quant_high': [np.nan] * 3 + [x.max() for x in sim_measures]})
 
     gg = (ggplot(df, aes(x='measure', y='value', fill='source', color='source'))
           + geom_bar(stat="identity", position="dodge", alpha=.3)
+          + geom_errorbar(aes(ymin='quant_low', ymax='quant_high'), width=.2, position=position_dodge(.9))
           + scale_color_manual(values=color_manual_2)
           + labs(title='general dataset properties', y='fraction of samples', x=''))
 
     return gg
 
 
+@record_timing
 def plot_infection_duration_dist(ref_df, sim_data, pos_thresh_dens, duration_bins=None):
     """
     Create a panel of gg barplots comparing the distributions of infection lengths in simulation versus reference datasets
@@ -694,6 +674,7 @@ def plot_infection_duration_dist(ref_df, sim_data, pos_thresh_dens, duration_bin
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
 # create plots comparing the distributions of infection lengths, faceted by age group
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+@record_timing
 def plot_infection_duration_dist_by_age(ref_df, sim_data, pos_thresh_dens, age_bin_lower=None,
                                         duration_bins=None):
     """
@@ -0,0 +1,245 @@
+# helpers_plot_rendering.py
+#
+# This script renders and saves plotnine figures. The generate_*_outputs functions create the ggplot specification of
+#    each figure (which is fast) and add it to a list of plot jobs; the jobs are then rendered together, either one after
+#    another or in a pool of processes using the non-interactive Agg backend. The time spent rendering each figure is
+#    returned so that slow figures can be identified.
+#    ggplots with manual scales cannot be pickled, so the rendering processes are forked and inherit the plot jobs.
+#
+# Rendered figures can also be kept in a plot cache, keyed by a hash of the figure's data, plot specification and
+#    size (and of the plotting code). A figure whose key is already in the cache is copied from the cache instead of
+#    being rendered again. The cache is bounded in size, removing the least recently used figures first.
+
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import plotnine
+
+from create_plots.helpers_timing import add_timing_record
+
+# increment when the rendering of cached plots changes so that existing cache files are not reused
+plot_cache_version = 1
+plot_cache_dirname = '.plot_cache'
+plot_cache_max_bytes = 500 * 2 ** 20
+# the plots are created by functions in these scripts, so changes to them invalidate the cached plots
+plot_code_filepaths = [os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+                       for filename in ['helpers_plot_ref_sim_comparisons.py', 'helpers_likelihood_and_metrics.py']]
+# ggplot attributes that do not change the rendered figure (or that are only set while rendering)
+plot_key_skipped_attributes = {'environment', 'layout', '_build_objs', 'watermarks'}
+
+# plot jobs being rendered by a pool of forked processes (set before the processes are started)
+_pool_plot_jobs = []
+
+
+def use_agg_backend():
+    """
+    Use the non-interactive Agg backend for matplotlib (run at the start of each rendering process)
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def render_plot(gg, filename, **save_kwargs):
+    """
+    Render a ggplot and save it to a file
+    Args:
+        gg (): The ggplot to render
+        filename (): Path of the image file to create
+        **save_kwargs (): Other arguments of ggplot.save (e.g., width, height, units)
+
+    Returns: The time (in seconds) taken to render and save the plot
+
+    """
+    start_time = time.perf_counter()
+    gg.save(filename=filename, **save_kwargs)
+    return time.perf_counter() - start_time
+
+
+def render_pool_plot(job_index):
+    """
+    Render one of the plot jobs inherited by a forked rendering process
+    """
+    gg, filename, save_kwargs = _pool_plot_jobs[job_index]
+    return render_plot(gg, filename, **save_kwargs)
+
+
+def describe_plot_object(obj, seen=None):
+    """
+    Describe an object used in a ggplot specification (data, layers, scales, theme, ...) in a form that is the same
+    whenever the object would be rendered the same way: dataframes are described by a hash of their contents, functions
+    by their name and the values they use, and other objects by their class and attributes
+    """
+    if isinstance(obj, (str, bool, int, float, complex, type(None), np.generic)):
+        return repr(obj)
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        try:
+            data_hash = pd.util.hash_pandas_object(obj, index=not isinstance(obj, pd.Index)).values.tobytes()
+        except TypeError:
+            # columns with unhashable values (e.g., lists)
+            data_hash = obj.to_csv().encode() if not isinstance(obj, pd.Index) else repr(list(obj)).encode()
+        if isinstance(obj, pd.DataFrame):
+            columns, dtypes = [str(col) for col in obj.columns], [str(dtype) for dtype in obj.dtypes]
+        else:
+            columns, dtypes = [str(obj.name)], [str(obj.dtype)]
+        return [type(obj).__name__, columns, dtypes, hashlib.sha256(data_hash).hexdigest()]
+    if isinstance(obj, np.ndarray):
+        return ['ndarray', str(obj.dtype), obj.shape, hashlib.sha256(np.ascontiguousarray(obj).tobytes()).hexdigest()
+                if obj.dtype != object else describe_plot_object(obj.tolist(), seen)]
+    if isinstance(obj, type):
+        return f'{obj.__module__}.{obj.__qualname__}'
+
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 'seen'
+    seen = seen | {id(obj)}
+    if isinstance(obj, dict):
+        return ['dict'] + sorted([repr(key), describe_plot_object(value, seen)] for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [type(obj).__name__] + [describe_plot_object(value, seen) for value in obj]
+    if isinstance(obj, (set, frozenset)):
+        return [type(obj).__name__] + sorted(repr(value) for value in obj)
+    if callable(obj) and hasattr(obj, '__code__'):
+        # functions (e.g., palettes and label formatters): their name and the values they were created with
+        closure = [cell.cell_contents for cell in obj.__closure__ or [] if cell.cell_contents is not obj]
+        return ['function', f'{obj.__module__}.{obj.__qualname__}', describe_plot_object(obj.__defaults__, seen),
+                describe_plot_object(closure, seen)]
+    if hasattr(obj, '__dict__'):
+        attributes = {key: value for key, value in vars(obj).items() if key not in plot_key_skipped_attributes}
+        return [f'{type(obj).__module__}.{type(obj).__qualname__}', describe_plot_object(attributes, seen)]
+    # remove memory addresses from the representation of other objects
+    return re.sub(r' at 0x[0-9a-fA-F]+', '', repr(obj))
+
+
+def get_plot_code_hash():
+    """
+    Get a hash of the scripts that create the plots, of the plotnine version and of the plot cache version
+    """
+    code_hash = hashlib.sha256(f'{plot_cache_version}-{plotnine.__version__}-'.encode())
+    for filepath in plot_code_filepaths:
+        with open(filepath, 'rb') as f:
+            code_hash.update(f.read())
+    return code_hash.hexdigest()
+
+
+def get_plot_key(gg, save_kwargs, code_hash=None):
+    """
+    Get the key of a plot in the plot cache
+    Args:
+        gg (): The ggplot to render
+        save_kwargs (): Dictionary of the other arguments of ggplot.save (e.g., width, height, units)
+        code_hash (): Hash of the plotting code (from get_plot_code_hash)
+
+    Returns: A hash of the plot's data and specification, its size, and the code used to create it
+
+    """
+    code_hash = get_plot_code_hash() if code_hash is None else code_hash
+    description = [code_hash, describe_plot_object(save_kwargs), describe_plot_object(gg)]
+    return hashlib.sha256(repr(description).encode()).hexdigest()
+
+
+def add_to_plot_cache(plot_cache_dir, plot_key, filename, max_bytes=plot_cache_max_bytes):
+    """
+    Copy a rendered plot into the plot cache, then remove the least recently used plots while the cache is larger
+    than max_bytes
+    """
+    os.makedirs(plot_cache_dir, exist_ok=True)
+    cache_filepath = os.path.join(plot_cache_dir, plot_key + os.path.splitext(filename)[1])
+    shutil.copyfile(filename, cache_filepath + '.tmp')
+    os.replace(cache_filepath + '.tmp', cache_filepath)
+
+    cache_files = []
+    for entry in os.scandir(plot_cache_dir):
+        if entry.is_file() and not entry.name.endswith('.tmp'):
+            entry_stat = entry.stat()
+            cache_files.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+    total_bytes = sum(size for _, size, _ in cache_files)
+    for _, size, path in sorted(cache_files):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # already removed by another process
+            pass
+        total_bytes -= size
+
+
+def get_from_plot_cache(plot_cache_dir, plot_key, filename):
+    """
+    Copy a plot from the plot cache if it is there (marking it as recently used)
+    Returns: Whether the plot was found in the cache
+    """
+    cache_filepath = os.path.join(plot_cache_dir, plot_key + os.path.splitext(filename)[1])
+    try:
+        shutil.copyfile(cache_filepath, filename)
+        os.utime(cache_filepath)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def render_plots(plot_jobs, plot_workers=1, plot_cache_dir=None, plot_cache_max_bytes=plot_cache_max_bytes):
+    """
+    Render and save a set of ggplots
+    Args:
+        plot_jobs (): A list of (ggplot, filename, save_kwargs) tuples, where save_kwargs is a dictionary of the other
+                      arguments of ggplot.save (e.g., {'width': 8, 'height': 6, 'units': 'in'})
+        plot_workers (): The number of processes used to render the plots. If 1 (or if processes cannot be forked on
+                         this platform), plots are rendered one after another in this process. If None, the number
+                         of processors is used.
+        plot_cache_dir (): Directory of the plot cache. If None, all plots are rendered.
+        plot_cache_max_bytes (): The maximum total size of the plots kept in the plot cache
+
+    Returns: A dataframe with the name of each plot file, the time (in seconds) taken to render it (or to copy it from
+        the plot cache), and whether it was copied from the plot cache
+
+    """
+    global _pool_plot_jobs
+    start_time = time.perf_counter()
+    render_times = [0.0] * len(plot_jobs)
+    cached = [False] * len(plot_jobs)
+    plot_keys = [None] * len(plot_jobs)
+    if plot_cache_dir is not None and len(plot_jobs) > 0:
+        code_hash = get_plot_code_hash()
+        for ii, (gg, filename, save_kwargs) in enumerate(plot_jobs):
+            job_start_time = time.perf_counter()
+            plot_keys[ii] = get_plot_key(gg, save_kwargs, code_hash=code_hash)
+            cached[ii] = get_from_plot_cache(plot_cache_dir, plot_keys[ii], filename)
+            render_times[ii] = time.perf_counter() - job_start_time
+    render_indices = [ii for ii in range(len(plot_jobs)) if not cached[ii]]
+
+    if (plot_workers is None or plot_workers > 1) and len(render_indices) > 1 and \
+            'fork' in multiprocessing.get_all_start_methods():
+        _pool_plot_jobs = plot_jobs
+        try:
+            with ProcessPoolExecutor(max_workers=plot_workers, mp_context=multiprocessing.get_context('fork'),
+                                     initializer=use_agg_backend) as executor:
+                new_render_times = list(executor.map(render_pool_plot, render_indices))
+        finally:
+            _pool_plot_jobs = []
+    else:
+        new_render_times = [render_plot(plot_jobs[ii][0], plot_jobs[ii][1], **plot_jobs[ii][2])
+                            for ii in render_indices]
+    for ii, render_time in zip(render_indices, new_render_times):
+        render_times[ii] += render_time
+        if plot_cache_dir is not None:
+            add_to_plot_cache(plot_cache_dir, plot_keys[ii], plot_jobs[ii][1], max_bytes=plot_cache_max_bytes)
+
+    timing_df = pd.DataFrame({'filename': [os.path.basename(filename) for _, filename, _ in plot_jobs],
+                              'render_seconds': render_times,
+                              'cached': cached})
+    for filename, render_time, is_cached in zip(timing_df['filename'], render_times, cached):
+        add_timing_record('render_plot', render_time, figure=filename, cached=is_cached)
+    if len(timing_df) > 0:
+        slowest = timing_df.loc[timing_df['render_seconds'].idxmax()]
+        print(f"Created {len(timing_df)} plots ({sum(cached)} from the plot cache) in "
+              f"{time.perf_counter() - start_time:.1f}s ({timing_df['render_seconds'].sum():.1f}s of rendering, "
+              f"slowest: {slowest['filename']} {slowest['render_seconds']:.1f}s)")
+    return timing_df
@@ -0,0 +1,244 @@
+# helpers_reference_store.py
+#
+# This script loads the reference datasets used by each validation relationship. Each reference file is read and
+#    normalized (site names matched, mean ages derived, columns renamed) once for all of the sites it contains, and
+#    the result is kept in memory and saved to a binary cache keyed by a hash of the file contents. Later requests for
+#    a site - within the same run or in later runs, as long as the reference file is unchanged - are served from the
+#    cache, which is indexed by site.
+
+import hashlib
+import os
+import pandas as pd
+
+# increment when the normalization of any reference dataset changes so that existing cache files are rebuilt
+reference_cache_version = 1
+reference_cache_dirname = '.reference_cache'
+
+# for each validation relationship: the coordinator column with the reference filename and the reference column with
+# the site name
+reference_columns = {'age_incidence': ('age_incidence_ref', 'Site'),
+                     'age_prevalence': ('age_prevalence_ref', 'Site'),
+                     'age_parasite_density': ('age_parasite_density_ref', 'Site'),
+                     'infectiousness_to_mosquitos': ('infectiousness_to_mosquitos_ref', 'site'),
+                     'infection_duration': ('infection_duration_ref', 'site')}
+
+# normalized reference datasets already loaded in this process, keyed by (filepath, relationship name)
+_loaded_reference_datasets = {}
+
+
+def get_mean_from_upper_age(cur_age, upper_ages):
+    """
+    Using the upper bounds of a set of age bins, return the mean age of an individuals in a particular bin
+    Args:
+        cur_age (): The upper age bound of the current age bin
+        upper_ages (): The upper age bounds of all age bins
+
+    Returns: The mean age of someone in the current age bin
+
+    """
+    if not upper_ages or cur_age not in upper_ages:
+        return None
+    else:
+        mean_ages = [upper_ages[0] / 2]
+        for i in range(len(upper_ages) - 1):
+            mean_ages.append((upper_ages[i] + upper_ages[i + 1]) / 2)
+        return mean_ages[upper_ages.index(cur_age)]
+
+
+def normalize_incidence_reference(ref_df):
+    """
+    Format the incidence-by-age reference data for a single site
+    """
+    return pd.DataFrame({'reference': ref_df['INC'] / 1000,
+                         'mean_age': (ref_df['INC_LAR'] + ref_df['INC_UAR']) / 2,
+                         'Site': ref_df['Site'],
+                         'ref_pop_size': ref_df['POP'],
+                         'ref_year': ref_df['START_YEAR']})
+
+
+def normalize_prevalence_reference(ref_df):
+    """
+    Format the prevalence-by-age reference data for a single site
+    """
+    ref_df = ref_df.copy()
+    if 'agebin' in ref_df.columns:
+        upper_ages = sorted(ref_df['agebin'].unique())
+        ref_df['mean_age'] = ref_df['agebin'].apply(get_mean_from_upper_age, upper_ages=upper_ages)
+    elif ('PR_LAR' in ref_df.columns) and ('PR_UAR' in ref_df.columns):
+        ref_df['mean_age'] = (ref_df['PR_LAR'] + ref_df['PR_UAR']) / 2
+    name_dict = {'PR_MONTH': 'month',
+                 'PR': 'prevalence',
+                 'N': 'total_sampled',
+                 'N_POS': 'num_pos',
+                 'PR_YEAR': 'year'}
+    ref_df.rename(columns=name_dict, inplace=True)
+
+    ref_df = ref_df[["Site", "mean_age", 'month', 'total_sampled', 'num_pos', 'prevalence', 'year']]
+    # remove reference rows without prevalence values
+    return ref_df[~ref_df['prevalence'].isna()]
+
+
+def normalize_density_reference(ref_df):
+    """
+    Format the parasite density-by-age reference data for a single site
+    """
+    ref_df = ref_df.copy()
+    ref_df['Site'] = ref_df['Site'].str.lower()
+    upper_ages = sorted(ref_df['agebin'].unique())
+    ref_df['mean_age'] = ref_df['agebin'].apply(get_mean_from_upper_age, upper_ages=upper_ages)
+    return ref_df
+
+
+def normalize_infectiousness_reference(ref_df):
+    """
+    Format the infectiousness-to-mosquitos reference data for a single site
+    """
+    return pd.DataFrame({'reference': ref_df['freq_frac_infect'],
+                         'agebin': ref_df['agebin'],
+                         'densitybin': ref_df['densitybin'],
+                         'fraction_infected_bin': ref_df['fraction_infected_bin'],
+                         'Site': ref_df['site'],
+                         'month': ref_df['month'],
+                         'site_month': ref_df['site'] + '_month' + ref_df['month'].astype('str'),
+                         'ref_total': ref_df['num_in_group'],
+                         'ref_bin_count': ref_df['count']})
+
+
+def normalize_duration_reference(ref_df):
+    """
+    Format the infection duration reference data for a single site
+    """
+    ref_df = ref_df.copy()
+    ref_df['date'] = pd.to_datetime(ref_df['date'])
+    return ref_df
+
+
+reference_normalizers = {'age_incidence': normalize_incidence_reference,
+                         'age_prevalence': normalize_prevalence_reference,
+                         'age_parasite_density': normalize_density_reference,
+                         'infectiousness_to_mosquitos': normalize_infectiousness_reference,
+                         'infection_duration': normalize_duration_reference}
+
+
+def get_reference_file_hash(filepath, relationship_name):
+    """
+    Get the key of a normalized reference dataset in the cache: a hash of the reference file contents, of the
+    relationship it is normalized for, and of the cache version
+    """
+    file_hash = hashlib.sha256(f'{relationship_name}-{reference_cache_version}-'.encode())
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def build_reference_dataset(filepath, relationship_name):
+    """
+    Read a reference file and normalize the data of every site it contains for the given validation relationship
+    Args:
+        filepath (): Path of the reference csv
+        relationship_name (): The validation relationship the reference file is used for (a key of reference_columns)
+
+    Returns: A dictionary mapping each lowercase site name to a dataframe with the normalized data of that site (each
+        site keeps its own column types, as when the sites were read one at a time). The None key holds the (empty)
+        normalized data used for sites that are not in the reference file.
+
+    """
+    ref_df = pd.read_csv(filepath)
+    normalize = reference_normalizers[relationship_name]
+    site_names = ref_df[reference_columns[relationship_name][1]].str.lower()
+    site_dfs = {site: normalize(ref_df[site_names == site]) for site in site_names.dropna().unique()}
+    site_dfs[None] = normalize(ref_df.iloc[:0])
+    return site_dfs
+
+
+def load_reference_dataset(filepath, relationship_name, cache_dir=None):
+    """
+    Get the normalized data of a reference file, from memory if it was already loaded in this process, otherwise from
+    the cache if the file is unchanged since it was cached, otherwise by reading the reference file (and then saving
+    it to the cache).
+    Args:
+        filepath (): Path of the reference csv
+        relationship_name (): The validation relationship the reference file is used for (a key of reference_columns)
+        cache_dir (): Directory of the cache files. If None, a cache directory next to the reference file is used.
+
+    Returns: A dictionary mapping each lowercase site name to a dataframe with the normalized data of that site
+
+    """
+    filepath = os.path.abspath(filepath)
+    file_stat = os.stat(filepath)
+    memory_key = (filepath, relationship_name)
+    loaded = _loaded_reference_datasets.get(memory_key)
+    if loaded is not None and loaded['stat'] == (file_stat.st_mtime_ns, file_stat.st_size):
+        return loaded['site_dfs']
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(filepath), reference_cache_dirname)
+    cache_prefix = f'{relationship_name}_{os.path.splitext(os.path.basename(filepath))[0]}_'
+    cache_filepath = os.path.join(cache_dir, cache_prefix + get_reference_file_hash(filepath, relationship_name)[:16]
+                                  + '.pkl')
+    cached = None
+    if os.path.isfile(cache_filepath):
+        try:
+            cached = pd.read_pickle(cache_filepath)
+        except Exception as ex:
+            print(f'Could not read reference cache file {cache_filepath}, rebuilding it: {ex}')
+    if cached is None:
+        cached = {'site_dfs': build_reference_dataset(filepath, relationship_name)}
+        os.makedirs(cache_dir, exist_ok=True)
+        # remove cache files of earlier versions of this reference file, then write the new one atomically
+        for filename in os.listdir(cache_dir):
+            if filename.startswith(cache_prefix) and filename.endswith('.pkl'):
+                os.remove(os.path.join(cache_dir, filename))
+        pd.to_pickle(cached, cache_filepath + '.tmp', compression=None)
+        os.replace(cache_filepath + '.tmp', cache_filepath)
+
+    _loaded_reference_datasets[memory_key] = {'stat': (file_stat.st_mtime_ns, file_stat.st_size), **cached}
+    return cached['site_dfs']
+
+
+def get_reference_site_df(base_reference_filepath, reference_filename, relationship_name, site, cache_dir=None):
+    """
+    Get the normalized reference data of one site for a validation relationship
+    Args:
+        base_reference_filepath (): The filepath where reference datasets are located
+        reference_filename (): The name of the reference file (as listed in the coordinator csv)
+        relationship_name (): The validation relationship (a key of reference_columns)
+        site (): The name of the site (matched to the reference site names without case)
+        cache_dir (): Directory of the cache files. If None, a cache directory within base_reference_filepath is used.
+
+    Returns: A dataframe with the reference data of the site (empty if the site is not in the reference file)
+
+    """
+    site_dfs = load_reference_dataset(os.path.join(base_reference_filepath, reference_filename), relationship_name,
+                                      cache_dir=cache_dir)
+    site = str(site).lower()
+    return site_dfs[site if site in site_dfs else None].copy()
+
+
+def load_reference_store(coord_csv, base_reference_filepath, cache_dir=None):
+    """
+    Load every reference dataset listed in the coordinator csv (for the sites included in each validation
+    relationship), so that the per-site requests of the validation relationships are all served from memory
+    Args:
+        coord_csv (): A dataframe detailing the sites simulated for each validation relationship and the corresponding
+                      reference dataset
+        base_reference_filepath (): The filepath where reference datasets are located
+        cache_dir (): Directory of the cache files. If None, a cache directory within base_reference_filepath is used.
+
+    Returns: A dictionary mapping each (relationship name, reference filename) to the number of sites in the dataset
+
+    """
+    loaded = {}
+    for relationship_name, (ref_column, _) in reference_columns.items():
+        if relationship_name not in coord_csv.columns or ref_column not in coord_csv.columns:
+            continue
+        reference_filenames = coord_csv.loc[coord_csv[relationship_name] == 1, ref_column].dropna().unique()
+        for reference_filename in reference_filenames:
+            filepath = os.path.join(base_reference_filepath, reference_filename)
+            if not os.path.isfile(filepath):
+                print(f'Reference file {filepath} listed for {relationship_name} was not found.')
+                continue
+            site_dfs = load_reference_dataset(filepath, relationship_name, cache_dir=cache_dir)
+            loaded[(relationship_name, reference_filename)] = len(site_dfs) - 1
+    return loaded
@@ -12,29 +12,15 @@ import pandas as pd
 import math
 import os
 import datetime
-import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-
-# region: helper functions
-def get_mean_from_upper_age(cur_age, upper_ages):
-    """
-    Using the upper bounds of a set of age bins, return the mean age of an individuals in a particular bin
-    Args:
-        cur_age (): The upper age bound of the current age bin
-        upper_ages (): The upper age bounds of all age bins
-
-    Returns: The mean age of someone in the current age bin
-
-    """
-    if not upper_ages or cur_age not in upper_ages:
-        return None
-    else:
-        mean_ages = [upper_ages[0] / 2]
-        for i in range(len(upper_ages) - 1):
-            mean_ages.append((upper_ages[i] + upper_ages[i + 1]) / 2)
-        return mean_ages[upper_ages.index(cur_age)]
+from create_plots.helpers_reference_store import get_mean_from_upper_age, get_reference_site_df
+from create_plots.helpers_timing import record_timing
+from simulations.analyzers.analyzer_output import read_analyzer_output, analyzer_output_exists, \
+    iter_analyzer_output_partitions, get_analyzer_output_partitions, read_analyzer_output_partition
 
 
+# region: helper functions
 def get_age_bin_averages(sim_df):
     """
     get average fraction of individuals in each age bin that fall into each parasite density bin, weighting all ages in
@@ -66,6 +52,7 @@ def get_age_bin_averages(sim_df):
         return None
 
 
+@record_timing
 def match_sim_ref_ages(ref_df, sim_df, bench_df=pd.DataFrame()):
     """
     Check that ages match between reference and simulation. if there is a small difference (<1 year), update simulation to use same ages as reference.
@@ -141,12 +128,71 @@ def get_available_sites_for_relationship(coord_csv, simulation_output_filepath,
     coord_sites = coord_csv[(~coord_csv['site'].isna()) & (coord_csv[relationship_name] == 1)]['site']
     available_sites = list()
     for ii in range(len(coord_sites)):
-        if os.path.isfile(os.path.join(simulation_output_filepath,  coord_sites.iloc[ii], relationship_sim_filename)):
+        if analyzer_output_exists(os.path.join(simulation_output_filepath,  coord_sites.iloc[ii], relationship_sim_filename)):
             available_sites.append(coord_sites.iloc[ii])
 
     return available_sites
 
 
+def index_coordinator_by_site(coord_csv):
+    """
+    Index the coordinator csv by site name (keeping the first row listed for each site), so that the per-site values
+    can be looked up directly instead of filtering the full coordinator csv for every site
+    Args:
+        coord_csv (): A dataframe detailing the sites simulated for each validation relationship and the corresponding
+                      reference dataset
+
+    Returns: The coordinator dataframe with one row per site, indexed by site
+
+    """
+    return coord_csv[~coord_csv['site'].isna()].drop_duplicates(subset='site').set_index('site')
+
+
+@record_timing
+def load_site_outputs(sites, relationship_sim_filename, simulation_output_filepath,
+                      benchmark_simulation_filepath=None, max_workers=None):
+    """
+    Read the simulation (and benchmark simulation) output file of each site for a validation relationship. Reading is
+    I/O-bound, so the files of all sites are read concurrently in a thread pool.
+    Args:
+        sites (): The names of the sites to read
+        relationship_sim_filename (): The name of the simulation output file used for this validation relationship
+        simulation_output_filepath (): The filepath where simulation output is located
+        benchmark_simulation_filepath (): The filepath where benchmark simulation output is located. If None, no
+                                          benchmark simulation output is read
+        max_workers (): The maximum number of threads reading files. If None, the ThreadPoolExecutor default is used.
+
+    Returns: A dictionary mapping each site to its simulation output and a dictionary mapping each site to its
+        benchmark simulation output (only including the sites with benchmark simulation output)
+
+    """
+    filepaths = {('simulation', site): os.path.join(simulation_output_filepath, site, relationship_sim_filename)
+                 for site in sites}
+    if benchmark_simulation_filepath is not None:
+        for site in sites:
+            filepath = os.path.join(benchmark_simulation_filepath, site, relationship_sim_filename)
+            if analyzer_output_exists(filepath):
+                filepaths[('benchmark', site)] = filepath
+    if len(filepaths) == 0:
+        return {}, {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        site_dfs = dict(zip(filepaths.keys(), executor.map(read_analyzer_output, filepaths.values())))
+    sim_dfs = {site: site_dfs[('simulation', site)] for site in sites}
+    bench_dfs = {site: site_dfs[('benchmark', site)] for site in sites if ('benchmark', site) in site_dfs}
+    return sim_dfs, bench_dfs
+
+
+def concat_site_dfs(site_dfs):
+    """
+    Combine the dataframes of all sites (skipping empty dataframes) into one dataframe
+    """
+    site_dfs = [df for df in site_dfs if len(df.columns) > 0]
+    if len(site_dfs) == 0:
+        return pd.DataFrame()
+    return pd.concat(site_dfs)
+
+
 def combine_higher_dens_freqs(sim_df_cur, max_ref_dens, max_magnitude_difference=100):
     """
     Aggregate simulation parasite density bins that are substantially above the maximum reference bin.
@@ -243,6 +289,7 @@ def get_fraction_in_infectious_bin(sim_df):
 # endregion
 
 # region: main reformatting functions
+@record_timing
 def prepare_inc_df(coord_csv, simulation_output_filepath, base_reference_filepath, benchmark_simulation_filepath=None):
     """
     Read in, align, and combine reference and simulation data for all sites associated with the incidence-by-age
@@ -263,52 +310,46 @@ def prepare_inc_df(coord_csv, simulation_output_filepath, base_reference_filepat
                                                            relationship_name='age_incidence',
                                                            relationship_sim_filename='inc_prev_data_final.csv')
 
+    # read the simulation output of all sites (and benchmark simulation output of the sites where it exists)
+    coord_by_site = index_coordinator_by_site(coord_csv)
+    sim_dfs, bench_dfs = load_site_outputs(available_sites, 'inc_prev_data_final.csv', simulation_output_filepath,
+                                           benchmark_simulation_filepath=benchmark_simulation_filepath)
+
     # iterate through sites, aggregating all age-incidence simulation data into one dataframe and reference data into a second dataframe (for the relevant sites)
     #   if a benchmark simulation directory was specified and the site exists there, create a third dataframe
-    sim_df = pd.DataFrame()
-    bench_df = pd.DataFrame()
-    ref_df = pd.DataFrame()
-    for ss in range(len(available_sites)):
+    sim_df_list, bench_df_list, ref_df_list = [], [], []
+    for cur_site in available_sites:
         # simulations currently being evaluated
-        cur_site = available_sites[ss]
         # todo: duplicate code that can be moved to a common function
-        sim_df_cur = pd.read_csv(os.path.join(simulation_output_filepath, cur_site, 'inc_prev_data_final.csv'))
+        sim_df_cur = sim_dfs[cur_site]
         upper_ages = sorted(sim_df_cur['Age'].unique())
         sim_df_cur['mean_age'] = sim_df_cur['Age'].apply(get_mean_from_upper_age, upper_ages=upper_ages)
-        sim_df_cur['p_detect_case'] = coord_csv[coord_csv['site'] == cur_site]['p_detect_case'].iloc[0]
+        sim_df_cur['p_detect_case'] = coord_by_site.at[cur_site, 'p_detect_case']
 
         # simulations used as benchmark
-        if (benchmark_simulation_filepath is not None) and \
-                (os.path.isfile(os.path.join(benchmark_simulation_filepath, cur_site, 'inc_prev_data_final.csv'))):
-            bench_df_cur = pd.read_csv(os.path.join(benchmark_simulation_filepath, cur_site, 'inc_prev_data_final.csv'))
+        if cur_site in bench_dfs:
+            bench_df_cur = bench_dfs[cur_site]
             upper_ages = sorted(bench_df_cur['Age'].unique())
             bench_df_cur['mean_age'] = bench_df_cur['Age'].apply(get_mean_from_upper_age, upper_ages=upper_ages)
-            bench_df_cur['p_detect_case'] = coord_csv[coord_csv['site'] == cur_site]['p_detect_case'].iloc[0]
-        else:
-            bench_df_cur = pd.DataFrame()
+            bench_df_cur['p_detect_case'] = coord_by_site.at[cur_site, 'p_detect_case']
+            bench_df_list.append(bench_df_cur)
+
+        # reference data (formatted with the reference and simulation dataset columns)
+        ref_df_cur = get_reference_site_df(base_reference_filepath, coord_by_site.at[cur_site, 'age_incidence_ref'],
+                                           relationship_name='age_incidence', site=cur_site)
 
-        # reference data
-        filepath_ref = os.path.join(base_reference_filepath,
-                                    coord_csv[coord_csv['site'] == cur_site]['age_incidence_ref'].iloc[0])
-        ref_df_cur = pd.read_csv(filepath_ref)
-        ref_df_cur = ref_df_cur[ref_df_cur['Site'].str.lower() == cur_site.lower()]
+        # add site to the list of sites combined into the larger dataframes
+        sim_df_list.append(sim_df_cur)
+        ref_df_list.append(ref_df_cur)
 
-        # add site into larger dataframe
-        sim_df = pd.concat([sim_df, sim_df_cur])
-        ref_df = pd.concat([ref_df, ref_df_cur])
-        bench_df = pd.concat([bench_df, bench_df_cur])
+    sim_df = concat_site_dfs(sim_df_list)
+    ref_df = concat_site_dfs(ref_df_list)
+    bench_df = concat_site_dfs(bench_df_list)
 
     # scale down incidence in simulation according to probability of detecting a case in the reference setting
     sim_df['Incidence'] = sim_df['Incidence'] * sim_df['p_detect_case']
 
-    # set up reference and simulation dataset columns
-    ref_df['Incidence'] = ref_df['INC'] / 1000
-    ref_df['mean_age'] = (ref_df['INC_LAR'] + ref_df['INC_UAR']) / 2
-    ref_df = pd.DataFrame({'reference': ref_df['Incidence'],
-                           'mean_age': ref_df['mean_age'],
-                           'Site': ref_df['Site'],
-                           'ref_pop_size': ref_df['POP'],
-                           'ref_year': ref_df['START_YEAR']})
+    # set up simulation dataset columns
     sim_df = pd.DataFrame({'simulation': sim_df['Incidence'],
                            'mean_age': sim_df['mean_age'],
                            'Site': sim_df['Site']})
@@ -331,6 +372,7 @@ def prepare_inc_df(coord_csv, simulation_output_filepath, base_reference_filepat
 
 
 # prepare dataframe with simulation and reference data formatted together
+@record_timing
 def prepare_prev_df(coord_csv, simulation_output_filepath, base_reference_filepath, benchmark_simulation_filepath=None):
     """
     Read in, align, and combine reference and simulation data for all sites associated with the prevalence-by-age
@@ -352,40 +394,21 @@ def prepare_prev_df(coord_csv, simulation_output_filepath, base_reference_filepa
                                                            relationship_name='age_prevalence',
                                                            relationship_sim_filename='prev_inc_by_age_month.csv')
 
+    # read the simulation output of all sites (and benchmark simulation output of the sites where it exists)
+    coord_by_site = index_coordinator_by_site(coord_csv)
+    sim_dfs, bench_dfs = load_site_outputs(available_sites, 'prev_inc_by_age_month.csv', simulation_output_filepath,
+                                           benchmark_simulation_filepath=benchmark_simulation_filepath)
+
     # aggregate all age-prevalence simulation data into one dataframe and reference data into a second dataframe (for the relevant sites)
     #   if a benchmark simulation directory was specified and the site exists there, create a third dataframe
-    sim_df = pd.DataFrame()
-    bench_df = pd.DataFrame()
-    ref_df = pd.DataFrame()
-    for ss in range(len(available_sites)):
-        # simulations currently being evaluated
-        cur_site = available_sites[ss]
-
-        # read in and format reference data for this site
-        filepath_ref = os.path.join(base_reference_filepath,
-                                    coord_csv[coord_csv['site'] == cur_site]['age_prevalence_ref'].iloc[0])
-        ref_df_cur = pd.read_csv(filepath_ref)
-        ref_df_cur = ref_df_cur[ref_df_cur['Site'].str.lower() == cur_site.lower()]
-
-        if 'agebin' in ref_df_cur.columns:
-            upper_ages = sorted(ref_df_cur['agebin'].unique())
-            ref_df_cur['mean_age'] = ref_df_cur['agebin'].apply(get_mean_from_upper_age, upper_ages=upper_ages)
-        elif ('PR_LAR' in ref_df_cur.columns) and ('PR_UAR' in ref_df_cur.columns):
-            ref_df_cur['mean_age'] = (ref_df_cur['PR_LAR'] + ref_df_cur['PR_UAR']) / 2
-        name_dict = {'PR_MONTH': 'month',
-                     'PR': 'prevalence',
-                     'N': 'total_sampled',
-                     'N_POS': 'num_pos',
-                     'PR_YEAR': 'year'}
-
-        ref_df_cur.rename(columns=name_dict, inplace=True)
-
-        ref_df_cur = ref_df_cur[["Site", "mean_age", 'month', 'total_sampled', 'num_pos', 'prevalence', 'year']]
-        # remove reference rows without prevalence values
-        ref_df_cur = ref_df_cur[~ref_df_cur['prevalence'].isna()]
-
-        # read in and format data from simulations to match reference dataset
-        sim_df_cur = pd.read_csv(os.path.join(simulation_output_filepath, cur_site, 'prev_inc_by_age_month.csv'))
+    sim_df_list, bench_df_list, ref_df_list = [], [], []
+    for cur_site in available_sites:
+        # formatted reference data for this site (without rows missing prevalence values)
+        ref_df_cur = get_reference_site_df(base_reference_filepath, coord_by_site.at[cur_site, 'age_prevalence_ref'],
+                                           relationship_name='age_prevalence', site=cur_site)
+
+        # format data from simulations to match reference dataset
+        sim_df_cur = sim_dfs[cur_site]
         sim_df_cur.rename(columns={'PfPR': 'prevalence'}, inplace=True)
 
         upper_ages = sorted(sim_df_cur['agebin'].unique())
@@ -395,9 +418,9 @@ def prepare_prev_df(coord_csv, simulation_output_filepath, base_reference_filepa
         sim_df_cur = sim_df_cur[sim_df_cur['Pop'] > 0]
         sim_df_cur['month'] = sim_df_cur['month'].astype(str)
 
-        if benchmark_simulation_filepath is not None:
-            # read in and format data from benchmark simulations to match reference dataset
-            bench_df_cur = pd.read_csv(os.path.join(benchmark_simulation_filepath, cur_site, 'prev_inc_by_age_month.csv'))
+        if cur_site in bench_dfs:
+            # format data from benchmark simulations to match reference dataset
+            bench_df_cur = bench_dfs[cur_site]
             bench_df_cur.rename(columns={'PfPR': 'prevalence'}, inplace=True)
 
             upper_ages = sorted(bench_df_cur['agebin'].unique())
@@ -419,7 +442,8 @@ def prepare_prev_df(coord_csv, simulation_output_filepath, base_reference_filepa
             included_months = [str(int(x)) for x in included_months]
 
             sim_df_cur = sim_df_cur[sim_df_cur['month'].astype(str).isin(included_months)]
-            bench_df_cur = bench_df_cur[bench_df_cur['month'].astype(str).isin(included_months)]
+            if len(bench_df_cur) > 0:
+                bench_df_cur = bench_df_cur[bench_df_cur['month'].astype(str).isin(included_months)]
             if len(included_months) > 1:
                 sim_df_cur['month'] = 'multiple'
                 ref_df_cur['month'] = 'multiple'
@@ -430,7 +454,8 @@ def prepare_prev_df(coord_csv, simulation_output_filepath, base_reference_filepa
             included_months = ref_df_cur['month'].unique()
             included_months = [str(int(month)) for month in included_months]
             sim_df_cur = sim_df_cur[sim_df_cur['month'].astype(str).isin(included_months)]
-            bench_df_cur = bench_df_cur[bench_df_cur['month'].astype(str).isin(included_months)]
+            if len(bench_df_cur) > 0:
+                bench_df_cur = bench_df_cur[bench_df_cur['month'].astype(str).isin(included_months)]
         else:
             warnings.warn(f'The month format in the {cur_site} reference dataset was not recognized.')
 
@@ -438,10 +463,14 @@ def prepare_prev_df(coord_csv, simulation_output_filepath, base_reference_filepa
         if len(bench_df_cur) > 0:
             bench_df_cur = bench_df_cur[["Site", "mean_age", 'month', 'prevalence', 'year', 'Run_Number']]
 
-        # add site into larger dataframe
-        sim_df = pd.concat([sim_df, sim_df_cur])
-        ref_df = pd.concat([ref_df, ref_df_cur])
-        bench_df = pd.concat([bench_df, bench_df_cur])
+        # add site to the list of sites combined into the larger dataframes
+        sim_df_list.append(sim_df_cur)
+        ref_df_list.append(ref_df_cur)
+        bench_df_list.append(bench_df_cur)
+
+    sim_df = concat_site_dfs(sim_df_list)
+    ref_df = concat_site_dfs(ref_df_list)
+    bench_df = concat_site_dfs(bench_df_list)
 
     # format reference data
     ref_df['Site'] = ref_df['Site'].str.lower()
@@ -489,6 +518,7 @@ def prepare_prev_df(coord_csv, simulation_output_filepath, base_reference_filepa
     return combined_df
 
 
+@record_timing
 def prepare_dens_df(coord_csv, simulation_output_filepath, base_reference_filepath, benchmark_simulation_filepath=None):
     """
     Read in, align, and combine reference and simulation data for all sites associated with the parasite density-by-age
@@ -512,33 +542,28 @@ def prepare_dens_df(coord_csv, simulation_output_filepath, base_reference_filepa
 
     if not available_sites:
         return pd.DataFrame(), pd.DataFrame()
-    # iterate through sites, grabbing relevant reference and simulation data to plot; combine data into a dataframe containing all sites
-    sim_df = pd.DataFrame()
-    bench_df = pd.DataFrame()
-    ref_df = pd.DataFrame()
-    for ss in range(len(available_sites)):
-        # simulations currently being evaluated
-        cur_site = available_sites[ss]
+    # read the simulation output of all sites (and benchmark simulation output of the sites where it exists)
+    coord_by_site = index_coordinator_by_site(coord_csv)
+    sim_dfs, bench_dfs = load_site_outputs(available_sites, 'parasite_densities_by_age_month.csv',
+                                           simulation_output_filepath,
+                                           benchmark_simulation_filepath=benchmark_simulation_filepath)
 
-        # read in and format reference data for this site
+    # iterate through sites, grabbing relevant reference and simulation data to plot; combine data into a dataframe containing all sites
+    sim_df_list, bench_df_list, ref_df_list = [], [], []
+    for cur_site in available_sites:
+        # format simulation and reference data for this site
         # todo: write a common method to generate age_agg_df for sim, ref and benchmark data
-        filepath_sim = os.path.join(simulation_output_filepath, cur_site, 'parasite_densities_by_age_month.csv')
-        sim_df_cur = pd.read_csv(filepath_sim)
+        sim_df_cur = sim_dfs[cur_site]
         upper_ages = sorted(sim_df_cur['agebin'].unique())
         sim_df_cur['mean_age'] =sim_df_cur['agebin'].apply(get_mean_from_upper_age, upper_ages=upper_ages)
         age_agg_sim_df = get_age_bin_averages(sim_df_cur)
 
-        filepath_ref = os.path.join(base_reference_filepath,
-                                    coord_csv[coord_csv['site'] == cur_site]['age_parasite_density_ref'].iloc[0])
-        ref_df_cur = pd.read_csv(filepath_ref)
-        ref_df_cur = ref_df_cur[ref_df_cur['Site'].str.lower() == cur_site.lower()]
-        ref_df_cur['Site'] =ref_df_cur['Site'].str.lower()
-        upper_ages = sorted(ref_df_cur['agebin'].unique())
-        ref_df_cur['mean_age'] =ref_df_cur['agebin'].apply(get_mean_from_upper_age, upper_ages=upper_ages)
-
-        if benchmark_simulation_filepath is not None:
-            bench_df_cur = pd.read_csv(os.path.join(benchmark_simulation_filepath, cur_site,
-                                                    'parasite_densities_by_age_month.csv'))
+        ref_df_cur = get_reference_site_df(base_reference_filepath,
+                                           coord_by_site.at[cur_site, 'age_parasite_density_ref'],
+                                           relationship_name='age_parasite_density', site=cur_site)
+
+        if cur_site in bench_dfs:
+            bench_df_cur = bench_dfs[cur_site]
             upper_ages = sorted(bench_df_cur['agebin'].unique())
             bench_df_cur['mean_age'] = bench_df_cur['agebin'].apply(get_mean_from_upper_age, upper_ages=upper_ages)
             age_agg_bench_df = get_age_bin_averages(bench_df_cur)
@@ -576,13 +601,14 @@ def prepare_dens_df(coord_csv, simulation_output_filepath, base_reference_filepa
         ref_df_cur = pd.merge(ref_df_cur, all_zeros_df, how='outer')
         ref_df_cur.fillna(0, inplace=True)
 
-        # add site into larger dataframe
-        if len(ref_df) > 0:
-            ref_df = pd.merge(ref_df, ref_df_cur, how='outer')
-        else:
-            ref_df = ref_df_cur
-        sim_df = pd.concat([sim_df, sim_df_cur])
-        bench_df = pd.concat([bench_df, bench_df_cur])
+        # add site to the list of sites combined into the larger dataframes
+        ref_df_list.append(ref_df_cur)
+        sim_df_list.append(sim_df_cur)
+        bench_df_list.append(bench_df_cur)
+
+    sim_df = concat_site_dfs(sim_df_list)
+    ref_df = concat_site_dfs(ref_df_list)
+    bench_df = concat_site_dfs(bench_df_list)
 
     # check that ages match between reference and simulation. if there is a small difference (<1 year, update simulation)
     sim_df, bench_df = match_sim_ref_ages(ref_df, sim_df, bench_df)
@@ -654,6 +680,7 @@ def prepare_dens_df(coord_csv, simulation_output_filepath, base_reference_filepa
     return combined_df_asex, combined_df_gamet
 
 
+@record_timing
 def prepare_infect_df(coord_csv, simulation_output_filepath, base_reference_filepath, benchmark_simulation_filepath=None):
     """
     Read in, align, and combine reference and simulation data for all sites associated with the
@@ -675,22 +702,22 @@ def prepare_infect_df(coord_csv, simulation_output_filepath, base_reference_file
 
     if not available_sites:
         return pd.DataFrame()
-    # iterate through sites, grabbing relevant reference and simulation data to plot; combine data into a dataframe containing all sites
-    sim_df = pd.DataFrame()
-    bench_df = pd.DataFrame()
-    ref_df = pd.DataFrame()
-    for ss in range(len(available_sites)):
-        # simulations currently being evaluated
-        cur_site = available_sites[ss]
+    # read the simulation output of all sites (and benchmark simulation output of the sites where it exists)
+    coord_by_site = index_coordinator_by_site(coord_csv)
+    sim_dfs, bench_dfs = load_site_outputs(available_sites, 'infectiousness_by_age_density_month.csv',
+                                           simulation_output_filepath,
+                                           benchmark_simulation_filepath=benchmark_simulation_filepath)
 
-        filepath_ref = os.path.join(base_reference_filepath,
-                                    coord_csv[coord_csv['site'] == cur_site]['infectiousness_to_mosquitos_ref'].iloc[0])
-        ref_df_cur = pd.read_csv(filepath_ref)
-        ref_df_cur = ref_df_cur[ref_df_cur['site'].str.lower() == str(cur_site).lower()]
+    # iterate through sites, grabbing relevant reference and simulation data to plot; combine data into a dataframe containing all sites
+    sim_df_list, bench_df_list, ref_df_list = [], [], []
+    for cur_site in available_sites:
+        # reference data for this site (formatted with standardized column names)
+        ref_df_cur = get_reference_site_df(base_reference_filepath,
+                                           coord_by_site.at[cur_site, 'infectiousness_to_mosquitos_ref'],
+                                           relationship_name='infectiousness_to_mosquitos', site=cur_site)
         ref_months = ref_df_cur['month'].unique()
 
-        filepath_sim = os.path.join(simulation_output_filepath, cur_site, 'infectiousness_by_age_density_month.csv')
-        sim_df_cur = pd.read_csv(filepath_sim)
+        sim_df_cur = sim_dfs[cur_site]
         # remove simulation rows with zero pop
         sim_df_cur = sim_df_cur[sim_df_cur['Pop'] > 0]
         # subset simulation to months in reference df
@@ -699,9 +726,8 @@ def prepare_infect_df(coord_csv, simulation_output_filepath, base_reference_file
         # densitybin, run number} group that fall in each infectiousness bin
         sim_df_agg2 = get_fraction_in_infectious_bin(sim_df_cur)
 
-        if benchmark_simulation_filepath is not None:
-            bench_df_cur = pd.read_csv(os.path.join(benchmark_simulation_filepath, cur_site,
-                                                    'infectiousness_by_age_density_month.csv'))
+        if cur_site in bench_dfs:
+            bench_df_cur = bench_dfs[cur_site]
             # remove simulation rows with zero pop
             bench_df_cur = bench_df_cur[bench_df_cur['Pop'] > 0]
             # subset simulation to months in reference df
@@ -722,16 +748,6 @@ def prepare_infect_df(coord_csv, simulation_output_filepath, base_reference_file
 
         # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
         # standardize column names and merge simulation and reference data frames
-        ref_df_cur.rename(columns={'site': 'Site'}, inplace=True)
-        ref_df_cur = pd.DataFrame({'reference': ref_df_cur['freq_frac_infect'],
-                                   'agebin': ref_df_cur['agebin'],
-                                   'densitybin': ref_df_cur['densitybin'],
-                                   'fraction_infected_bin': ref_df_cur['fraction_infected_bin'],
-                                   'Site': ref_df_cur['Site'],
-                                   'month': ref_df_cur['month'],
-                                   'site_month': ref_df_cur['Site'] + '_month' + ref_df_cur['month'].astype('str'),
-                                   'ref_total': ref_df_cur['num_in_group'],
-                                   'ref_bin_count': ref_df_cur['count']})
         sim_df_cur = pd.DataFrame({'simulation': sim_df_agg2['infectiousness_bin_freq'],
                                    'agebin': sim_df_agg2['agebin'],
                                    'densitybin': sim_df_agg2['densitybin'],
@@ -748,13 +764,15 @@ def prepare_infect_df(coord_csv, simulation_output_filepath, base_reference_file
                                          'Site': bench_df_agg2['Site'],
                                          'month': bench_df_agg2['month'],
                                          'site_month': bench_df_agg2['Site'] + '_month' + bench_df_agg2['month'].astype('str')})
+            bench_df_list.append(bench_df_cur)
 
-        # add site into larger dataframe
-        sim_df = pd.concat([sim_df, sim_df_cur])
-        ref_df = pd.concat([ref_df, ref_df_cur])
-        # todo: I added this if condition since I think there is case that the bench_df_cur is not defined
-        if len(bench_df_cur) > 0:
-            bench_df = pd.concat([bench_df, bench_df_cur])
+        # add site to the list of sites combined into the larger dataframes
+        sim_df_list.append(sim_df_cur)
+        ref_df_list.append(ref_df_cur)
+
+    sim_df = concat_site_dfs(sim_df_list)
+    ref_df = concat_site_dfs(ref_df_list)
+    bench_df = concat_site_dfs(bench_df_list)
 
     combined_df = pd.merge(sim_df, ref_df, how='outer')
     if len(bench_df) > 0:
@@ -765,8 +783,176 @@ def prepare_infect_df(coord_csv, simulation_output_filepath, base_reference_file
 
 
 # region: infection duration sampling function
+def get_ref_survey_individuals(ref_df, first_ref_date):
+    """
+    Summarize the reference survey for each reference individual: the age and simulation day of their first sample and
+     the simulation days of all their samples
+    Args:
+        ref_df (): A dataframe containing the reference data, with one row per sample and a 'date' column of dates
+        first_ref_date (): The date corresponding to simulation day 0
+
+    Returns: A list of (reference id, age at first sample, simday of first sample, simdays of all samples) tuples, in the
+        order in which reference individuals appear in ref_df
+
+    """
+    ref_individuals = []
+    ref_df = ref_df[~ref_df['date'].isna()]
+    ref_simdays = ref_df['date'].apply(lambda x: (x - first_ref_date).days)
+    for sid, ref_df_cur in ref_df.assign(simday=ref_simdays).groupby('SID', sort=False):
+        ref_df_cur = ref_df_cur.sort_values(by='date')
+        ref_individuals.append((sid, ref_df_cur['age'].iloc[0], ref_df_cur['simday'].iloc[0],
+                                ref_df_cur['simday'].unique()))
+    return ref_individuals
+
+
+def build_survey_index(sim):
+    """
+    Build a hash index of candidate simulation individuals for each (simulation day, age in whole years)
+    Args:
+        sim (): A dataframe with the simulation patient report for one seed, with 'simday', 'id' and 'age' (in years)
+            columns
+
+    Returns: A dictionary mapping each simulation day to a dictionary that maps each rounded age to a sorted array of
+        the ids of simulated individuals with that age on that day
+
+    """
+    survey_index = {}
+    rounded_ages = np.round(sim['age'].to_numpy())
+    ids = sim['id'].to_numpy()
+    for (simday, age), positions in pd.Series(ids).groupby([sim['simday'].to_numpy(), rounded_ages]).indices.items():
+        survey_index.setdefault(simday, {})[int(age)] = np.sort(ids[positions])
+    return survey_index
+
+
+def find_survey_candidates(ages_on_day, age, included_ids, widen_step=5, max_year_range=100):
+    """
+    Find the simulated individuals that are not yet included in the survey and best match the age of a reference
+     individual. If no individual has the same age (in whole years), the age window is widened in steps of widen_step
+     years (on both sides) until a candidate is found.
+    Args:
+        ages_on_day (): Dictionary mapping each rounded age to the array of ids with that age on the survey day
+        age (): The age (in years) of the reference individual
+        included_ids (): Set of simulation ids that have already been sampled
+        widen_step (): Number of years by which the age window is widened when no candidate is found
+        max_year_range (): Maximum age difference (in years) of a matched individual
+
+    Returns: Sorted list of candidate ids and the age window (in years) used to find them
+
+    """
+    age = int(round(age))
+    # use age-specific matches
+    candidates = [idx for idx in ages_on_day.get(age, []) if idx not in included_ids]
+    if len(candidates) > 0:
+        return candidates, 0
+
+    # if no perfect age-match remains, widen the age window to the smallest multiple of widen_step years that includes
+    # an individual that has not been sampled yet
+    available = {cur_age: [idx for idx in ids if idx not in included_ids] for cur_age, ids in ages_on_day.items()}
+    available = {cur_age: ids for cur_age, ids in available.items() if len(ids) > 0}
+    if len(available) == 0:
+        return [], None
+    min_diff = min(abs(cur_age - age) for cur_age in available)
+    year_range = int(math.ceil(min_diff / widen_step) * widen_step)
+    if year_range > max_year_range:
+        return [], None
+    candidates = [idx for cur_age, ids in available.items() if abs(cur_age - age) <= year_range for idx in ids]
+    return sorted(candidates), year_range
+
+
+def sample_sim_survey_seed(sim, ref_individuals, first_ref_date, rng):
+    """
+    Subsample the simulation output of one seed to match the reference survey: for each reference individual, draw an
+     unsampled simulated individual with a matching age on the day of the first reference sample and keep that
+     individual's simulation rows on the reference sampling days
+    Args:
+        sim (): A dataframe with the simulation patient report for one seed
+        ref_individuals (): Reference survey summary from get_ref_survey_individuals
+        first_ref_date (): The date corresponding to simulation day 0
+        rng (): numpy random Generator used to draw among candidate individuals
+
+    Returns: A dataframe with the subsampled simulation rows, and the number of reference individuals for which no
+        matching simulated individual was found (and that are left out of the subsample)
+
+    """
+    # only the days sampled in the reference survey are needed
+    survey_days = np.unique(np.concatenate([simdays for _, _, _, simdays in ref_individuals]))
+    sim = sim[sim['simday'].isin(survey_days)].reset_index(drop=True)
+    sim['age'] = sim['age'] / 365
+    survey_index = build_survey_index(sim)
+    rows_by_id = sim.groupby('id').indices
+    simdays = sim['simday'].to_numpy()
+
+    # track which individuals have already been included from the simulation (to avoid double-sampling simulation
+    # individuals)
+    included_ids = set()
+    sampled_rows = []
+    unmatched = 0
+    for ii, (sid, age_cur, day_cur, ref_days) in enumerate(ref_individuals):
+        if ii % 50 == 0:
+            print('Currently on individual ' + str(ii) + ' out of ', len(ref_individuals))
+        id_candidates, year_range = find_survey_candidates(survey_index.get(day_cur, {}), age_cur, included_ids)
+        if len(id_candidates) == 0:
+            print('Problem: no age-matched simulation individual found for reference id: ' + str(sid))
+            unmatched += 1
+            continue
+        elif year_range > 0:
+            print('No exact age match remaining for reference id: ' + str(sid)
+                  + '. Used simulation individual within ', year_range, ' years.')
+
+        id_sim_cur = id_candidates[rng.integers(len(id_candidates))]
+        included_ids.add(id_sim_cur)
+
+        # keep the same simulation dates as the reference samples for this individual
+        rows = rows_by_id[id_sim_cur]
+        sampled_rows.append(rows[np.isin(simdays[rows], ref_days)])
+
+    sim_subset = sim.iloc[np.concatenate(sampled_rows) if len(sampled_rows) > 0 else []].copy()
+    sim_subset['date'] = [first_ref_date + datetime.timedelta(days=int(simday)) for simday in sim_subset['simday']]
+    return sim_subset, unmatched
+
+
+def get_seed_rng(random_seed, seed):
+    """
+    Get the random number generator used to subsample one simulation seed. The generator only depends on the root
+     random_seed and on the simulation seed, so results do not depend on which seeds are processed or in which order.
+    Args:
+        random_seed (): Root seed of the survey subsampling
+        seed (): The simulation run seed (Run_Number)
+
+    Returns: A numpy random Generator
+
+    """
+    return np.random.default_rng(np.random.SeedSequence(entropy=random_seed, spawn_key=(int(seed),)))
+
+
+def get_seed_sim_survey(sim, seed, ref_individuals, first_ref_date, random_seed):
+    """
+    Subsample the patient report of one simulation seed to match the reference survey (the unit of work of
+     get_sim_survey, which can run in a worker process)
+    Args:
+        sim (): The patient report of this seed, either as a dataframe or as the list of paths of its partition files
+            (from get_analyzer_output_partitions), which are then only read by the worker
+        seed (): The simulation run seed (Run_Number)
+        ref_individuals (): Reference survey summary from get_ref_survey_individuals
+        first_ref_date (): The date corresponding to simulation day 0
+        random_seed (): Root seed of the survey subsampling
+
+    Returns: A dataframe with the subsampled simulation rows for this seed, and the number of reference individuals
+        without a matching simulated individual
+
+    """
+    print('Currently on seed ' + str(seed))
+    if not isinstance(sim, pd.DataFrame):
+        sim = read_analyzer_output_partition(sim)
+    sim_subset, unmatched = sample_sim_survey_seed(sim, ref_individuals, first_ref_date,
+                                                   get_seed_rng(random_seed, seed))
+    sim_subset['seed'] = seed
+    return sim_subset, unmatched
+
+
 # Note: this function does not follow the same pattern as the functions for the other validation relationships
-def get_sim_survey(sim_dir, ref_df, seeds=None):
+@record_timing
+def get_sim_survey(sim_dir, ref_df, seeds=None, random_seed=0, jobs=1, resample=False):
     """
     Subsample from the simulation output to match the survey that generated the reference dataset (i.e., match the
     dates and ages of sampled individuals)
@@ -777,6 +963,12 @@ def get_sim_survey(sim_dir, ref_df, seeds=None):
         ref_df (): A dataframe containing the reference data, which is used to determine which individuals from the
             simulations are kept in the subsampled results
         seeds (): The subset of simulaton run seeds to include. If NA, all seeds are used.
+        random_seed (): Root seed of the random number generators used to draw matching simulation individuals. Each
+            simulation seed gets its own generator derived from it.
+        jobs (): Number of worker processes used to subsample the simulation seeds in parallel. Results do not depend on
+            the number of workers.
+        resample (): If True, the subsampled results are drawn again (and saved) even if they were already saved, e.g.,
+            because the simulation output changed since they were drawn
 
     Returns: A dataframe containing simulation survey results matching the reference dataset (includes a set of
             reference-matched rows for each of the simulation seeds)
@@ -785,73 +977,35 @@ def get_sim_survey(sim_dir, ref_df, seeds=None):
 
     sampled_sim_filename = 'sim_duration_survey_sampling.csv'
     file_path = os.path.join(sim_dir, sampled_sim_filename)
-    if os.path.isfile(file_path):
+    if os.path.isfile(file_path) and not resample:
         sim_subset_full = pd.read_csv(file_path)
     else:
         # get first year of sampling in reference dataset. the simulation will be referenced from the first day of that year
         first_ref_date = datetime.date(datetime.datetime.strptime(str(ref_df['date'].dropna().min()), "%Y-%m-%d %H:%M:%S").year, 1, 1)
-        indIDs = ref_df['SID'].unique()
         ref_df['date'] = ref_df['date'].apply(lambda x: x.date())
+        ref_individuals = get_ref_survey_individuals(ref_df, first_ref_date)
 
+        # subsample the patient report one seed at a time. Per-seed partitions are only read when their seed is
+        # subsampled; a patient report written as a single file is read once and split by seed.
         patient_report_path = os.path.join(sim_dir, 'patient_reports.csv')
-        sim_full = pd.read_csv(patient_report_path)
-
-        if seeds is None:
-            seeds = sim_full['Run_Number'].unique()
-
-        sim_subset_full = pd.DataFrame()
-        for seed in sorted(seeds):
-            print('Currently on seed ' + str(seed))
-            sim = sim_full[sim_full['Run_Number'] == seed]  # subset to desired run
-            sim['date'] = [first_ref_date + datetime.timedelta(days=int(simday)) for simday in sim['simday']]
-            sim['age'] = sim['age'] / 365
-            # track which individuals have already been included from the simulation (
-            # to avoid double-sampling simulation individuals)
-            included_ids = set()
-            sim_subset = pd.DataFrame()
-            for ii in range(len(indIDs)):
-                if ii % 50 == 0:
-                    print('Currently on individual ' + str(ii) + ' out of ', len(indIDs))
-                ref_df_cur = ref_df[ref_df['SID'] == indIDs[ii]]
-                ref_df_cur = ref_df_cur.sort_values(by='date')
-                # find a matching individual
-                age_cur = ref_df_cur['age'].iloc[0]
-                day_cur = ref_df_cur['date'].iloc[0]
-
-                # use age-specific matches
-                id_candidates = sim[(sim['date'] == day_cur) & (round(sim['age']) == round(age_cur))]['id'].tolist()
-                id_candidates = [idx for idx in id_candidates if idx not in included_ids]
-                # if no perfect age-match remain, expand year-range until finding a match
-                if len(id_candidates) == 0:
-                    year_range = 0
-                    while len(id_candidates) == 0 & year_range < 100:
-                        year_range = year_range + 5
-                        # todo: need some code review on the math
-                        # r code
-                        # id_candidates = sim$id[intersect(which(sim$date == day_cur), which(round(sim$age) % in % seq((round(age_cur)-year_range), (round(age_cur)+year_range))))]
-                        id_candidates = sim[(sim['date'] == day_cur)
-                                            & (sim['age'].round().isin(range((round(age_cur)-year_range),
-                                                                              round(age_cur)+year_range)))]['id'].tolist()
-                        id_candidates = [idx for idx in id_candidates if idx not in included_ids]
-
-                    if len(id_candidates) == 0:
-                        print('Problem: no age-matched simulation individual found for reference id: ' + indIDs[ii])
-                    else:
-                        print('No exact age match remaining for reference id: ' + indIDs[ii]
-                              + '. Used simulation individual within ', year_range, ' years.')
-
-                id_sim_cur = random.sample(id_candidates, 1)[0]  # todo: should we remove this id after drawing?
-                included_ids.add(id_sim_cur)
-
-                # keep the same simulation dates as the reference samples for this individual
-                sim_subset_cur = sim[(sim['id'] == id_sim_cur) & (sim['date'].isin(ref_df_cur['date']))]
-                sim_subset = pd.concat([sim_subset, sim_subset_cur])
-
-            sim_subset['seed'] = seed
-            if sim_subset_full.empty:
-                sim_subset_full = sim_subset
-            else:
-                sim_subset_full = pd.concat([sim_subset_full, sim_subset])
+        seed_sims = get_analyzer_output_partitions(patient_report_path)
+        if len(seed_sims) == 0:
+            seed_sims = dict(iter_analyzer_output_partitions(patient_report_path, partition_column='Run_Number',
+                                                             values=seeds))
+        seeds = sorted(seed for seed in (seed_sims.keys() if seeds is None else seeds) if seed in seed_sims)
+        seed_args = [(seed_sims[seed], seed, ref_individuals, first_ref_date, random_seed) for seed in seeds]
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                seed_results = list(executor.map(get_seed_sim_survey, *zip(*seed_args)))
+        else:
+            seed_results = [get_seed_sim_survey(*args) for args in seed_args]
+        for seed, (_, unmatched) in zip(seeds, seed_results):
+            if unmatched > 0:
+                warnings.warn(f'No age-matched simulation individual was found for {unmatched} of the '
+                              f'{len(ref_individuals)} reference individuals in seed {seed} of {sim_dir}. These '
+                              f'individuals are left out of the simulation survey.')
+        sim_subsets = [sim_subset for sim_subset, _ in seed_results]
+        sim_subset_full = pd.concat(sim_subsets) if len(sim_subsets) > 0 else pd.DataFrame()
 
         # rename simulation columns to match reference data
         sim_subset_full.rename(columns={'id': 'SID', 'true_asexual_parasites': 'DENSITY'}, inplace=True)
@@ -0,0 +1,157 @@
+# helpers_timing.py
+#
+# This script contains the timing instrumentation of the create_plots pipeline. Functions decorated with
+#    @record_timing add a record of each call (wall time, peak memory use of the process, and the number of rows in the
+#    input and output dataframes) to the timing records of this process. The records made while creating a validation
+#    relationship are collected with run_timed (optionally with a cProfile of the whole relationship) and written to a
+#    timing report beside the plots.
+
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+timing_report_filename = 'timing_report'
+profile_dirname = 'profiles'
+
+# timing records of this process, and the names of the decorated functions currently running (outermost first)
+_timing_records = []
+_active_steps = []
+
+
+def get_peak_rss_mb():
+    """
+    Get the peak resident memory use (in MB) of this process so far (None if it is not available on this platform)
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak_rss / 2 ** 20 if sys.platform == 'darwin' else peak_rss / 2 ** 10
+
+
+def count_rows(values):
+    """
+    Get the total number of rows of the dataframes among values, including dataframes in dictionaries (such as
+    dataframes by site). None if there are no dataframes.
+    """
+    num_rows = [len(df) for value in values for df in (value.values() if isinstance(value, dict) else [value])
+                if isinstance(df, pd.DataFrame)]
+    return sum(num_rows) if num_rows else None
+
+
+def get_site(args, kwargs):
+    """
+    Get the site a function call is for: a site argument, or the only site of the first dataframe argument
+    """
+    for name in ['site', 'cur_site']:
+        if name in kwargs:
+            return kwargs[name]
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, pd.DataFrame):
+            if 'Site' in value.columns and len(value) > 0 and value['Site'].nunique() == 1:
+                return value['Site'].iloc[0]
+            break
+    return None
+
+
+def add_timing_record(step, wall_seconds, relationship=None, depth=None, **fields):
+    """
+    Add a record to the timing records of this process
+    Args:
+        step (): The name of the step that was timed (e.g., a function name)
+        wall_seconds (): The time taken by the step
+        relationship (): The outermost timed step the step is part of (by default, the outermost step running)
+        depth (): The number of timed steps the step is nested in (by default, the number of steps running)
+        **fields (): Other fields of the record (e.g., site, rows_in, rows_out)
+
+    """
+    if relationship is None and _active_steps:
+        relationship = _active_steps[0]
+    _timing_records.append({'relationship': relationship, 'step': step,
+                            'depth': len(_active_steps) if depth is None else depth, 'wall_seconds': wall_seconds,
+                            'peak_rss_mb': get_peak_rss_mb(), **fields})
+
+
+def record_timing(func):
+    """
+    Decorator adding a timing record for each call of a function
+    """
+    @functools.wraps(func)
+    def timed_func(*args, **kwargs):
+        _active_steps.append(func.__name__)
+        relationship, depth = _active_steps[0], len(_active_steps) - 1
+        start_time = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            wall_seconds = time.perf_counter() - start_time
+            _active_steps.pop()
+        rows_in = count_rows(list(args) + list(kwargs.values()))
+        rows_out = count_rows(result if isinstance(result, (tuple, list)) else [result])
+        add_timing_record(func.__name__, wall_seconds, relationship=relationship, depth=depth,
+                          site=get_site(args, kwargs), rows_in=rows_in, rows_out=rows_out)
+        return result
+    return timed_func
+
+
+def run_timed(func, *args, profile_filepath=None, **kwargs):
+    """
+    Call a function (e.g., one of the generate_*_outputs functions) and collect the timing records made during the call
+    Args:
+        func (): The function to call
+        *args (): Positional arguments of the function
+        profile_filepath (): If not None, a cProfile of the call is saved to this file
+        **kwargs (): Keyword arguments of the function
+
+    Returns: A list of the timing records made during the call
+
+    """
+    num_previous_records = len(_timing_records)
+    profiler = cProfile.Profile() if profile_filepath is not None else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        func(*args, **kwargs)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(os.path.dirname(os.path.abspath(profile_filepath)), exist_ok=True)
+            profiler.dump_stats(profile_filepath)
+        records = _timing_records[num_previous_records:]
+        del _timing_records[num_previous_records:]
+    return records
+
+
+def write_timing_report(timing_records, plot_output_filepath):
+    """
+    Save timing records as a csv and a json report in the plot output directory
+    Args:
+        timing_records (): A list of timing records (from run_timed)
+        plot_output_filepath (): The filepath to the directory where plots are created
+
+    Returns: A dataframe with the timing records
+
+    """
+    timing_df = pd.DataFrame(timing_records)
+    timing_df.to_csv(os.path.join(plot_output_filepath, timing_report_filename + '.csv'), index=False)
+    # the json report also has the total time of each relationship (the time of its outermost step)
+    if len(timing_df) > 0:
+        outermost = timing_df[timing_df['depth'] == 0]
+        relationship_seconds = outermost.groupby('relationship')['wall_seconds'].sum().to_dict()
+    else:
+        relationship_seconds = {}
+    with open(os.path.join(plot_output_filepath, timing_report_filename + '.json'), 'w') as f:
+        json.dump({'relationship_seconds': relationship_seconds,
+                   'records': json.loads(timing_df.to_json(orient='records'))}, f, indent=2)
+    return timing_df
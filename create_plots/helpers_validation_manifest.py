@@ -0,0 +1,148 @@
+# helpers_validation_manifest.py
+#
+# This script contains the functions used for incremental validation runs. The inputs of each site in each validation
+#    relationship (the simulation output, the benchmark simulation output, the reference dataset, and the site's row of
+#    the coordinator csv) are summarized by a fingerprint. The fingerprints used to generate the plots and csvs are
+#    saved in a manifest next to those outputs, so that a later run can regenerate only the relationships (and, where
+#    outputs are per site, only the sites) whose inputs changed.
+
+import hashlib
+import json
+import os
+
+from create_plots.helpers_reference_store import reference_columns
+from create_plots.helpers_reformat_sim_ref_dfs import get_available_sites_for_relationship, index_coordinator_by_site
+from simulations.analyzers.analyzer_output import get_analyzer_output_path, get_analyzer_output_partitions
+
+validation_manifest_filename = 'validation_manifest.json'
+
+# the simulation output file used by each validation relationship
+relationship_sim_filenames = {'age_incidence': 'inc_prev_data_final.csv',
+                              'age_prevalence': 'prev_inc_by_age_month.csv',
+                              'age_parasite_density': 'parasite_densities_by_age_month.csv',
+                              'infectiousness_to_mosquitos': 'infectiousness_by_age_density_month.csv',
+                              'infection_duration': 'patient_reports.csv'}
+
+
+def get_file_hash(filepath):
+    """
+    Get the sha256 hash of the contents of a file
+    """
+    file_hash = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_analyzer_output_fingerprint(filepath):
+    """
+    Get a fingerprint of the contents of an analyzer output, whether it was written as a csv, as a parquet file, or as
+    partitions
+    Args:
+        filepath (): Path of the csv output file
+
+    Returns: A hash of the output contents, or None if the output does not exist
+
+    """
+    output_path = get_analyzer_output_path(filepath)
+    if os.path.isfile(output_path):
+        return get_file_hash(output_path)
+    partitions = get_analyzer_output_partitions(filepath)
+    if len(partitions) == 0:
+        return None
+    partition_hashes = [(str(value), [get_file_hash(get_analyzer_output_path(path)) for path in paths])
+                        for value, paths in partitions.items()]
+    return hashlib.sha256(json.dumps(partition_hashes).encode()).hexdigest()
+
+
+def get_site_fingerprint(coord_row, relationship_name, site, simulation_output_filepath, base_reference_filepath,
+                         benchmark_simulation_filepath=None):
+    """
+    Get a fingerprint of all inputs used for one site in a validation relationship
+    Args:
+        coord_row (): The site's row of the coordinator csv
+        relationship_name (): The validation relationship (a key of relationship_sim_filenames)
+        site (): The name of the site
+        simulation_output_filepath (): The filepath where simulation output is located
+        base_reference_filepath (): The filepath where reference datasets are located
+        benchmark_simulation_filepath (): The filepath where benchmark simulation output is located
+
+    Returns: A hash combining the hashes of the simulation output, benchmark simulation output, reference dataset and
+        coordinator row of the site
+
+    """
+    sim_filename = relationship_sim_filenames[relationship_name]
+    components = {'simulation': get_analyzer_output_fingerprint(os.path.join(simulation_output_filepath, site,
+                                                                              sim_filename)),
+                  'coordinator': {key: str(value) for key, value in coord_row.items()}}
+    if benchmark_simulation_filepath is not None:
+        components['benchmark'] = get_analyzer_output_fingerprint(os.path.join(benchmark_simulation_filepath, site,
+                                                                               sim_filename))
+    reference_filename = coord_row.get(reference_columns[relationship_name][0])
+    if isinstance(reference_filename, str):
+        reference_filepath = os.path.join(base_reference_filepath, reference_filename)
+        components['reference'] = get_file_hash(reference_filepath) if os.path.isfile(reference_filepath) else None
+    return hashlib.sha256(json.dumps(components, sort_keys=True).encode()).hexdigest()
+
+
+def get_relationship_fingerprints(coord_csv, relationship_name, simulation_output_filepath, base_reference_filepath,
+                                  benchmark_simulation_filepath=None):
+    """
+    Get the fingerprints of the inputs of all sites included in a validation relationship
+    Args:
+        coord_csv (): A dataframe detailing the sites simulated for each validation relationship and the corresponding
+                      reference dataset
+        relationship_name (): The validation relationship (a key of relationship_sim_filenames)
+        simulation_output_filepath (): The filepath where simulation output is located
+        base_reference_filepath (): The filepath where reference datasets are located
+        benchmark_simulation_filepath (): The filepath where benchmark simulation output is located
+
+    Returns: A dictionary mapping each site with simulation output for this relationship to its fingerprint
+
+    """
+    available_sites = get_available_sites_for_relationship(coord_csv, simulation_output_filepath,
+                                                           relationship_name=relationship_name,
+                                                           relationship_sim_filename=relationship_sim_filenames[
+                                                               relationship_name])
+    coord_by_site = index_coordinator_by_site(coord_csv)
+    return {site: get_site_fingerprint(coord_by_site.loc[site].to_dict(), relationship_name, site,
+                                       simulation_output_filepath, base_reference_filepath,
+                                       benchmark_simulation_filepath=benchmark_simulation_filepath)
+            for site in available_sites}
+
+
+def get_changed_sites(previous_fingerprints, fingerprints):
+    """
+    Get the sites whose inputs were added or changed since the previous fingerprints were recorded
+    Args:
+        previous_fingerprints (): Dictionary of site fingerprints from the manifest (None if not in the manifest)
+        fingerprints (): Dictionary of current site fingerprints
+
+    Returns: List of the sites (in the order of fingerprints) that are new or have a different fingerprint
+
+    """
+    previous_fingerprints = previous_fingerprints or {}
+    return [site for site, fingerprint in fingerprints.items() if previous_fingerprints.get(site) != fingerprint]
+
+
+def load_validation_manifest(plot_output_filepath):
+    """
+    Read the manifest of the fingerprints used to generate the outputs in plot_output_filepath
+    Returns: A dictionary mapping each validation relationship to its site fingerprints (empty if there is no manifest)
+    """
+    manifest_filepath = os.path.join(plot_output_filepath, validation_manifest_filename)
+    if not os.path.isfile(manifest_filepath):
+        return {}
+    with open(manifest_filepath, 'r') as f:
+        return json.load(f)
+
+
+def save_validation_manifest(plot_output_filepath, manifest):
+    """
+    Save the manifest of the fingerprints used to generate the outputs in plot_output_filepath
+    """
+    manifest_filepath = os.path.join(plot_output_filepath, validation_manifest_filename)
+    with open(manifest_filepath + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_filepath + '.tmp', manifest_filepath)
@@ -9,9 +9,16 @@ from simulations.manifest import simulation_output_filepath, benchmark_simulatio
      base_reference_filepath, plot_output_filepath, comps_id_folder
 from simulations.helpers import load_coordinator_df
 from simulations.get_version import get_era_version_from_file
+from create_plots.helpers_reference_store import load_reference_store
+from create_plots.helpers_validation_manifest import get_relationship_fingerprints, get_changed_sites, \
+    load_validation_manifest, save_validation_manifest
+from create_plots.helpers_likelihood_and_metrics import merge_summary_table_shards
+from create_plots.helpers_plot_rendering import plot_cache_dirname
+from create_plots.helpers_timing import run_timed, write_timing_report, profile_dirname
 from create_plots.helpers_coordinate_each_relationship import generate_age_incidence_outputs, \
     generate_age_prevalence_outputs, generate_parasite_density_outputs, generate_infectiousness_outputs, \
     generate_age_infection_duration_outputs
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 import shutil
 import argparse
@@ -23,49 +30,80 @@ if not os.path.exists(benchmark_simulation_filepath):
     benchmark_simulation_filepath = simulation_output_filepath
 
 
-def run(subset="All"):
+def run(subset="All", incremental=False, jobs=1, plot_workers=1, plot_cache=True, profile=False, survey_workers=1):
     # read in data and create plots
     coord_csv = load_coordinator_df(set_index=False)
+    # load and format each reference dataset once (from the reference cache when the reference files are unchanged)
+    load_reference_store(coord_csv, base_reference_filepath)
     print(f"plotting with subset = {subset}.")
-    if plot_output_filepath.is_dir():
+    if incremental and plot_output_filepath.is_dir():
+        # keep the existing outputs and only regenerate those whose inputs changed since they were created
+        print(f"Folder {plot_output_filepath} is already there. Updating outputs with changed inputs.")
+    elif plot_output_filepath.is_dir():
         date, time = datetime.now().strftime("%d-%m-%Y %H-%M-%S").split(' ')
         plot_output_bak_filepath = plot_output_filepath.parent / (str(plot_output_filepath.name) + f'_{date}_{time}_backup')
         print(f"Folder {plot_output_filepath} is already there."
               f"Copying existing files to folder {plot_output_bak_filepath}.")
         shutil.move(plot_output_filepath, plot_output_bak_filepath)
     try:
-        plot_output_filepath.mkdir(parents=True, exist_ok=False)
+        plot_output_filepath.mkdir(parents=True, exist_ok=incremental)
     except FileExistsError:
         print(f"Folder {plot_output_filepath} is already there. "
               f"Suggest to save a backup or the existing files and create an empty folder for new file.")
     else:
         print(f"Folder {plot_output_filepath} was created")
 
+    # unchanged plots are copied from a plot cache kept next to the output folder (so it is kept with the backups)
+    plot_cache_dir = plot_output_filepath.parent / plot_cache_dirname if plot_cache else None
+    # fingerprints of the inputs used to create the existing outputs (only used in incremental runs)
+    manifest = load_validation_manifest(plot_output_filepath) if incremental else {}
+    # the relationships to create: (relationship name, input fingerprints, generate function, keyword arguments)
+    relationship_jobs = []
+
+    def add_if_changed(relationship_name, generate_outputs, **kwargs):
+        fingerprints = get_relationship_fingerprints(coord_csv, relationship_name, simulation_output_filepath,
+                                                     base_reference_filepath,
+                                                     benchmark_simulation_filepath=benchmark_simulation_filepath)
+        if incremental and manifest.get(relationship_name) == fingerprints:
+            print(f"Inputs for {relationship_name} are unchanged, skipping.")
+            return
+        if incremental and 'sites' in kwargs:
+            # outputs are per site: only regenerate the sites whose inputs changed
+            kwargs['sites'] = get_changed_sites(manifest.get(relationship_name), fingerprints)
+            print(f"Regenerating {relationship_name} outputs for sites: {kwargs['sites']}.")
+            if 'resample' in kwargs:
+                # the simulation output of the changed sites changed, so earlier subsamples of it are stale
+                kwargs['resample'] = True
+        else:
+            kwargs.pop('sites', None)
+        relationship_jobs.append((relationship_name, fingerprints, generate_outputs, kwargs))
+
     if subset.lower() == "all" or "core_relationship" in subset.lower():
+        # summary table rows are written to per-relationship shards and merged once all relationships are created
 
         # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
         #                         age - incidence                         #
         # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
-        generate_age_incidence_outputs(coord_csv, simulation_output_filepath, base_reference_filepath, plot_output_filepath,
-                                       benchmark_simulation_filepath=benchmark_simulation_filepath)
+        add_if_changed('age_incidence', generate_age_incidence_outputs, merge_summary_table=False,
+                       plot_workers=plot_workers, plot_cache_dir=plot_cache_dir)
 
         # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
         #                         age - prevalence                        #
         # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
-        generate_age_prevalence_outputs(coord_csv, simulation_output_filepath, base_reference_filepath, plot_output_filepath,
-                                        benchmark_simulation_filepath=benchmark_simulation_filepath)
+        add_if_changed('age_prevalence', generate_age_prevalence_outputs, merge_summary_table=False,
+                       plot_workers=plot_workers, plot_cache_dir=plot_cache_dir)
 
         # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
         #                      age - parasite density                     #
         # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
-        generate_parasite_density_outputs(coord_csv, simulation_output_filepath, base_reference_filepath, plot_output_filepath,
-                                           benchmark_simulation_filepath=benchmark_simulation_filepath)
+        add_if_changed('age_parasite_density', generate_parasite_density_outputs, merge_summary_table=False,
+                       plot_workers=plot_workers, plot_cache_dir=plot_cache_dir)
 
         # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
         #                   infectiousness to vectors                        #
         # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
-        generate_infectiousness_outputs(coord_csv, simulation_output_filepath, base_reference_filepath, plot_output_filepath,
-                                        benchmark_simulation_filepath=benchmark_simulation_filepath)
+        add_if_changed('infectiousness_to_mosquitos', generate_infectiousness_outputs, merge_summary_table=False,
+                       plot_workers=plot_workers, plot_cache_dir=plot_cache_dir)
 
     if subset.lower() == "all" or "infection_duration" in subset.lower():
         # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
@@ -76,9 +114,56 @@ def run(subset="All"):
         # specify binning for duration of infection
         duration_bins = list(range(0, 400, 50))
         duration_bins.append(500)
-        generate_age_infection_duration_outputs(coord_csv, simulation_output_filepath, base_reference_filepath,
-                                                plot_output_filepath, pos_thresh_dens, duration_bins,
-                                                benchmark_simulation_filepath=benchmark_simulation_filepath)
+        add_if_changed('infection_duration', generate_age_infection_duration_outputs,
+                       pos_thresh_dens=pos_thresh_dens, duration_bins=duration_bins, sites=None, resample=False,
+                       survey_workers=survey_workers, plot_workers=plot_workers, plot_cache_dir=plot_cache_dir)
+
+    output_args = (coord_csv, simulation_output_filepath, base_reference_filepath, plot_output_filepath)
+    failed_relationships = []
+    # timing records of each step of the relationships created (and optionally a cProfile of each relationship)
+    timing_records = []
+
+    def get_profile_filepath(relationship_name):
+        return plot_output_filepath / profile_dirname / f'{relationship_name}.prof' if profile else None
+
+    if jobs > 1 and len(relationship_jobs) > 1:
+        # the relationships are independent, so create them in parallel processes
+        print(f"Creating {len(relationship_jobs)} validation relationships with {jobs} processes.")
+        with ProcessPoolExecutor(max_workers=min(jobs, len(relationship_jobs))) as executor:
+            futures = {executor.submit(run_timed, generate_outputs, *output_args,
+                                       profile_filepath=get_profile_filepath(relationship_name),
+                                       benchmark_simulation_filepath=benchmark_simulation_filepath, **kwargs):
+                       (relationship_name, fingerprints)
+                       for relationship_name, fingerprints, generate_outputs, kwargs in relationship_jobs}
+            for future in as_completed(futures):
+                relationship_name, fingerprints = futures[future]
+                try:
+                    timing_records.extend(future.result())
+                except Exception as ex:
+                    print(f"Creating the {relationship_name} outputs failed: {ex}")
+                    failed_relationships.append((relationship_name, ex))
+                else:
+                    # record the fingerprints of each completed relationship so an interrupted run keeps them
+                    manifest[relationship_name] = fingerprints
+                    save_validation_manifest(plot_output_filepath, manifest)
+    else:
+        for relationship_name, fingerprints, generate_outputs, kwargs in relationship_jobs:
+            try:
+                timing_records.extend(run_timed(generate_outputs, *output_args,
+                                                profile_filepath=get_profile_filepath(relationship_name),
+                                                benchmark_simulation_filepath=benchmark_simulation_filepath, **kwargs))
+            except Exception as ex:
+                print(f"Creating the {relationship_name} outputs failed: {ex}")
+                failed_relationships.append((relationship_name, ex))
+            else:
+                manifest[relationship_name] = fingerprints
+                save_validation_manifest(plot_output_filepath, manifest)
+    merge_summary_table_shards(plot_output_filepath)
+    write_timing_report(timing_records, plot_output_filepath)
+    if failed_relationships:
+        failed_names = ', '.join(relationship_name for relationship_name, _ in failed_relationships)
+        raise RuntimeError(f"Creating the outputs failed for: {failed_names}") from failed_relationships[0][1]
+
     # generate dummy file for snakemake plot rule.
     if not os.path.isdir(comps_id_folder):
         os.mkdir(comps_id_folder)
@@ -90,7 +175,21 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Process site name')
     parser.add_argument('--subset', '-s', type=str, help='subset name(s)',
                         default="All")
+    parser.add_argument('--incremental', '-i', action='store_true',
+                        help='keep existing outputs and only regenerate those whose inputs changed since the last run')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='number of validation relationships to create in parallel processes')
+    parser.add_argument('--plot-workers', '-p', type=int, default=1,
+                        help='number of processes used to render the plots of each validation relationship')
+    parser.add_argument('--survey-workers', type=int, default=1,
+                        help='number of processes used to subsample the simulation seeds of each infection duration '
+                             'site')
+    parser.add_argument('--no-plot-cache', dest='plot_cache', action='store_false',
+                        help='render all plots instead of copying unchanged plots from the plot cache')
+    parser.add_argument('--profile', action='store_true',
+                        help='save a cProfile of each validation relationship to the profiles folder of the outputs')
 
     args = parser.parse_args()
-    run(subset=args.subset)
+    run(subset=args.subset, incremental=args.incremental, jobs=args.jobs, plot_workers=args.plot_workers,
+        plot_cache=args.plot_cache, profile=args.profile, survey_workers=args.survey_workers)
 
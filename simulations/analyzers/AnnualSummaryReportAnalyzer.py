@@ -3,6 +3,10 @@ import pandas as pd
 import numpy as np
 from typing import Dict, Any, Union
 from idmtools.entities.ianalyzer import IAnalyzer as BaseAnalyzer
+try:
+    from simulations.analyzers.analyzer_output import write_analyzer_output
+except ImportError:  # on SSMT, analyzer files are uploaded next to analyzer_output.py as top-level modules
+    from analyzer_output import write_analyzer_output
 
 import matplotlib as mpl
 from idmtools.entities.iworkflow_item import IWorkflowItem
@@ -18,11 +22,12 @@ mpl.use('Agg')
 
 
 class AnnualSummaryReportAnalyzer(BaseAnalyzer):
-    def __init__(self, expt_name, sweep_variables=None, working_dir="."):
+    def __init__(self, expt_name, sweep_variables=None, working_dir=".", output_format='csv'):
         super().__init__(filenames=["output\\MalariaSummaryReport_Annual_Report.json"])
         self.expt_name = expt_name
         self.sweep_variables = sweep_variables or ["Run_Number", "Site"]
         self.working_dir = working_dir
+        self.output_format = output_format
 
     def initialize(self):
         """
@@ -73,7 +78,8 @@ class AnnualSummaryReportAnalyzer(BaseAnalyzer):
             for t in self.sweep_variables:
                 dftemp[t] = [s.tags[t]]*len(v)
             df_final = pd.concat([df_final, dftemp])
-        df_final.to_csv(os.path.join(self.working_dir, self.expt_name, "inc_prev_data_full.csv"))
+        write_analyzer_output(df_final, os.path.join(self.working_dir, self.expt_name, "inc_prev_data_full.csv"),
+                              output_format=self.output_format, index=True)
 
         groupby_tags = self.sweep_variables
         groupby_tags.remove('Run_Number')
@@ -82,7 +88,8 @@ class AnnualSummaryReportAnalyzer(BaseAnalyzer):
         for c in ['Prevalence', 'Incidence']:
             df_summarized[c + '_std'] = list(df_summarized_std[c])
 
-        df_summarized.to_csv(os.path.join(self.working_dir, self.expt_name, "inc_prev_data_final.csv"))
+        write_analyzer_output(df_summarized, os.path.join(self.working_dir, self.expt_name, "inc_prev_data_final.csv"),
+                              output_format=self.output_format, index=True)
 
 
 if __name__ == '__main__':
@@ -1,14 +1,20 @@
 import os
+import numpy as np
 import pandas as pd
 from logging import getLogger
 from idmtools.core.platform_factory import Platform
 from idmtools.analysis.analyze_manager import AnalyzeManager
 from idmtools.core import ItemType
 from idmtools.entities.ianalyzer import IAnalyzer as BaseAnalyzer
+try:
+    from simulations.analyzers.analyzer_output import write_analyzer_output
+except ImportError:  # on SSMT, analyzer files are uploaded next to analyzer_output.py as top-level modules
+    from analyzer_output import write_analyzer_output
 
 
 class InfectiousnessByParDensAgeAnalyzer(BaseAnalyzer):
-    def __init__(self, expt_name, sweep_variables=None, working_dir=".", start_year=0, end_year=65):
+    def __init__(self, expt_name, sweep_variables=None, working_dir=".", start_year=0, end_year=65,
+                 output_format='csv'):
         super(InfectiousnessByParDensAgeAnalyzer, self).__init__(
             working_dir=working_dir,
             filenames=["output/MalariaSummaryReport_Infectiousness_Monthly_Report_%d.json" % x
@@ -18,6 +24,7 @@ class InfectiousnessByParDensAgeAnalyzer(BaseAnalyzer):
         self.start_year = start_year
         self.end_year = end_year
         self.working_dir = working_dir
+        self.output_format = output_format
 
     def initialize(self):
         """
@@ -32,25 +39,29 @@ class InfectiousnessByParDensAgeAnalyzer(BaseAnalyzer):
         gam_bins = data[self.filenames[0]]['Metadata']['Gametocytemia Bins']
         frac_infected_bins = data[self.filenames[0]]['Metadata']['Infectiousness Bins']
 
-        adf = pd.DataFrame()
-        for year, fname in zip(range(self.start_year, self.end_year), self.filenames):  # , 2020
-            for age in list(range(0, len(agebins))):
-                for dens in list(range(0, len(gam_bins))):
-                    for infect in list(range(0, len(frac_infected_bins))):
+        # stack the monthly blocks from all years into arrays with dimensions
+        # (year, month, infectiousness bin, gametocyte density bin, age bin)
+        infect = np.array([data[fname]['DataByTimeAndInfectiousnessBinsAndPfPRBinsAndAgeBins']['Smeared Infectiousness by smeared Gametocytemia and Age Bin'][:12]
+                           for fname in self.filenames])[:, :, :len(frac_infected_bins), :len(gam_bins), :len(agebins)]
+        pop = np.array([data[fname]['DataByTimeAndAgeBins']['Average Population by Age Bin'][:12]
+                        for fname in self.filenames])[:, :, :len(agebins)]
+        pop = np.broadcast_to(pop[:, :, np.newaxis, np.newaxis, :], infect.shape)
 
-                        d = data[fname]['DataByTimeAndInfectiousnessBinsAndPfPRBinsAndAgeBins']['Smeared Infectiousness by smeared Gametocytemia and Age Bin'][:12]
-                        infect_bin_frac = [x[infect][dens][age] for x in d]
-                        d = data[fname]['DataByTimeAndAgeBins']['Average Population by Age Bin'][:12]
-                        pop = [x[age] for x in d]
-                        simdata = pd.DataFrame({'month': range(1, 13),
-                                                'infectiousness_bin_freq': infect_bin_frac,
-                                                'Pop': pop,
-                                                })
-                        simdata['agebin'] = agebins[age]
-                        simdata['densitybin'] = gam_bins[dens]
-                        simdata['infectiousness_bin'] = frac_infected_bins[infect]
-                        simdata['year'] = year
-                        adf = pd.concat([adf, simdata])
+        # reorder to (year, age bin, density bin, infectiousness bin, month) so that rows follow the same nesting as
+        # the report loops
+        nyears, nmonths, ninfect, ndens, nages = infect.shape
+        axes_order = (0, 4, 3, 2, 1)
+        adf = pd.DataFrame({'month': np.tile(np.arange(1, nmonths + 1), nyears * nages * ndens * ninfect),
+                            'infectiousness_bin_freq': infect.transpose(axes_order).ravel(),
+                            'Pop': pop.transpose(axes_order).ravel(),
+                            'agebin': np.tile(np.repeat(np.array(agebins[:nages]), ndens * ninfect * nmonths), nyears),
+                            'densitybin': np.tile(np.repeat(np.array(gam_bins[:ndens]), ninfect * nmonths),
+                                                  nyears * nages),
+                            'infectiousness_bin': np.tile(np.repeat(np.array(frac_infected_bins[:ninfect]), nmonths),
+                                                          nyears * nages * ndens),
+                            'year': np.repeat(np.arange(self.start_year, self.start_year + nyears),
+                                              nages * ndens * ninfect * nmonths),
+                            })
 
         for sweep_var in self.sweep_variables:
             if sweep_var in simulation.tags.keys():
@@ -64,8 +75,8 @@ class InfectiousnessByParDensAgeAnalyzer(BaseAnalyzer):
             return
 
         adf = pd.concat(selected).reset_index(drop=True)
-        adf.to_csv((os.path.join(self.working_dir, self.expt_name, 'infectiousness_by_age_density_month.csv')),
-                   index=False)
+        write_analyzer_output(adf, os.path.join(self.working_dir, self.expt_name, 'infectiousness_by_age_density_month.csv'),
+                              output_format=self.output_format)
 
 
 if __name__ == '__main__':
@@ -5,10 +5,15 @@ from idmtools.core.platform_factory import Platform
 from idmtools.analysis.analyze_manager import AnalyzeManager
 from idmtools.core import ItemType
 from idmtools.entities.ianalyzer import IAnalyzer as BaseAnalyzer
+try:
+    from simulations.analyzers.analyzer_output import write_analyzer_output
+except ImportError:  # on SSMT, analyzer files are uploaded next to analyzer_output.py as top-level modules
+    from analyzer_output import write_analyzer_output
 
 
 class MonthlySummaryReportAnalyzer(BaseAnalyzer):
-    def __init__(self, expt_name, sweep_variables=None, working_dir=".", start_year=0, end_year=65):
+    def __init__(self, expt_name, sweep_variables=None, working_dir=".", start_year=0, end_year=65,
+                 output_format='csv'):
         super(MonthlySummaryReportAnalyzer, self).__init__(working_dir=working_dir,
                                                            filenames=[
                                                                "output/MalariaSummaryReport_Monthly_Report_%d.json" % x
@@ -18,6 +23,7 @@ class MonthlySummaryReportAnalyzer(BaseAnalyzer):
         self.start_year = start_year
         self.end_year = end_year
         self.working_dir = working_dir
+        self.output_format = output_format
 
     def initialize(self):
         """
@@ -64,8 +70,8 @@ class MonthlySummaryReportAnalyzer(BaseAnalyzer):
             return
 
         adf = pd.concat(selected).reset_index(drop=True)
-        adf.to_csv((os.path.join(self.working_dir, self.expt_name, 'prev_inc_by_age_month.csv')),
-                   index=False)
+        write_analyzer_output(adf, os.path.join(self.working_dir, self.expt_name, 'prev_inc_by_age_month.csv'),
+                              output_format=self.output_format)
 
 
 if __name__ == '__main__':
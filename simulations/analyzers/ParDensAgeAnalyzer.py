@@ -1,15 +1,21 @@
 import os
 import warnings
+import numpy as np
 import pandas as pd
 from logging import getLogger
 from idmtools.core.platform_factory import Platform
 from idmtools.analysis.analyze_manager import AnalyzeManager
 from idmtools.core import ItemType
 from idmtools.entities.ianalyzer import IAnalyzer as BaseAnalyzer
+try:
+    from simulations.analyzers.analyzer_output import write_analyzer_output
+except ImportError:  # on SSMT, analyzer files are uploaded next to analyzer_output.py as top-level modules
+    from analyzer_output import write_analyzer_output
 
 
 class ParDensAgeAnalyzer(BaseAnalyzer):
-    def __init__(self, expt_name, sweep_variables=None, working_dir=".", start_year=0, end_year=65):
+    def __init__(self, expt_name, sweep_variables=None, working_dir=".", start_year=0, end_year=65,
+                 output_format='csv'):
         super(ParDensAgeAnalyzer, self).__init__(working_dir=working_dir,
                                                  filenames=["output/MalariaSummaryReport_Monthly_Report_%d.json" % x
                                                             for x in range(start_year, end_year)])
@@ -18,6 +24,7 @@ class ParDensAgeAnalyzer(BaseAnalyzer):
         self.start_year = start_year
         self.end_year = end_year
         self.working_dir = working_dir
+        self.output_format = output_format
 
     def initialize(self):
         """
@@ -37,25 +44,26 @@ class ParDensAgeAnalyzer(BaseAnalyzer):
             warnings.warn("Expected the same parasite density bins for gametocytes and asexual parasites. Using bins "
                           "from asexual parasites in output, which means that gametocyte values may be incorrect.")
 
-        adf = pd.DataFrame()
-        for year, fname in zip(range(self.start_year, self.end_year), self.filenames):  # , 2020
-            for age in list(range(0, len(agebins))):
-                for dens in list(range(0, len(par_bins))):
-                    d = data[fname]['DataByTimeAndPfPRBinsAndAgeBins']['PfPR by Parasitemia and Age Bin'][:12]
-                    par_dens = [x[dens][age] for x in d]
-                    d = data[fname]['DataByTimeAndPfPRBinsAndAgeBins']['PfPR by Gametocytemia and Age Bin'][:12]
-                    gam_dens = [x[dens][age] for x in d]
-                    d = data[fname]['DataByTimeAndAgeBins']['Average Population by Age Bin'][:12]
-                    pop = [x[age] for x in d]
-                    simdata = pd.DataFrame({'month': range(1, 13),
-                                            'asexual_par_dens_freq': par_dens,
-                                            'gametocyte_dens_freq': gam_dens,
-                                            'Pop': pop,
-                                            })
-                    simdata['densitybin'] = par_bins[dens]
-                    simdata['year'] = year
-                    simdata['agebin'] = agebins[age]
-                    adf = pd.concat([adf, simdata])
+        # stack the monthly blocks from all years into arrays with dimensions (year, month, density bin, age bin)
+        par_dens = np.array([data[fname]['DataByTimeAndPfPRBinsAndAgeBins']['PfPR by Parasitemia and Age Bin'][:12]
+                             for fname in self.filenames])[:, :, :len(par_bins), :len(agebins)]
+        gam_dens = np.array([data[fname]['DataByTimeAndPfPRBinsAndAgeBins']['PfPR by Gametocytemia and Age Bin'][:12]
+                             for fname in self.filenames])[:, :, :len(par_bins), :len(agebins)]
+        pop = np.array([data[fname]['DataByTimeAndAgeBins']['Average Population by Age Bin'][:12]
+                        for fname in self.filenames])[:, :, :len(agebins)]
+        pop = np.broadcast_to(pop[:, :, np.newaxis, :], par_dens.shape)
+
+        # reorder to (year, age bin, density bin, month) so that rows follow the same nesting as the report loops
+        nyears, nmonths, ndens, nages = par_dens.shape
+        axes_order = (0, 3, 2, 1)
+        adf = pd.DataFrame({'month': np.tile(np.arange(1, nmonths + 1), nyears * nages * ndens),
+                            'asexual_par_dens_freq': par_dens.transpose(axes_order).ravel(),
+                            'gametocyte_dens_freq': gam_dens.transpose(axes_order).ravel(),
+                            'Pop': pop.transpose(axes_order).ravel(),
+                            'densitybin': np.tile(np.repeat(np.array(par_bins[:ndens]), nmonths), nyears * nages),
+                            'year': np.repeat(np.arange(self.start_year, self.start_year + nyears), nages * ndens * nmonths),
+                            'agebin': np.tile(np.repeat(np.array(agebins[:nages]), ndens * nmonths), nyears),
+                            })
 
         for sweep_var in self.sweep_variables:
             if sweep_var in simulation.tags.keys():
@@ -71,8 +79,8 @@ class ParDensAgeAnalyzer(BaseAnalyzer):
             return
 
         adf = pd.concat(selected).reset_index(drop=True)
-        adf.to_csv((os.path.join(self.working_dir, self.expt_name, 'parasite_densities_by_age_month.csv')),
-                   index=False)
+        write_analyzer_output(adf, os.path.join(self.working_dir, self.expt_name, 'parasite_densities_by_age_month.csv'),
+                              output_format=self.output_format)
 
 
 if __name__ == '__main__':
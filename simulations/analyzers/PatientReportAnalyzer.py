@@ -1,3 +1,5 @@
+import io
+import json
 import os
 import sys
 import pandas as pd
@@ -6,68 +8,150 @@ from idmtools.entities import IAnalyzer
 from idmtools.entities.simulation import Simulation
 from idmtools.analysis.platform_anaylsis import PlatformAnalysis
 from idmtools.assets import AssetCollection
+try:
+    from simulations.analyzers.analyzer_output import write_analyzer_output, write_analyzer_output_partition, \
+        clear_analyzer_output
+except ImportError:  # on SSMT, analyzer files are uploaded next to analyzer_output.py as top-level modules
+    from analyzer_output import write_analyzer_output, write_analyzer_output_partition, clear_analyzer_output
+
+try:
+    import ijson
+except ImportError:  # fall back to loading the full report with json
+    ijson = None
 
 from logging import getLogger
 logger = getLogger()
 
 
+def iter_patient_report(report):
+    """
+    Get the number of timesteps, the number of patients and an iterator over the patients of a MalariaPatientReport.
+    When the report is passed as raw bytes and ijson is available, patient_array is parsed one patient at a time, so
+    the parsed patients are never all held in memory. The patients are then counted without parsing them, from the
+    occurrences of the "initial_age" key that every patient has (which cannot occur within the channel arrays), so
+    that the output can be allocated once before the patients are parsed. The raw report bytes (as read by idmtools
+    before map is called) are still held in memory in full while the patients are iterated.
+    Args:
+        report (): contents of MalariaPatientReport.json, either as raw bytes/str or as the already-parsed dictionary
+
+    Returns: number of simulation timesteps, number of patients, iterator over patient dictionaries
+
+    """
+    if isinstance(report, dict):
+        return report['ntsteps'], len(report['patient_array']), iter(report['patient_array'])
+    if isinstance(report, str):
+        report = report.encode()
+    if ijson is None:
+        report = json.loads(report)
+        return report['ntsteps'], len(report['patient_array']), iter(report['patient_array'])
+    ntsteps = next(ijson.items(io.BytesIO(report), 'ntsteps'))
+    npatients = report.count(b'"initial_age"')
+    return int(ntsteps), npatients, ijson.items(io.BytesIO(report), 'patient_array.item', use_float=True)
+
+
 class PatientAnalyzer(IAnalyzer):
 
-    def __init__(self, expt_name, working_dir='.', start_report_day=0):
+    def __init__(self, expt_name, working_dir='.', start_report_day=0, end_report_day=None, channels=None,
+                 relative_simday=True, output_format='csv', partition_by_run=True):
+        """
+        Args:
+            expt_name (): name of the output folder (within working_dir)
+            working_dir ():
+            start_report_day (): first simulation day included in the output
+            end_report_day (): simulation day at which the output stops (exclusive). If None, report until the end of
+                the simulation.
+            channels (): patient-report channels to include in the output
+            relative_simday (): if True, simday is counted from start_report_day; otherwise it is the simulation day
+            output_format (): format of the reduce output, either 'csv' or 'parquet'
+            partition_by_run (): if True, each simulation's output is written as soon as it is parsed, to a
+                patient_reports folder partitioned by Run_Number (one file per simulation), instead of combining all
+                simulations into one file
+        """
         super(PatientAnalyzer, self).__init__(working_dir=working_dir,
-                                              filenames=['output/MalariaPatientReport.json']
+                                              filenames=['output/MalariaPatientReport.json'],
+                                              parse=False
                                               )
 
         self.expt_name = expt_name
         self.sweep_variables = ['Run_Number', 'x_Temp_LH_values', 'Site']
-        self.channels = ['true_gametocytes', 'true_asexual_parasites', 'temps']
+        self.channels = channels or ['true_gametocytes', 'true_asexual_parasites', 'temps']
         self.fields = ['id', 'initial_age'] + self.channels
         self.output_fname = os.path.join(self.working_dir, self.expt_name, "patient_reports.csv")
         self.start_report_day = start_report_day
+        self.end_report_day = end_report_day
+        self.relative_simday = relative_simday
+        self.output_format = output_format
+        self.partition_by_run = partition_by_run
 
         # make sure output folder exists
-        if not os.path.exists(os.path.join(self.working_dir, self.expt_name)):
-            os.mkdir(os.path.join(self.working_dir, self.expt_name))
+        os.makedirs(os.path.join(self.working_dir, self.expt_name), exist_ok=True)
+
+    def initialize(self):
+        # remove the outputs of earlier analyses, so that partitions of simulations that are not part of this analysis
+        # are not read with its results and the partitioned and unpartitioned outputs are never both present
+        os.makedirs(os.path.join(self.working_dir, self.expt_name), exist_ok=True)
+        clear_analyzer_output(self.output_fname)
 
     def map(self, data, simulation: Simulation):
-        patients = data[self.filenames[0]]["patient_array"]
-        ntsteps = data[self.filenames[0]]["ntsteps"]
-        npatients = len(patients)
-        logger.info('Parsing channels %s for %d patients and %d time steps',
-             self.channels, npatients, ntsteps-self.start_report_day)
-
-        # fill in long-format dataframe with patient information for each simulation day. columns are:
-        #    0) Timestep of simulation
-        #    1) Patient ID
-        #    2) Patient age
-        #    3-X) Channel values for that patient at that timestep
-        patient_info_temp = np.empty((ntsteps, 4+len(self.channels)), dtype='float')
-        patient_info_temp[:, 0] = np.arange(start=0, stop=ntsteps, step=1)  # day of simulation
-
-        birthdays = [np.round(p['birthday'], decimals=0) for p in patients]
-        initial_ages = [np.round(p['initial_age'], decimals=0) for p in patients]
-        patient_df_list = []
+        ntsteps, npatients, patients = iter_patient_report(data[self.filenames[0]])
+        end_day = ntsteps if self.end_report_day is None else min(self.end_report_day, ntsteps)
+        ndays = max(end_day - self.start_report_day, 0)
+        logger.info('Parsing channels %s for %d patients and %d time steps', self.channels, npatients, ndays)
+
+        # fill in long-format columns with patient information for each simulation day in
+        # [start_report_day, end_report_day). Each column is preallocated once for all patients (patient-major, then
+        # day) with compact dtypes and filled in place while the patients are streamed, keeping only the days in the
+        # window:
+        #    simday) Timestep of simulation
+        #    id) Patient ID
+        #    age) Patient age
+        #    birthday) Patient birthday
+        #    channels) Channel values for that patient at that timestep (NaN before the patient appears)
+        ids = np.zeros(npatients, dtype='int32')
+        birthdays = np.zeros(npatients, dtype='float32')
+        ages = np.full((npatients, ndays), np.nan, dtype='float32')
+        channel_values = np.full((len(self.channels), npatients, ndays), np.nan, dtype='float32')
+        nparsed = 0
         for i, p in enumerate(patients):
-            patient_info = patient_info_temp.copy()
-            patient_info[:, 1] = np.repeat(p['id'], ntsteps)  # patient ID
-            pos_first_data = max(birthdays[i]+1, 0)  # get day of simulation this patient appears in simulation.
-            # calculate age of patient on each day of simulation
-            patient_info[pos_first_data:, 2] = np.arange(start=initial_ages[i], stop=(initial_ages[i] + ntsteps - pos_first_data))
-            patient_info[:, 3] = np.repeat(birthdays[i], ntsteps)  # patient birthday
-            # iterate through channels, adding to data frame
+            if i >= npatients:
+                raise ValueError(f'MalariaPatientReport has more patients than the {npatients} "initial_age" keys')
+            nparsed += 1
+            ids[i] = p['id']
+            birthdays[i] = np.round(p['birthday'], decimals=0)
+            initial_age = np.round(p['initial_age'], decimals=0)
+            pos_first_data = int(max(birthdays[i]+1, 0))  # get day of simulation this patient appears in simulation.
+            first_kept_day = max(pos_first_data, self.start_report_day)
+            if first_kept_day >= end_day:
+                continue
+            offset = first_kept_day - pos_first_data  # number of this patient's values that fall before the window
+            col_first = first_kept_day - self.start_report_day
+            # calculate age of patient on each reported day of simulation
+            ages[i, col_first:] = initial_age + np.arange(offset, offset + ndays - col_first)
             for c, channel in enumerate(self.channels):
-                patient_info[pos_first_data:(pos_first_data + len(p[channel])), 4+c] = p[channel]  # Note: should be able to write "patient_info[pos_first_data:, 4+c]" but there sometimes is an issue with output length being one shorter than the simulation
-            patient_df_list.append(pd.DataFrame(data=patient_info, columns=['simday', 'id', 'age', 'birthday'] + self.channels))
-        patient_df = pd.concat(patient_df_list)
-
-        # remove any days before the start_report_day
-        patient_df['simday'] = patient_df['simday'] - self.start_report_day
-        patient_df = patient_df.loc[patient_df['simday'] >= 0]
+                # Note: channel output is sometimes one shorter than the simulation, so only fill the values present
+                values = p[channel][offset:offset + ndays - col_first]
+                channel_values[c, i, col_first:(col_first + len(values))] = values
+        if nparsed < npatients:
+            raise ValueError(f'MalariaPatientReport has {nparsed} patients but {npatients} "initial_age" keys')
+
+        first_simday = 0 if self.relative_simday else self.start_report_day
+        patient_df = pd.DataFrame({'simday': np.tile(np.arange(first_simday, first_simday + ndays, dtype='int32'),
+                                                     npatients),
+                                   'id': np.repeat(ids, ndays),
+                                   'age': ages.ravel(),
+                                   'birthday': np.repeat(birthdays, ndays)})
+        for c, channel in enumerate(self.channels):
+            patient_df[channel] = channel_values[c].ravel()
 
         for sweep_var in self.sweep_variables:
             if sweep_var in simulation.tags.keys():
                 patient_df[sweep_var] = simulation.tags[sweep_var]
 
+        if self.partition_by_run and 'Run_Number' in patient_df.columns:
+            # write this simulation's partition file now so that reduce does not need to hold all seeds in memory.
+            # Files are named by simulation id, since simulations with other sweep variables share Run_Numbers.
+            return write_analyzer_output_partition(patient_df, self.output_fname, partition_column='Run_Number',
+                                                   output_format=self.output_format, partition_id=simulation.id)
         return patient_df
 
     def reduce(self, all_data):
@@ -81,8 +165,13 @@ class PatientAnalyzer(IAnalyzer):
             data_sets_per_experiment[experiment_name].append(associated_data)
 
         for experiment_name, data_sets in data_sets_per_experiment.items():
-            d = pd.concat(data_sets).reset_index(drop=True)
-            d.to_csv(self.output_fname, index=False)
+            partition_paths = [d for d in data_sets if isinstance(d, str)]
+            if len(partition_paths) > 0:
+                logger.info('Wrote %d patient report partitions for %s', len(partition_paths), experiment_name)
+            data_sets = [d for d in data_sets if not isinstance(d, str)]
+            if len(data_sets) > 0:
+                d = pd.concat(data_sets).reset_index(drop=True)
+                write_analyzer_output(d, self.output_fname, output_format=self.output_format)
 
 
 if __name__ == '__main__':
@@ -117,6 +206,8 @@ if __name__ == '__main__':
                                             analysis_name=os.path.split(sys.argv[0])[1],
                                             tags={'WorkItem type': 'Docker'},
                                             asset_files=ac,
+                                            additional_files=[os.path.join(os.path.dirname(__file__),
+                                                                           'analyzer_output.py')],
                                             wait_till_done=True)
                 # Run analysis on COMPS
                 analysis.analyze(check_status=True)
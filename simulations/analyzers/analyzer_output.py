@@ -0,0 +1,189 @@
+import os
+import shutil
+
+import pandas as pd
+
+# columns with few distinct values that are stored as categoricals (dictionary-encoded) in parquet output
+categorical_columns = ['Site', 'agebin', 'densitybin']
+output_formats = ['csv', 'parquet']
+
+
+def write_analyzer_output(df, filepath, output_format='csv', index=False):
+    """
+    Write the output of an analyzer's reduce, either as a csv or as a parquet file with categorical columns
+    Args:
+        df (): The dataframe to save
+        filepath (): Path of the csv output file. For parquet output, the extension is replaced by '.parquet'
+        output_format (): Either 'csv' or 'parquet'
+        index (): Whether to include the dataframe index in the output file
+
+    Returns: The path of the file that was written
+
+    """
+    if output_format == 'csv':
+        df.to_csv(filepath, index=index)
+        return filepath
+    elif output_format == 'parquet':
+        filepath = os.path.splitext(filepath)[0] + '.parquet'
+        df = df.astype({col: 'category' for col in categorical_columns if col in df.columns})
+        df.to_parquet(filepath, index=index)
+        return filepath
+    else:
+        raise ValueError(f'Unsupported analyzer output format {output_format}, expected one of {output_formats}')
+
+
+def get_analyzer_output_path(filepath):
+    """
+    Get the path of an analyzer output file, preferring the parquet version of the file if it exists
+    Args:
+        filepath (): Path of the csv output file
+
+    Returns: Path of the parquet file if it exists, otherwise the csv path
+
+    """
+    parquet_filepath = os.path.splitext(filepath)[0] + '.parquet'
+    if os.path.isfile(parquet_filepath):
+        return parquet_filepath
+    return filepath
+
+
+def analyzer_output_exists(filepath):
+    """
+    Check whether an analyzer output file exists in either csv or parquet format, either as a single file or as a
+    partitioned directory
+    Args:
+        filepath (): Path of the csv output file
+
+    Returns: True if either the csv or the parquet version of the file exists, or if partitions of the file exist
+
+    """
+    return os.path.isfile(get_analyzer_output_path(filepath)) or len(get_analyzer_output_partitions(filepath)) > 0
+
+
+def get_partition_dir(filepath):
+    """
+    Get the directory holding the partitions of an analyzer output file (the csv path without its extension)
+    """
+    return os.path.splitext(filepath)[0]
+
+
+def clear_analyzer_output(filepath):
+    """
+    Remove an analyzer output written by an earlier analysis: its csv and parquet files and its partitions
+    Args:
+        filepath (): Path of the unpartitioned csv output file
+
+    """
+    for output_path in [filepath, os.path.splitext(filepath)[0] + '.parquet']:
+        if os.path.isfile(output_path):
+            os.remove(output_path)
+    partition_dir = get_partition_dir(filepath)
+    if os.path.isdir(partition_dir):
+        shutil.rmtree(partition_dir)
+
+
+def write_analyzer_output_partition(df, filepath, partition_column, output_format='csv', partition_id=None):
+    """
+    Write one partition of an analyzer output (rows sharing a value of partition_column) to
+    <filepath without extension>/<partition_column>=<value>__<partition_id>.csv (or .parquet). Several files can have
+    the same partition value (e.g., simulations with the same Run_Number and different values of other sweep
+    variables) if they have different partition ids.
+    Args:
+        df (): The dataframe with the rows of this partition
+        filepath (): Path of the unpartitioned csv output file
+        partition_column (): The column used to partition the output; must have a single value in df
+        output_format (): Either 'csv' or 'parquet'
+        partition_id (): Identifier of the file within its partition (e.g., the simulation id)
+
+    Returns: The path of the file that was written
+
+    """
+    values = df[partition_column].unique()
+    if len(values) != 1:
+        raise ValueError(f'Expected a single {partition_column} value in partition, found {len(values)}')
+    partition_dir = get_partition_dir(filepath)
+    os.makedirs(partition_dir, exist_ok=True)
+    filename = f'{partition_column}={values[0]}' + (f'__{partition_id}' if partition_id is not None else '')
+    return write_analyzer_output(df, os.path.join(partition_dir, filename + '.csv'), output_format=output_format)
+
+
+def get_analyzer_output_partitions(filepath):
+    """
+    Find the partition files written by write_analyzer_output_partition for an analyzer output
+    Args:
+        filepath (): Path of the unpartitioned csv output file
+
+    Returns: A dictionary mapping each partition value to the sorted list of paths of its files, sorted by partition
+        value. If a file exists in both formats, only its parquet version is listed (as in get_analyzer_output_path).
+
+    """
+    partition_dir = get_partition_dir(filepath)
+    if not os.path.isdir(partition_dir):
+        return {}
+    filenames = {}
+    for filename in os.listdir(partition_dir):
+        name, extension = os.path.splitext(filename)
+        if '=' not in name or extension not in ['.csv', '.parquet']:
+            continue
+        if extension == '.parquet' or name not in filenames:
+            filenames[name] = filename
+    partitions = {}
+    for name in sorted(filenames):
+        value = name.split('=', 1)[1].split('__', 1)[0]
+        value = int(value) if value.lstrip('-').isdigit() else value
+        partitions.setdefault(value, []).append(os.path.join(partition_dir, filenames[name]))
+    return dict(sorted(partitions.items()))
+
+
+def read_analyzer_output_partition(partition_paths):
+    """
+    Read the files of one partition of an analyzer output (from get_analyzer_output_partitions) into one dataframe
+    """
+    if len(partition_paths) == 1:
+        return read_analyzer_output(partition_paths[0])
+    return pd.concat([read_analyzer_output(path) for path in partition_paths]).reset_index(drop=True)
+
+
+def iter_analyzer_output_partitions(filepath, partition_column, values=None):
+    """
+    Iterate through an analyzer output one partition at a time. If the output was written as partitions, only one
+    partition's files are loaded at a time; otherwise the single output file is read once and split by
+    partition_column.
+    Args:
+        filepath (): Path of the unpartitioned csv output file
+        partition_column (): The column used to partition the output
+        values (): The subset of partition values to include. If None, all partitions are used.
+
+    Returns: Iterator of (partition value, dataframe) tuples, sorted by partition value
+
+    """
+    partitions = get_analyzer_output_partitions(filepath)
+    if len(partitions) > 0:
+        for value, partition_paths in partitions.items():
+            if values is None or value in values:
+                yield value, read_analyzer_output_partition(partition_paths)
+    else:
+        df = read_analyzer_output(filepath)
+        for value, df_cur in df.groupby(partition_column, sort=True):
+            if values is None or value in values:
+                yield value, df_cur.reset_index(drop=True)
+
+
+def read_analyzer_output(filepath):
+    """
+    Read an analyzer output file written by write_analyzer_output, using the parquet version of the file if it exists.
+    Categorical columns are converted back to the dtype of their values so that the result matches the csv version.
+    Args:
+        filepath (): Path of the csv output file
+
+    Returns: A dataframe with the analyzer output
+
+    """
+    filepath = get_analyzer_output_path(filepath)
+    if not filepath.endswith('.parquet'):
+        return pd.read_csv(filepath)
+    df = pd.read_parquet(filepath)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(df[col].cat.categories.dtype)
+    return df
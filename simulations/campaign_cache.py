@@ -0,0 +1,142 @@
+# campaign_cache.py
+#
+# This script contains the campaign cache used while creating experiments. A site's campaign depends only on its row of
+#    the simulation coordinator and on its input files (EIR, case management, NMF and survey days), not on the
+#    simulation's Run_Number, so it is built once and the serialized campaign is reused for every seed of the site.
+#    Cached campaigns are keyed by a hash of the site, its coordinator row, the contents of its input files, the schema,
+#    the campaign code and the versions of the packages that build the campaign events; changing any of them creates a
+#    new key, so outdated campaigns are never reused.
+#
+# emod_api campaigns are modules with global state: the serialized campaign holds the events and the custom events
+#    that the task adds to the config. Campaigns with implicit config functions (which cannot be serialized) are not
+#    cached.
+
+import hashlib
+import json
+import os
+from importlib.metadata import version, PackageNotFoundError
+
+import pandas as pd
+
+from simulations.input_registry import get_file_hash
+
+# increment when the serialized campaign changes so that existing cache files are not reused
+campaign_cache_version = 1
+# input files of a site's campaign (columns of the simulation coordinator)
+campaign_input_columns = ['EIR_filepath', 'CM_filepath', 'NMF_filepath', 'survey_days_filepath']
+# the campaigns are built by functions in these scripts, so changes to them invalidate the cached campaigns
+campaign_code_filepaths = [os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+                           for filename in ['helpers.py', 'campaign_compaction.py', 'daily_eir_store.py']]
+# the packages that build the campaign events, so a new version of them invalidates the cached campaigns
+campaign_packages = ['emod-api', 'emodpy', 'emodpy-malaria']
+
+# serialized campaigns loaded or saved by this process, by key
+_campaign_states = {}
+# versions of campaign_packages in this process
+_package_versions = {}
+
+
+def get_package_versions():
+    """
+    Get the installed versions of the packages that build the campaign events (looked up once per process)
+    Returns: A dictionary of the version of each package (None if the package is not installed)
+    """
+    if len(_package_versions) == 0:
+        for package in campaign_packages:
+            try:
+                _package_versions[package] = version(package)
+            except PackageNotFoundError:
+                _package_versions[package] = None
+    return dict(_package_versions)
+
+
+def get_campaign_input_filepaths(coord_row, input_files_path):
+    """
+    Get the paths of the input files used to build a site's campaign
+    Args:
+        coord_row (): The site's row of the simulation coordinator (a series)
+        input_files_path (): The directory the coordinator's filepaths are relative to
+
+    Returns: A list of the paths of the site's campaign input files
+
+    """
+    filepaths = []
+    for column in campaign_input_columns:
+        if column in coord_row.index and (not pd.isna(coord_row[column])) and (not (coord_row[column] == '')):
+            filepaths.append(os.path.join(input_files_path, coord_row[column]))
+    return filepaths
+
+
+def get_campaign_key(site, coord_row, input_filepaths, code_filepaths=()):
+    """
+    Get the key of a site's campaign in the campaign cache
+    Args:
+        site (): The site name
+        coord_row (): The site's row of the simulation coordinator (a series)
+        input_filepaths (): Paths of the input files used to build the campaign
+        code_filepaths (): Paths of other files the campaign depends on (e.g., the schema), in addition to the
+                           campaign code
+
+    Returns: A hash of the site, its coordinator row, the contents of its input and code files, and the versions of
+        the packages that build the campaign events
+
+    """
+    key = hashlib.sha256(f'{campaign_cache_version}-{site}-'.encode())
+    key.update(json.dumps(get_package_versions(), sort_keys=True).encode())
+    key.update(coord_row.to_json(default_handler=str).encode())
+    for filepath in list(input_filepaths) + list(code_filepaths) + campaign_code_filepaths:
+        key.update(f'-{os.path.basename(filepath)}-{get_file_hash(filepath)}'.encode())
+    return key.hexdigest()
+
+
+def get_campaign_state(camp):
+    """
+    Serialize a built emod_api campaign: its events and the custom events the task adds to the config
+    Returns: A json string, or None if the campaign has implicit config functions (which cannot be serialized)
+    """
+    if getattr(camp, 'implicits', None):
+        return None
+    return json.dumps({'campaign_dict': camp.campaign_dict,
+                       'adhocs': camp.get_adhocs(),
+                       'custom_coordinator_events': camp.get_custom_coordinator_events(),
+                       'custom_node_events': camp.get_custom_node_events()}, sort_keys=True)
+
+
+def restore_campaign_state(camp, campaign_state):
+    """
+    Restore a serialized campaign into an emod_api campaign that was just reset (e.g., by campaign.set_schema)
+    Returns: The campaign
+    """
+    state = json.loads(campaign_state)
+    camp.campaign_dict.clear()
+    camp.campaign_dict.update(state['campaign_dict'])
+    camp.get_adhocs().update(state['adhocs'])
+    camp.custom_coordinator_events.extend(state['custom_coordinator_events'])
+    camp.custom_node_events.extend(state['custom_node_events'])
+    return camp
+
+
+def load_cached_campaign(campaign_cache_dir, key):
+    """
+    Load a serialized campaign from this process or from the campaign cache
+    Returns: The serialized campaign, or None if it is not in the cache
+    """
+    if key not in _campaign_states:
+        try:
+            with open(os.path.join(campaign_cache_dir, key + '.json'), 'r') as f:
+                _campaign_states[key] = f.read()
+        except FileNotFoundError:
+            return None
+    return _campaign_states[key]
+
+
+def save_cached_campaign(campaign_cache_dir, key, campaign_state):
+    """
+    Save a serialized campaign to the campaign cache
+    """
+    _campaign_states[key] = campaign_state
+    os.makedirs(campaign_cache_dir, exist_ok=True)
+    cache_filepath = os.path.join(campaign_cache_dir, key + '.json')
+    with open(cache_filepath + '.tmp', 'w') as f:
+        f.write(campaign_state)
+    os.replace(cache_filepath + '.tmp', cache_filepath)
@@ -0,0 +1,210 @@
+# campaign_compaction.py
+#
+# This script plans the case management events of a campaign from its case management (CM) and non-malarial fever
+#    (NMF) tables. The tables are validated as a whole, and adjacent CM rows giving the same treatment are merged so
+#    that each period of constant treatment is a single treatment-seeking event, however finely the CM time series is
+#    given.
+#
+# NMF treatment is given every day while a CM row is in effect, as a drug campaign repeated daily. An event can only be
+#    repeated up to the schema's maximum Number_Repetitions, so long periods need several events. The compact plan only
+#    splits the merged periods at the schema's maximum, instead of creating a new event every 1000 days for each row.
+
+import functools
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# maximum Number_Repetitions assumed if it is not in the schema (and the period length of the uncompacted events)
+default_max_repetitions = 1000
+nmf_event_plan_columns = ['start_day', 'repetitions', 'drug_code', 'agemin', 'agemax', 'coverage']
+# age groups of NMF treatment: (agemin, agemax, case management coverage column, NMF rate column)
+nmf_age_groups = [(0, 5, 'U5_coverage', 'U5_nmf'), (5, 120, 'adult_coverage', 'adult_nmf')]
+case_management_coverage_columns = ['U5_coverage', 'adult_coverage', 'severe_coverage']
+case_management_columns = ['simday', 'duration'] + case_management_coverage_columns + ['drug_code']
+# drugs given for each drug code of the case management tables
+case_management_drugs = {'AL': ['Artemether', 'Lumefantrine'],
+                         'SP': ['Sulfadoxine', 'Pyrimethamine'],
+                         'CQ': ['Chloroquine']}
+
+
+@functools.lru_cache()
+def get_max_repetitions(schema_filepath):
+    """
+    Get the maximum Number_Repetitions of a drug campaign's event coordinator from the schema
+    """
+    with open(schema_filepath, 'r') as f:
+        schema = json.load(f)
+    try:
+        coordinator = schema['idmTypes']['idmAbstractType:EventCoordinator'][
+            'StandardInterventionDistributionEventCoordinator']
+        return int(coordinator['Number_Repetitions']['max'])
+    except KeyError:
+        return default_max_repetitions
+
+
+def validate_case_management(hs_df):
+    """
+    Check a case management table: its coverages are probabilities, its rows start on non-negative days, last for a
+    positive number of days (or -1, until the end of the simulation) and do not overlap
+    Args:
+        hs_df (): Case management dataframe (with simday, duration, U5_coverage, adult_coverage and severe_coverage
+                  columns, and optionally drug_code)
+
+    Returns: The table's case management columns, sorted by simday, with a drug_code column ('AL' if not given)
+
+    """
+    missing_columns = [column for column in case_management_columns[:-1] if column not in hs_df.columns]
+    if missing_columns:
+        raise ValueError(f'The case management table is missing the columns {missing_columns}')
+    hs_df = hs_df.reindex(columns=case_management_columns).sort_values('simday', kind='stable')
+    hs_df['drug_code'] = hs_df['drug_code'].fillna('AL')
+    unknown_drug_codes = sorted(set(hs_df['drug_code']) - set(case_management_drugs))
+    if unknown_drug_codes:
+        warnings.warn(f'Drug codes {unknown_drug_codes} not recognized. Assuming AL.')
+
+    coverages = hs_df[case_management_coverage_columns].to_numpy(dtype=float)
+    if not ((coverages >= 0) & (coverages <= 1)).all():
+        raise ValueError('Case management coverages must be between 0 and 1')
+    start_days = hs_df['simday'].to_numpy(dtype=float)
+    durations = hs_df['duration'].to_numpy(dtype=float)
+    if not ((start_days >= 0) & ((durations > 0) | (durations == -1))).all():
+        raise ValueError('Case management rows must start on day 0 or later and have a positive duration (or -1)')
+    # each row ends before the next one starts (a row lasting until the end of the simulation can only be the last)
+    end_days = np.where(durations == -1, np.inf, start_days + durations)
+    if (end_days[:-1] > start_days[1:]).any():
+        raise ValueError('Case management rows must not overlap')
+    return hs_df.reset_index(drop=True)
+
+
+def validate_nmf_rates(nmf_row):
+    """
+    Check that the daily NMF probability of each age group is between 0 and 1
+    """
+    nmf_rates = nmf_row[[nmf_column for _, _, _, nmf_column in nmf_age_groups]].to_numpy(dtype=float)
+    if not ((nmf_rates >= 0) & (nmf_rates <= 1)).all():
+        raise ValueError('NMF rates must be between 0 and 1')
+    return nmf_row
+
+
+def merge_adjacent_rows(periods_df, value_columns, start_column='start_day', duration_column='duration'):
+    """
+    Merge consecutive periods that have the same values and where each starts on the day the previous one ends
+    Args:
+        periods_df (): Dataframe of periods, sorted by start day. A duration of -1 lasts until the end of the
+                       simulation.
+        value_columns (): The columns whose values must be the same for periods to be merged
+        start_column (): The column with the start day of each period
+        duration_column (): The column with the duration of each period
+
+    Returns: A dataframe with the merged periods (the values of the first row of each merged period, and the total
+        duration)
+
+    """
+    if len(periods_df) < 2:
+        return periods_df.reset_index(drop=True)
+    start_days = periods_df[start_column].to_numpy()
+    durations = periods_df[duration_column].to_numpy()
+    continues = (durations[:-1] >= 0) & (start_days[:-1] + durations[:-1] == start_days[1:])
+    for column in value_columns:
+        values = periods_df[column].to_numpy()
+        continues &= values[1:] == values[:-1]
+    period_ids = np.concatenate([[0], np.cumsum(~continues)])
+    merged = periods_df.groupby(period_ids, sort=False).first()
+    merged_durations = periods_df[duration_column].groupby(period_ids, sort=False)
+    merged[duration_column] = np.where(merged_durations.min() < 0, -1, merged_durations.sum())
+    return merged.reset_index(drop=True)
+
+
+def get_case_management_plan(hs_df, compact=True):
+    """
+    Plan the treatment-seeking events of a case management table
+    Args:
+        hs_df (): Case management dataframe
+        compact (): If True, adjacent rows with the same coverages and drug are merged into one event
+
+    Returns: A dataframe with one row (simday, duration, coverages and drug_code) for each treatment-seeking period
+
+    """
+    hs_df = validate_case_management(hs_df)
+    if compact:
+        hs_df = merge_adjacent_rows(hs_df, case_management_coverage_columns + ['drug_code'],
+                                    start_column='simday', duration_column='duration')
+    return hs_df
+
+
+def get_nmf_periods(hs_df):
+    """
+    Get the days on which each case management row treats NMFs. A start day of 0 is not supported by the dtk's
+    diagnosis/treatment configuration, so rows starting on day 0 start looking for NMFs on day 1 instead.
+    Args:
+        hs_df (): Case management dataframe (with simday, duration, U5_coverage and adult_coverage columns, and
+                  optionally drug_code)
+
+    Returns: A dataframe with the start day, duration and drug code of each row
+
+    """
+    periods = pd.DataFrame({'start_day': hs_df['simday'].to_numpy(),
+                            'duration': hs_df['duration'].to_numpy(),
+                            'drug_code': hs_df['drug_code'].to_numpy() if 'drug_code' in hs_df.columns else 'AL'},
+                           index=hs_df.index)
+    starts_on_day_0 = periods['start_day'] == 0
+    periods.loc[starts_on_day_0 & (periods['duration'] > 1), 'duration'] -= 1
+    periods.loc[starts_on_day_0, 'start_day'] = 1
+    return periods
+
+
+def split_period(start_day, duration, max_repetitions):
+    """
+    Split a period of daily treatment into events of at most max_repetitions days
+    Returns: A list of (start day, repetitions) of the events
+    """
+    num_full = int(np.floor(duration / max_repetitions))
+    separate_durations = [max_repetitions] * num_full
+    # the uncompacted events add a final period whenever the duration is positive, even if it is empty
+    if duration - num_full > 0:
+        separate_durations = separate_durations + [int(duration - num_full * max_repetitions)]
+    separate_start_days = start_day + np.array([0] + list(np.cumsum(separate_durations)))
+    return list(zip(separate_start_days[:len(separate_durations)], separate_durations))
+
+
+def get_nmf_event_plan(hs_df, nmf_row, compact=True, max_repetitions=default_max_repetitions):
+    """
+    Plan the drug campaign events that treat NMFs over a case management table
+    Args:
+        hs_df (): Case management dataframe
+        nmf_row (): Series with the daily NMF probability of each age group (U5_nmf and adult_nmf)
+        compact (): If True, adjacent rows with the same treatment are merged and only split at max_repetitions days.
+                    If False, each row has an event for every 1000 days (the events created before compaction).
+        max_repetitions (): The maximum Number_Repetitions of an event (from get_max_repetitions)
+
+    Returns: A dataframe with one row per event: its start day, number of daily repetitions, drug code, age group and
+        coverage (the probability of having a treated NMF each day)
+
+    """
+    events = []
+    if not compact:
+        periods = get_nmf_periods(hs_df)
+        for r, period in periods.iterrows():
+            for start_day, repetitions in split_period(period['start_day'], period['duration'],
+                                                       default_max_repetitions):
+                for agemin, agemax, coverage_column, nmf_column in nmf_age_groups:
+                    coverage = nmf_row[nmf_column] * hs_df.at[r, coverage_column]
+                    if coverage > 0:
+                        events.append([start_day, repetitions, period['drug_code'], agemin, agemax, coverage])
+        return pd.DataFrame(events, columns=nmf_event_plan_columns)
+
+    hs_df = validate_case_management(hs_df)
+    periods = get_nmf_periods(hs_df)
+    validate_nmf_rates(nmf_row)
+    for agemin, agemax, coverage_column, nmf_column in nmf_age_groups:
+        group_periods = periods.assign(coverage=nmf_row[nmf_column] * hs_df[coverage_column].to_numpy())
+        group_periods = group_periods[(group_periods['coverage'] > 0) & (group_periods['duration'] >= 1)]
+        merged = merge_adjacent_rows(group_periods, ['drug_code', 'coverage'])
+        for start_day, duration, drug_code, coverage in merged.itertuples(index=False):
+            for event_start_day, repetitions in split_period(start_day, int(duration), max_repetitions):
+                if repetitions > 0:
+                    events.append([event_start_day, repetitions, drug_code, agemin, agemax, coverage])
+    events = pd.DataFrame(events, columns=nmf_event_plan_columns)
+    return events.sort_values(['start_day', 'agemin'], kind='stable').reset_index(drop=True)
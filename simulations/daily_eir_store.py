@@ -0,0 +1,145 @@
+# daily_eir_store.py
+#
+# This script contains the daily EIR store: a compact binary file (npz) with the EIRs of each site over a year. The
+#    store is built from the EIR csvs of the simulation coordinator, which have either monthly EIRs (12 rows) or daily
+#    EIRs (365 rows), and keeps each site's EIRs at the resolution of its csv: monthly EIRs are given to
+#    add_scheduled_input_eir as monthly_eir (as they were before the store) and daily EIRs as daily_eir. The store
+#    records a hash of the csv each site was read from, and is rebuilt when any of these csvs changes. It is loaded
+#    once per process and provides the EIRs given to add_scheduled_input_eir and the annual EIRs used to set maternal
+#    antibodies.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from simulations.input_registry import load_input_csv, get_file_hash
+
+months_per_year = 12
+days_per_year = 365
+
+# daily EIR stores loaded by this process, by (absolute path, modification time)
+_daily_eir_stores = {}
+
+
+def read_site_eir(eir_filepath, site):
+    """
+    Read a site's EIRs from an EIR csv with a column for each site and a row for each month of a year (12 rows) or for
+    each day of a year (365 rows). Other layouts (e.g., several years of monthly EIRs) are not supported yet.
+    Returns: An array of the site's 12 monthly EIRs or of its 365 daily EIRs
+    """
+    eir_values = load_input_csv(eir_filepath)[site].to_numpy(dtype=float)
+    if len(eir_values) not in [months_per_year, days_per_year]:
+        raise ValueError(f'{eir_filepath} has {len(eir_values)} EIRs for {site}, expected 12 monthly or 365 daily '
+                         f'EIRs')
+    return eir_values
+
+
+def get_eir_sources(coord_df, input_files_path):
+    """
+    Get the EIR csv of each site of the simulation coordinator that has EIRs in its csv
+    Returns: A dictionary of the path of each site's EIR csv (relative to input_files_path), by site
+    """
+    eir_sources = {}
+    for site in coord_df.index:
+        eir_filename = coord_df.at[site, 'EIR_filepath']
+        if (not pd.isna(eir_filename)) and (not (eir_filename == '')) and \
+                site in load_input_csv(os.path.join(input_files_path, eir_filename), nrows=0).columns:
+            eir_sources[site] = eir_filename
+    return eir_sources
+
+
+def build_daily_eir_store(coord_df, input_files_path, store_filepath):
+    """
+    Build the daily EIR store of the sites of a simulation coordinator. Sites of an existing store that are not in the
+    coordinator (e.g., sites of another coordinator) are kept.
+    Args:
+        coord_df (): Simulation coordinator dataframe (indexed by site)
+        input_files_path (): The directory the coordinator's filepaths are relative to
+        store_filepath (): Path of the npz file to create
+
+    Returns: The daily EIR store: a dictionary with the EIRs (an array with a row per site, where the first 12
+        values of the sites with monthly EIRs are used), the list of sites, and the EIR csv, its hash and the number of
+        EIRs (12 or 365) for each site
+
+    """
+    eir_sources = get_eir_sources(coord_df, input_files_path)
+    sites = list(eir_sources.keys())
+    eirs = np.zeros((len(sites), days_per_year))
+    sources = {}
+    for ii, site in enumerate(sites):
+        eir_filepath = os.path.join(input_files_path, eir_sources[site])
+        site_eirs = read_site_eir(eir_filepath, site)
+        eirs[ii, :len(site_eirs)] = site_eirs
+        sources[site] = [eir_sources[site], get_file_hash(eir_filepath), len(site_eirs)]
+    previous_store = load_daily_eir_store(store_filepath)
+    if previous_store is not None:
+        kept_sites = [site for site in previous_store['sites'] if site not in coord_df.index]
+        kept_rows = [previous_store['sites'].index(site) for site in kept_sites]
+        eirs = np.concatenate([eirs, previous_store['eirs'][kept_rows]])
+        sites = sites + kept_sites
+        sources.update({site: previous_store['sources'][site] for site in kept_sites})
+
+    os.makedirs(os.path.dirname(os.path.abspath(store_filepath)), exist_ok=True)
+    with open(store_filepath + '.tmp', 'wb') as f:
+        np.savez(f, eirs=eirs, sites=np.array(sites, dtype=str), sources=np.array(json.dumps(sources)))
+    os.replace(store_filepath + '.tmp', store_filepath)
+    return {'eirs': eirs, 'sites': sites, 'sources': sources}
+
+
+def load_daily_eir_store(store_filepath):
+    """
+    Load a daily EIR store, reading the file only if it was not loaded by this process (or if it changed since)
+    Returns: The daily EIR store (see build_daily_eir_store), or None if the file does not exist
+    """
+    if not os.path.exists(store_filepath):
+        return None
+    key = (os.path.abspath(store_filepath), os.stat(store_filepath).st_mtime_ns)
+    if key not in _daily_eir_stores:
+        with np.load(store_filepath) as store:
+            if 'eirs' not in store:  # a store written before monthly EIRs were kept monthly
+                return None
+            _daily_eir_stores[key] = {'eirs': store['eirs'],
+                                      'sites': store['sites'].tolist(),
+                                      'sources': json.loads(store['sources'].item())}
+    return _daily_eir_stores[key]
+
+
+def is_store_current(store, site, coord_df, input_files_path):
+    """
+    Check whether a daily EIR store has a site's EIRs from the site's current EIR csv
+    """
+    if store is None or site not in store['sources']:
+        return False
+    eir_filename, eir_hash, _ = store['sources'][site]
+    return eir_filename == coord_df.at[site, 'EIR_filepath'] and \
+        eir_hash == get_file_hash(os.path.join(input_files_path, eir_filename))
+
+
+def get_site_eir(site, coord_df, input_files_path, store_filepath):
+    """
+    Get a site's EIRs from the daily EIR store, (re)building the store if it does not have the site's EIRs from its
+    current EIR csv
+    Args:
+        site (): The site name
+        coord_df (): Simulation coordinator dataframe (indexed by site)
+        input_files_path (): The directory the coordinator's filepaths are relative to
+        store_filepath (): Path of the daily EIR store
+
+    Returns: An array of the site's 12 monthly EIRs or 365 daily EIRs, as in its EIR csv
+
+    """
+    store = load_daily_eir_store(store_filepath)
+    if not is_store_current(store, site, coord_df, input_files_path):
+        store = build_daily_eir_store(coord_df, input_files_path, store_filepath)
+        if site not in store['sites']:
+            raise ValueError(f"No EIRs for {site} in {coord_df.at[site, 'EIR_filepath']}")
+    return store['eirs'][store['sites'].index(site), :store['sources'][site][2]].copy()
+
+
+def get_annual_eir(site, coord_df, input_files_path, store_filepath):
+    """
+    Get a site's annual EIR (the sum of its monthly or daily EIRs) from the daily EIR store
+    """
+    return float(sum(get_site_eir(site, coord_df, input_files_path, store_filepath).tolist()))
@@ -1,7 +1,6 @@
 import os
 import warnings
 import pandas as pd
-import numpy as np
 from functools import partial
 import emod_api.demographics.Demographics as Demographics
 
@@ -14,6 +13,12 @@ from emodpy_malaria.interventions.treatment_seeking import add_treatment_seeking
 from emodpy_malaria.interventions.inputeir import add_scheduled_input_eir
 from emod_api.interventions.common import BroadcastEvent
 import simulations.manifest as manifest
+from simulations.input_registry import load_input_csv
+from simulations.campaign_cache import get_campaign_input_filepaths, get_campaign_key, get_campaign_state, \
+    restore_campaign_state, load_cached_campaign, save_cached_campaign
+from simulations.daily_eir_store import get_site_eir, get_annual_eir
+from simulations.campaign_compaction import get_case_management_plan, get_nmf_event_plan, get_max_repetitions, \
+    case_management_drugs
 
 
 def update_sim_random_seed(simulation, value):
@@ -83,7 +88,7 @@ def set_param_fn(config):
 
 def set_simulation_scenario(simulation, site, csv_path):
     # get information on this simulation setup from coordinator csv
-    coord_df = pd.read_csv(csv_path)
+    coord_df = load_input_csv(csv_path)
     coord_df = coord_df.set_index('site')
 
     # === set up config === #
@@ -100,25 +105,25 @@ def set_simulation_scenario(simulation, site, csv_path):
         simulation.task.config.parameters.Age_Initialization_Distribution_Type = 'DISTRIBUTION_COMPLEX'
     else:
         simulation.task.config.parameters.Age_Initialization_Distribution_Type = 'DISTRIBUTION_SIMPLE'
-    # maternal antibodies - use first 12 months of data frame to get annual EIR from monthly eir
-    monthly_eirs = pd.read_csv(manifest.input_files_path / coord_df.at[site, 'EIR_filepath'])
-    update_mab(simulation, mAb_vs_EIR(sum(monthly_eirs.loc[monthly_eirs.index[0:12], site])))
+    # maternal antibodies - use the annual EIR of the site's monthly or daily EIRs
+    update_mab(simulation, mAb_vs_EIR(get_annual_eir(site, coord_df, manifest.input_files_path,
+                                                     str(manifest.daily_eir_store_path))))
 
     # === set up campaigns === #
-    build_camp_partial = partial(build_camp, site=site, coord_df=coord_df)
+    build_camp_partial = partial(build_site_campaign, site=site, coord_df=coord_df)
     simulation.task.create_campaign_from_callback(build_camp_partial)
 
     # === set up reporters === #
     report_start_day = int(coord_df.at[site, 'report_start_day'])
     if (not pd.isna(coord_df.at[site, 'par_dens_bins'])) and (not (coord_df.at[site, 'par_dens_bins'] == '')):
-        density_bins_df = pd.read_csv(manifest.input_files_path / 'report_density_bins' / 'density_bin_sets.csv')
+        density_bins_df = load_input_csv(manifest.input_files_path / 'report_density_bins' / 'density_bin_sets.csv')
         density_bins_df = density_bins_df[coord_df.at[site, 'par_dens_bins']].tolist()
         density_bins_df = [x for x in density_bins_df if pd.notnull(x)]
     else:
         density_bins_df = [0, 50, 500, 5000, 5000000]
     if coord_df.at[site, 'include_AnnualMalariaSummaryReport']:
         if (not pd.isna(coord_df.at[site, 'annual_summary_report_age_bins'])) and (not (coord_df.at[site, 'annual_summary_report_age_bins'] == '')):
-            summary_report_age_bins_df = pd.read_csv(manifest.input_files_path / 'summary_report_age_bins' / 'age_bin_sets.csv')
+            summary_report_age_bins_df = load_input_csv(manifest.input_files_path / 'summary_report_age_bins' / 'age_bin_sets.csv')
             summary_report_age_bins = summary_report_age_bins_df[coord_df.at[site, 'annual_summary_report_age_bins']].tolist()
             summary_report_age_bins = [x for x in summary_report_age_bins if pd.notnull(x)]
         else:
@@ -132,7 +137,7 @@ def set_simulation_scenario(simulation, site, csv_path):
 
     if coord_df.at[site, 'include_MonthlyMalariaSummaryReport']:
         if (not pd.isna(coord_df.at[site, 'monthly_summary_report_age_bins'])) and (not (coord_df.at[site, 'monthly_summary_report_age_bins'] == '')):
-            summary_report_age_bins_df = pd.read_csv(manifest.input_files_path / 'summary_report_age_bins' / 'age_bin_sets.csv')
+            summary_report_age_bins_df = load_input_csv(manifest.input_files_path / 'summary_report_age_bins' / 'age_bin_sets.csv')
             summary_report_age_bins = summary_report_age_bins_df[coord_df.at[site, 'monthly_summary_report_age_bins']].tolist()
             summary_report_age_bins = [x for x in summary_report_age_bins if pd.notnull(x)]
         else:
@@ -177,7 +182,7 @@ def build_standard_campaign_object(manifest):
 
 
 # def build_camp(site, cross_sectional_surveys=False, survey_days=None):
-def build_camp(site, coord_df):
+def build_camp(site, coord_df, compact=True):
     """
     Build a campaign input file for the DTK using emod_api.
     Right now this function creates the file and returns the filename. If calling code just needs an asset that's fine.
@@ -187,30 +192,34 @@ def build_camp(site, coord_df):
 
     # === EIR === #
 
-    # set monthly eir for site - TODO - change to daily EIR
-    monthly_eirs = pd.read_csv(manifest.input_files_path / coord_df.at[site, 'EIR_filepath'])
-    # TODO - currently recycles first 12 values; should update to use multiple years if provided
-    add_scheduled_input_eir(camp, monthly_eir=monthly_eirs.loc[monthly_eirs.index[0:12], site].tolist(),
-                            start_day=0, age_dependence="SURFACE_AREA_DEPENDENT")
+    # set monthly or daily eir for site, depending on whether the site's EIR csv has monthly or daily values
+    # TODO - currently recycles the first year of values; should update to use multiple years if provided
+    site_eirs = get_site_eir(site, coord_df, manifest.input_files_path, str(manifest.daily_eir_store_path))
+    if len(site_eirs) == 12:
+        add_scheduled_input_eir(camp, monthly_eir=site_eirs.tolist(), start_day=0,
+                                age_dependence="SURFACE_AREA_DEPENDENT")
+    else:
+        add_scheduled_input_eir(camp, daily_eir=site_eirs.tolist(), start_day=0,
+                                age_dependence="SURFACE_AREA_DEPENDENT")
 
     # === INTERVENTIONS === #
 
     # health-seeking
     if (not pd.isna(coord_df.at[site, 'CM_filepath'])) and (not (coord_df.at[site, 'CM_filepath'] == '')):
-        hs_df = pd.read_csv(manifest.input_files_path / coord_df.at[site, 'CM_filepath'])
+        hs_df = load_input_csv(manifest.input_files_path / coord_df.at[site, 'CM_filepath'])
     else:
         hs_df = pd.DataFrame()
     # NMFs
     if (not pd.isna(coord_df.at[site, 'NMF_filepath'])) and (not (coord_df.at[site, 'NMF_filepath'] == '')):
-        nmf_df = pd.read_csv(manifest.input_files_path / coord_df.at[site, 'NMF_filepath'])
+        nmf_df = load_input_csv(manifest.input_files_path / coord_df.at[site, 'NMF_filepath'])
     else:
         nmf_df = pd.DataFrame()
 
     if not hs_df.empty:
         # case management for malaria
-        add_hfca_hs(camp, hs_df)
+        add_hfca_hs(camp, hs_df, compact=compact)
         # case management for NMFs
-        add_nmf_hs(camp, hs_df, nmf_df)
+        add_nmf_hs(camp, hs_df, nmf_df, compact=compact)
 
 
     # === SURVEYS === #
@@ -219,14 +228,35 @@ def build_camp(site, coord_df):
     if coord_df.at[site, 'include_parDensSurveys'] and (not pd.isna(coord_df.at[site, 'include_parDensSurveys'])):
         # adding schema file, so it can be looked up when creating the campaigns
         camp.schema_path = manifest.schema_file
-        survey_days = pd.read_csv(manifest.input_files_path / coord_df.at[site, 'survey_days_filepath']).loc['days']
+        survey_days = load_input_csv(manifest.input_files_path / coord_df.at[site, 'survey_days_filepath']).loc['days']
         add_broadcasting_survey(camp, survey_days=survey_days)
 
     return camp
 
 
-def add_hfca_hs(camp, hs_df):
-    for r, row in hs_df.iterrows() :
+def build_site_campaign(site, coord_df):
+    """
+    Get the campaign of a site, building it with build_camp only if it is not in the campaign cache. The campaign does
+    not depend on the simulation's Run_Number, so it is built once and reused for every seed of the site.
+    """
+    if manifest.campaign_cache_dir is None:
+        return build_camp(site, coord_df)
+    input_filepaths = get_campaign_input_filepaths(coord_df.loc[site], manifest.input_files_path)
+    key = get_campaign_key(site, coord_df.loc[site], input_filepaths,
+                           code_filepaths=[manifest.schema_file])
+    campaign_state = load_cached_campaign(manifest.campaign_cache_dir, key)
+    if campaign_state is not None:
+        return restore_campaign_state(build_standard_campaign_object(manifest), campaign_state)
+    camp = build_camp(site, coord_df)
+    campaign_state = get_campaign_state(camp)
+    if campaign_state is not None:
+        save_cached_campaign(manifest.campaign_cache_dir, key, campaign_state)
+    return camp
+
+
+def add_hfca_hs(camp, hs_df, compact=True):
+    # the whole table is validated, and adjacent rows with the same treatment are merged into one event if compact
+    for r, row in get_case_management_plan(hs_df, compact=compact).iterrows():
         add_hs_from_file(camp, row)
 
 
@@ -240,15 +270,11 @@ def add_hs_from_file(camp, row):
         drug_code = row['drug_code']
     else:
         drug_code = 'AL'
-    if drug_code == 'AL':
-        drug = ['Artemether', 'Lumefantrine']
-    elif drug_code == 'SP':
-        drug = ['Sulfadoxine', 'Pyrimethamine']
-    elif drug_code == 'CQ':
-        drug = ['Chloroquine']
+    if drug_code in case_management_drugs:
+        drug = case_management_drugs[drug_code]
     else:
         warnings.warn('Drug code not recognized. Assuming AL.')
-        drug = ['Artemether', 'Lumefantrine']
+        drug = case_management_drugs['AL']
 
     add_treatment_seeking(camp, start_day=start_day,
                           targets=[{'trigger': 'NewClinicalCase', 'coverage': hs_child, 'agemin': 0, 'agemax': 5,
@@ -261,7 +287,7 @@ def add_hs_from_file(camp, row):
                           drug=drug, duration=duration)  # , broadcast_event_name='Received_Severe_Treatment')
 
 
-def add_nmf_hs(camp, hs_df, nmf_df):
+def add_nmf_hs(camp, hs_df, nmf_df, compact=True):
     # if no NMF rate is specified, assume all age groups have 0.0038 probability each day
     if nmf_df.empty:
         nmf_df = pd.DataFrame({'U5_nmf': [0.0038], 'adult_nmf': [0.0038]})
@@ -270,46 +296,32 @@ def add_nmf_hs(camp, hs_df, nmf_df):
     nmf_row = nmf_df.iloc[0]
 
     # apply the health-seeking rate for clinical malaria to NMFs
-    for r, row in hs_df.iterrows():
-        add_nmf_hs_from_file(camp, row, nmf_row)
+    if compact:
+        # merge adjacent rows with the same treatment into events repeated up to the schema's maximum
+        nmf_events = get_nmf_event_plan(hs_df, nmf_row, compact=True,
+                                        max_repetitions=get_max_repetitions(str(manifest.schema_file)))
+        add_nmf_events(camp, nmf_events)
+    else:
+        for r, row in hs_df.iterrows():
+            add_nmf_hs_from_file(camp, row, nmf_row)
 
 
 def add_nmf_hs_from_file(camp, row, nmf_row):
-    hs_child = row['U5_coverage']
-    hs_adult = row['adult_coverage']
-    start_day = row['simday']
-    duration = row['duration']
-    if 'drug_code' in row.index:
-        drug_code = row['drug_code']
-    else:
-        drug_code = 'AL'
-    if start_day == 0:  # due to dtk diagnosis/treatment configuration, a start day of 0 is not supported
-        start_day = 1  # start looking for NMFs on day 1 (not day 0) of simulation
-        if duration > 1:
-            duration = duration - 1
-    nmf_child = nmf_row['U5_nmf']
-    nmf_adult = nmf_row['adult_nmf']
-
     # workaround for maximum duration of 1000 days is to loop, creating a new campaign every 1000 days
-    separate_durations = [1000] * int(np.floor(duration/1000))  # create a separate campaign for each 1000 day period
-    if (duration - np.floor(duration/1000) > 0):  # add final remaining non-1000-day duration
-        separate_durations = separate_durations + [int(duration - np.floor(duration/1000) * 1000)]
-    separate_start_days = start_day + np.array([0] + list(np.cumsum(separate_durations)))
-    for dd in range(len(separate_durations)):
-        if nmf_child * hs_child > 0:
-            add_drug_campaign(camp, 'MSAT', drug_code=drug_code, start_days=[separate_start_days[dd]],
-                              target_group={'agemin': 0, 'agemax': 5},
-                              coverage=nmf_child * hs_child,
-                              repetitions=separate_durations[dd], tsteps_btwn_repetitions=1,
-                              diagnostic_type='PF_HRP2', diagnostic_threshold=5,
-                              receiving_drugs_event_name='Received_NMF_Treatment')
-        if nmf_adult * hs_adult > 0:
-            add_drug_campaign(camp, 'MSAT', drug_code=drug_code, start_days=[separate_start_days[dd]],
-                              target_group={'agemin': 5, 'agemax': 120},
-                              coverage=nmf_adult * hs_adult,
-                              repetitions=separate_durations[dd], tsteps_btwn_repetitions=1,
-                              diagnostic_type='PF_HRP2', diagnostic_threshold=5,
-                              receiving_drugs_event_name='Received_NMF_Treatment')
+    add_nmf_events(camp, get_nmf_event_plan(pd.DataFrame([row]), nmf_row, compact=False))
+
+
+def add_nmf_events(camp, nmf_events):
+    """
+    Add the drug campaigns treating NMFs planned by get_nmf_event_plan
+    """
+    for event in nmf_events.itertuples(index=False):
+        add_drug_campaign(camp, 'MSAT', drug_code=event.drug_code, start_days=[event.start_day],
+                          target_group={'agemin': event.agemin, 'agemax': event.agemax},
+                          coverage=event.coverage,
+                          repetitions=event.repetitions, tsteps_btwn_repetitions=1,
+                          diagnostic_type='PF_HRP2', diagnostic_threshold=5,
+                          receiving_drugs_event_name='Received_NMF_Treatment')
 
 
 def ptr_config_builder(params):
@@ -358,7 +370,7 @@ def get_comps_id_filename(site: str, level: int = 0):
 
 def load_coordinator_df(characteristic=False, set_index=True):
     csv_file = manifest.sweep_sim_coordinator_path if characteristic else manifest.simulation_coordinator_path
-    coord_df = pd.read_csv(csv_file)
+    coord_df = load_input_csv(csv_file)
     if set_index:
         coord_df = coord_df.set_index('site')
     return coord_df
@@ -0,0 +1,83 @@
+# input_registry.py
+#
+# This script contains the input registry used while creating experiments. Setting up each simulation of a sweep
+#    (set_simulation_scenario and build_camp) reads the simulation coordinator and the EIR, case management, NMF and
+#    report bin csvs of its site; the registry reads each of these files once per process and keeps the dataframe,
+#    keyed by the file's path and modification time so that a changed file is read again. Callers get a copy of the
+#    kept dataframe, so the registry's dataframes are never modified. The registry also keeps the hashes of the input
+#    files (used to key the campaign cache and the daily EIR store), so that each file is hashed once per process.
+
+import hashlib
+import os
+
+import pandas as pd
+
+# dataframes read from input files, keyed by (absolute path, modification time, read_csv arguments)
+_input_registry = {}
+# number of input files read from disk and number of loads served from the registry
+_input_registry_counts = {'reads': 0, 'hits': 0}
+# hashes of input files, keyed by (absolute path, modification time, size)
+_file_hashes = {}
+
+
+def get_input_key(filepath, **read_kwargs):
+    """
+    Get the key of an input file in the input registry: its absolute path, its modification time, and the read_csv
+    arguments used to read it
+    """
+    filepath = os.path.abspath(filepath)
+    return filepath, os.stat(filepath).st_mtime_ns, tuple(sorted(read_kwargs.items()))
+
+
+def load_input_csv(filepath, **read_kwargs):
+    """
+    Load an input csv, reading it only if it is not in the input registry (or if it changed since it was read)
+    Args:
+        filepath (): Path of the csv
+        **read_kwargs (): Other arguments of pd.read_csv
+
+    Returns: A copy of the dataframe read from the csv
+
+    """
+    key = get_input_key(filepath, **read_kwargs)
+    if key in _input_registry:
+        _input_registry_counts['hits'] += 1
+    else:
+        # remove the dataframes read from previous versions of the file
+        for old_key in [old_key for old_key in _input_registry if old_key[0] == key[0] and old_key[2] == key[2]]:
+            del _input_registry[old_key]
+        _input_registry[key] = pd.read_csv(key[0], **read_kwargs)
+        _input_registry_counts['reads'] += 1
+    return _input_registry[key].copy()
+
+
+def get_file_hash(filepath):
+    """
+    Get the sha256 hash of a file's contents, computing it only if the file was not hashed by this process (or if it
+    changed since)
+    """
+    stat = os.stat(filepath)
+    key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+    if key not in _file_hashes:
+        file_hash = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                file_hash.update(chunk)
+        _file_hashes[key] = file_hash.hexdigest()
+    return _file_hashes[key]
+
+
+def get_input_registry_counts():
+    """
+    Get the number of input files read from disk and the number of loads served from the input registry
+    """
+    return dict(_input_registry_counts)
+
+
+def clear_input_registry():
+    """
+    Remove all dataframes and file hashes from the input registry and reset its counts
+    """
+    _input_registry.clear()
+    _file_hashes.clear()
+    _input_registry_counts.update(reads=0, hits=0)
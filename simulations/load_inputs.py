@@ -1,6 +1,6 @@
-import pandas as pd
 import simulations.manifest as manifest
 from simulations.helpers import load_coordinator_df
+from simulations.input_registry import load_input_csv
 
 
 def load_sites():
@@ -9,7 +9,7 @@ def load_sites():
     coord_df = load_coordinator_df(characteristic=False, set_index=True)
     unfiltered_sites = coord_df.index.tolist()
     for site in unfiltered_sites:
-        eir_df = pd.read_csv(manifest.input_files_path / coord_df.at[site, 'EIR_filepath'])
+        eir_df = load_input_csv(manifest.input_files_path / coord_df.at[site, 'EIR_filepath'])
         if site not in eir_df.columns or "?" in site or not coord_df.at[site, 'include_site']:
             skipped_sites.append(site)
     coord_df = coord_df[~coord_df.index.isin(skipped_sites)]
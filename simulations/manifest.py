@@ -44,6 +44,12 @@ base_script_plot_filepath = PROJECT_DIR / "create_plots"
 base_reference_filepath = PROJECT_DIR / "reference_datasets"
 plot_output_filepath = PROJECT_DIR / "report" / "_plots"
 python_plot_output_filepath = PROJECT_DIR / "report" / "_plots_Python"
+# format of the analyzer output files: 'csv' or 'parquet' (smaller and faster to read; requires pyarrow)
+analyzer_output_format = 'csv'
+# daily EIRs of each site, built from the EIR csvs of the simulation coordinators
+daily_eir_store_path = input_files_path / "daily_eirs" / "daily_eir_store.npz"
+# campaigns built for a site are saved here and reused for all of its seeds (set to None to build every campaign)
+campaign_cache_dir = CURRENT_DIR / ".campaign_cache"
 
 
 # TODO: remove following lines
@@ -0,0 +1,49 @@
+import argparse
+import json
+
+import pandas as pd
+
+from simulations.helpers import build_camp, load_coordinator_df
+from simulations.load_inputs import load_sites
+
+
+def get_campaign_size(camp):
+    """
+    Get the number of events of a built campaign and the size (in bytes) of its campaign.json
+    """
+    campaign_json = json.dumps(camp.campaign_dict, sort_keys=True, indent=4)
+    return len(camp.campaign_dict['Events']), len(campaign_json.encode())
+
+
+def report_campaign_compaction():
+    """
+    Build the campaign of each site included in the simulation coordinator with and without the compaction of the case
+    management and NMF events and compare their sizes
+    Returns: A dataframe with the number of events and the campaign.json size of each site's campaign before and after
+        compaction
+
+    """
+    coord_df = load_coordinator_df(characteristic=False, set_index=True)
+    sites, _, _, _ = load_sites()
+    rows = []
+    for site in sites:
+        events_before, bytes_before = get_campaign_size(build_camp(site, coord_df, compact=False))
+        events_after, bytes_after = get_campaign_size(build_camp(site, coord_df, compact=True))
+        rows.append({'site': site, 'events_before': events_before, 'events_after': events_after,
+                     'campaign_bytes_before': bytes_before, 'campaign_bytes_after': bytes_after})
+    report_df = pd.DataFrame(rows)
+    print(report_df.to_string(index=False))
+    print(f"Total: {report_df['events_before'].sum()} -> {report_df['events_after'].sum()} events, "
+          f"{report_df['campaign_bytes_before'].sum() / 2 ** 20:.1f} -> "
+          f"{report_df['campaign_bytes_after'].sum() / 2 ** 20:.1f} MB of campaign.json")
+    return report_df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare campaign sizes with and without compacted case management')
+    parser.add_argument('--output', '-o', type=str, default=None, help='csv file to save the report to')
+    args = parser.parse_args()
+
+    report = report_campaign_compaction()
+    if args.output is not None:
+        report.to_csv(args.output, index=False)
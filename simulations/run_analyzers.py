@@ -10,6 +10,7 @@ from simulations.analyzers.ParDensAgeAnalyzer import ParDensAgeAnalyzer
 from simulations.analyzers.InfectiousnessByParDensAgeAnalyzer import InfectiousnessByParDensAgeAnalyzer
 from simulations.analyzers.PatientReportAnalyzer import PatientAnalyzer
 from simulations.analyzers.MonthlySummaryReportAnalyzer import MonthlySummaryReportAnalyzer
+import simulations.analyzers.analyzer_output as analyzer_output
 from simulations.wait_for_experiment import check_experiment
 
 
@@ -44,31 +45,37 @@ def run_analyzers(site: str, characteristic: bool = False) -> (bool, str):
                 analyzer_args.append({'expt_name': site,
                                       'sweep_variables': ['Run_Number', 'Site'],
                                       'start_year': int(report_start_day / 365),
-                                      'end_year': int(coord_df.at[site, 'simulation_duration'] / 365)})
+                                      'end_year': int(coord_df.at[site, 'simulation_duration'] / 365),
+                                      'output_format': manifest.analyzer_output_format})
             if coord_df.at[site, 'infectiousness_to_mosquitos']:
                 analyzers.append(InfectiousnessByParDensAgeAnalyzer)
                 analyzer_args.append({'expt_name': site,
                                       'sweep_variables': ['Run_Number', 'Site'],
                                       'start_year': int(report_start_day / 365),
-                                      'end_year': int(coord_df.at[site, 'simulation_duration'] / 365)})
+                                      'end_year': int(coord_df.at[site, 'simulation_duration'] / 365),
+                                      'output_format': manifest.analyzer_output_format})
             if coord_df.at[site, 'age_prevalence']:
                 analyzers.append(MonthlySummaryReportAnalyzer)
                 analyzer_args.append({'expt_name': site,
                                       'sweep_variables': ['Run_Number', 'Site'],
                                       'start_year': int(report_start_day / 365),
-                                      'end_year': int(coord_df.at[site, 'simulation_duration'] / 365)})
+                                      'end_year': int(coord_df.at[site, 'simulation_duration'] / 365),
+                                      'output_format': manifest.analyzer_output_format})
         if coord_df.at[site, 'include_AnnualMalariaSummaryReport']:
             analyzers.append(AnnualSummaryReportAnalyzer)
             analyzer_args.append({'expt_name': site,
-                                  'sweep_variables': ['Run_Number', 'Site']})
+                                  'sweep_variables': ['Run_Number', 'Site'],
+                                  'output_format': manifest.analyzer_output_format})
         if coord_df.at[site, 'include_MalariaPatientReport']:  # infection duration
             analyzers.append(PatientAnalyzer)
             analyzer_args.append({'expt_name': site,
-                                  'start_report_day': report_start_day})
+                                  'start_report_day': report_start_day,
+                                  'output_format': manifest.analyzer_output_format})
 
         analysis = PlatformAnalysis(platform=platform, experiment_ids=[exp_id],
                                     analyzers=analyzers,
                                     analyzers_args=analyzer_args,
+                                    additional_files=[analyzer_output.__file__],
                                     analysis_name=site)
 
         suite_id = get_suite_id()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import argparse
+import time
 
 # idmtools
 from idmtools.builders import SimulationBuilder
@@ -12,6 +13,7 @@ from emodpy_malaria.reporters.builtin import add_report_intervention_pop_avg
 
 from simulations.helpers import set_param_fn, update_sim_random_seed, set_simulation_scenario_for_characteristic_site, \
     set_simulation_scenario_for_matched_site, get_comps_id_filename
+from simulations.input_registry import get_input_registry_counts
 
 import simulations.params as params
 from simulations import manifest as manifest
@@ -28,10 +30,15 @@ def submit_sim(site=None, nSims=1, characteristic=False, priority=manifest.prior
     platform = Platform(my_manifest.platform_name, endpoint=my_manifest.endpoint, environment=my_manifest.environment, priority=priority, node_group=my_manifest.node_group)
     print("Prompting for COMPS creds if necessary...")
 
+    start_time = time.perf_counter()
     experiment = create_exp(characteristic, nSims, site, my_manifest, not_use_singularity)
 
     # The last step is to call run() on the ExperimentManager to run the simulations.
     experiment.run(wait_until_done=False, platform=platform)
+    # simulations are created (and their input files loaded) when the experiment is run
+    input_counts = get_input_registry_counts()
+    print(f"Created and submitted {nSims} simulations in {time.perf_counter() - start_time:.1f}s "
+          f"(input files: {input_counts['reads']} read, {input_counts['hits']} loaded from the input registry)")
 
     # Save experiment id to file
     comps_id_file = get_comps_id_filename(site=site)
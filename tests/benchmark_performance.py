@@ -0,0 +1,126 @@
+# benchmark_performance.py
+#
+# This script times the optimized implementations against the legacy implementations kept in the unit tests (which
+#    check that both give the same results). It is not part of the unit tests; run it from the tests folder with the
+#    names of the benchmarks to run (all benchmarks are run if no name is given):
+#        python benchmark_performance.py par_dens_map
+
+import argparse
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from create_plots.helpers_likelihood_and_metrics import get_prev_loglikelihood, get_dens_loglikelihood, \
+    get_dens_loglikelihood_table
+from create_plots.helpers_plot_ref_sim_comparisons import get_time_pos
+from simulations.analyzers.ParDensAgeAnalyzer import ParDensAgeAnalyzer
+from test_analyzers import make_monthly_summary_report, legacy_par_dens_map, to_csv_string
+from test_infection_duration import reference_path, legacy_get_time_pos, make_simulated_surveys
+from test_likelihood import make_combined_prevalence, legacy_get_prev_loglikelihood, make_combined_density, \
+    legacy_get_dens_loglikelihood
+
+
+def time_call(func, *args, **kwargs):
+    """
+    Call a function and measure how long it takes
+    Returns: The function's result and the elapsed time (in seconds)
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def report_speedup(description, legacy_time, new_time, new_label='vectorized', legacy_label='legacy'):
+    print(f'{description}: {legacy_label} {legacy_time:.2f}s, {new_label} {new_time:.3f}s '
+          f'({legacy_time / new_time:.0f}x speedup)')
+
+
+def benchmark_par_dens_map():
+    # ParDensAgeAnalyzer.map on a synthetic 65-year MalariaSummaryReport
+    rng = np.random.default_rng(0)
+    simulation = SimpleNamespace(tags={'Run_Number': 3, 'Site': 'test_site'})
+    analyzer = ParDensAgeAnalyzer(expt_name='test_site', sweep_variables=['Run_Number', 'Site'], start_year=0,
+                                  end_year=65)
+    data = {fname: make_monthly_summary_report(rng, [1, 5, 10, 15, 20, 40, 60, 1000],
+                                               [0, 50, 200, 500, 2000, 5000, 2000000])
+            for fname in analyzer.filenames}
+    new_df, new_time = time_call(analyzer.map, data, simulation)
+    legacy_df, legacy_time = time_call(legacy_par_dens_map, analyzer, data, simulation)
+    assert to_csv_string(new_df) == to_csv_string(legacy_df)
+    report_speedup('ParDensAgeAnalyzer.map on a 65-year report', legacy_time, new_time, new_label='array-backed')
+
+
+def benchmark_time_pos():
+    # get_time_pos on the Navrongo infection duration reference and 10 simulated seeds
+    rng = np.random.default_rng(0)
+    pos_thresh_dens = 39
+    ref_df = pd.read_csv(reference_path)
+    ref_df['date'] = pd.to_datetime(ref_df['date'])
+    sim_df = make_simulated_surveys(ref_df, rng, n_seeds=10)
+
+    def get_both_time_pos(get_time_pos_function):
+        return [get_time_pos_function(ref_df, pos_thresh_dens), get_time_pos_function(sim_df, pos_thresh_dens)]
+
+    new_dfs, new_time = time_call(get_both_time_pos, get_time_pos)
+    legacy_dfs, legacy_time = time_call(get_both_time_pos, legacy_get_time_pos)
+    for new_df, legacy_df in zip(new_dfs, legacy_dfs):
+        pd.testing.assert_frame_equal(new_df.reset_index(drop=True), legacy_df.reset_index(drop=True),
+                                      check_dtype=False)
+    report_speedup('get_time_pos on the Navrongo reference and 10 simulated seeds', legacy_time, new_time)
+
+
+def benchmark_prev_loglikelihood():
+    # get_prev_loglikelihood on 2000 site-months with 8 age groups each
+    combined_df = make_combined_prevalence(np.random.default_rng(0), nsites=2000)
+    new_df, new_time = time_call(get_prev_loglikelihood, combined_df.copy())
+    legacy_df, legacy_time = time_call(legacy_get_prev_loglikelihood, combined_df.copy())
+    pd.testing.assert_frame_equal(new_df, legacy_df, check_dtype=False)
+    report_speedup('get_prev_loglikelihood for 2000 site-months', legacy_time, new_time)
+
+
+def benchmark_dens_loglikelihood():
+    # get_dens_loglikelihood on 500 site-months with 4 age groups of 6 density bins each
+    combined_df = make_combined_density(np.random.default_rng(0), nsites=500)
+    new_df, new_time = time_call(get_dens_loglikelihood, combined_df.copy())
+    legacy_df, legacy_time = time_call(legacy_get_dens_loglikelihood, combined_df.copy())
+    pd.testing.assert_frame_equal(new_df, legacy_df, check_dtype=False)
+    report_speedup('get_dens_loglikelihood for 500 site-months', legacy_time, new_time)
+
+
+def benchmark_loglikelihood_table():
+    # get_dens_loglikelihood_table for 300 simulations against one get_dens_loglikelihood call per simulation
+    rng = np.random.default_rng(0)
+    combined_df = make_combined_density(rng, nsites=100)
+    sim_values = rng.dirichlet(np.ones(6), (len(combined_df) // 6, 300)).transpose(0, 2, 1).reshape(-1, 300)
+    table, table_time = time_call(get_dens_loglikelihood_table, combined_df, sim_values=sim_values)
+
+    def get_single_columns():
+        return [get_dens_loglikelihood(combined_df.assign(simulation=sim_values[:, ii])) for ii in range(300)]
+
+    singles, single_time = time_call(get_single_columns)
+    for ii, single in enumerate(singles):
+        np.testing.assert_allclose(table.loc[ii].to_numpy(), single['loglikelihood'].to_numpy())
+    report_speedup('Density loglikelihoods of 300 simulations for 100 site-months', single_time, table_time,
+                   new_label='one table', legacy_label='one get_dens_loglikelihood call per simulation')
+
+
+benchmarks = {'par_dens_map': benchmark_par_dens_map,
+              'time_pos': benchmark_time_pos,
+              'prev_loglikelihood': benchmark_prev_loglikelihood,
+              'dens_loglikelihood': benchmark_dens_loglikelihood,
+              'loglikelihood_table': benchmark_loglikelihood_table}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time optimized implementations against their legacy versions')
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run, from {list(benchmarks.keys())} (all if none '
+                                                 f'are given)')
+    args = parser.parse_args()
+    unknown_names = [name for name in args.names if name not in benchmarks]
+    if unknown_names:
+        parser.error(f'unknown benchmarks: {unknown_names}')
+
+    for name in args.names or list(benchmarks.keys()):
+        benchmarks[name]()
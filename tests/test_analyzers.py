@@ -0,0 +1,445 @@
+import importlib.util
+import io
+import json
+import tempfile
+import os
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from BaseTest import BaseTest
+
+from simulations.analyzers.InfectiousnessByParDensAgeAnalyzer import InfectiousnessByParDensAgeAnalyzer
+from simulations.analyzers.ParDensAgeAnalyzer import ParDensAgeAnalyzer
+from simulations.analyzers.PatientReportAnalyzer import PatientAnalyzer
+from simulations.analyzers import PatientReportAnalyzer_laterDays
+from simulations.analyzers.analyzer_output import read_analyzer_output, analyzer_output_exists, \
+    iter_analyzer_output_partitions, write_analyzer_output_partition, get_analyzer_output_partitions
+
+
+class MockSimulation:
+    """
+    Minimal stand-in for an idmtools Simulation (hashable, with an id, tags and an experiment name)
+    """
+    def __init__(self, tags, experiment_name='test_site', sim_id=None):
+        self.id = sim_id if sim_id is not None else f"sim_{len(tags)}_{'_'.join(str(v) for v in tags.values())}"
+        self.tags = tags
+        self.experiment = SimpleNamespace(name=experiment_name)
+
+
+def make_monthly_summary_report(rng, age_bins, dens_bins, n_months=13):
+    """
+    Build a synthetic MalariaSummaryReport json (as parsed by idmtools) with the channels used by the monthly analyzers
+    """
+    n_ages = len(age_bins)
+    n_dens = len(dens_bins)
+    return {'Metadata': {'Age Bins': age_bins,
+                         'Parasitemia Bins': dens_bins,
+                         'Gametocytemia Bins': dens_bins},
+            'DataByTimeAndPfPRBinsAndAgeBins': {
+                'PfPR by Parasitemia and Age Bin': rng.random((n_months, n_dens, n_ages)).tolist(),
+                'PfPR by Gametocytemia and Age Bin': rng.random((n_months, n_dens, n_ages)).tolist()},
+            'DataByTimeAndAgeBins': {
+                'Average Population by Age Bin': rng.integers(0, 100, (n_months, n_ages)).astype(float).tolist()}}
+
+
+def make_infectiousness_report(rng, age_bins, dens_bins, infect_bins, n_months=13):
+    """
+    Build a synthetic MalariaSummaryReport json with the channels used by InfectiousnessByParDensAgeAnalyzer
+    """
+    n_ages = len(age_bins)
+    return {'Metadata': {'Age Bins': age_bins,
+                         'Gametocytemia Bins': dens_bins,
+                         'Infectiousness Bins': infect_bins},
+            'DataByTimeAndInfectiousnessBinsAndPfPRBinsAndAgeBins': {
+                'Smeared Infectiousness by smeared Gametocytemia and Age Bin':
+                    rng.random((n_months, len(infect_bins), len(dens_bins), n_ages)).tolist()},
+            'DataByTimeAndAgeBins': {
+                'Average Population by Age Bin': rng.integers(0, 100, (n_months, n_ages)).astype(float).tolist()}}
+
+
+def legacy_par_dens_map(analyzer, data, simulation):
+    # row-by-row implementation of ParDensAgeAnalyzer.map used as the reference output
+    agebins = data[analyzer.filenames[0]]['Metadata']['Age Bins']
+    par_bins = data[analyzer.filenames[0]]['Metadata']['Parasitemia Bins']
+    adf = pd.DataFrame()
+    for year, fname in zip(range(analyzer.start_year, analyzer.end_year), analyzer.filenames):
+        for age in list(range(0, len(agebins))):
+            for dens in list(range(0, len(par_bins))):
+                d = data[fname]['DataByTimeAndPfPRBinsAndAgeBins']['PfPR by Parasitemia and Age Bin'][:12]
+                par_dens = [x[dens][age] for x in d]
+                d = data[fname]['DataByTimeAndPfPRBinsAndAgeBins']['PfPR by Gametocytemia and Age Bin'][:12]
+                gam_dens = [x[dens][age] for x in d]
+                d = data[fname]['DataByTimeAndAgeBins']['Average Population by Age Bin'][:12]
+                pop = [x[age] for x in d]
+                simdata = pd.DataFrame({'month': range(1, 13),
+                                        'asexual_par_dens_freq': par_dens,
+                                        'gametocyte_dens_freq': gam_dens,
+                                        'Pop': pop,
+                                        })
+                simdata['densitybin'] = par_bins[dens]
+                simdata['year'] = year
+                simdata['agebin'] = agebins[age]
+                adf = pd.concat([adf, simdata])
+    for sweep_var in analyzer.sweep_variables:
+        if sweep_var in simulation.tags.keys():
+            adf[sweep_var] = simulation.tags[sweep_var]
+    return adf
+
+
+def legacy_infectiousness_map(analyzer, data, simulation):
+    # row-by-row implementation of InfectiousnessByParDensAgeAnalyzer.map used as the reference output
+    agebins = data[analyzer.filenames[0]]['Metadata']['Age Bins']
+    gam_bins = data[analyzer.filenames[0]]['Metadata']['Gametocytemia Bins']
+    frac_infected_bins = data[analyzer.filenames[0]]['Metadata']['Infectiousness Bins']
+    adf = pd.DataFrame()
+    for year, fname in zip(range(analyzer.start_year, analyzer.end_year), analyzer.filenames):
+        for age in list(range(0, len(agebins))):
+            for dens in list(range(0, len(gam_bins))):
+                for infect in list(range(0, len(frac_infected_bins))):
+                    d = data[fname]['DataByTimeAndInfectiousnessBinsAndPfPRBinsAndAgeBins']['Smeared Infectiousness by smeared Gametocytemia and Age Bin'][:12]
+                    infect_bin_frac = [x[infect][dens][age] for x in d]
+                    d = data[fname]['DataByTimeAndAgeBins']['Average Population by Age Bin'][:12]
+                    pop = [x[age] for x in d]
+                    simdata = pd.DataFrame({'month': range(1, 13),
+                                            'infectiousness_bin_freq': infect_bin_frac,
+                                            'Pop': pop,
+                                            })
+                    simdata['agebin'] = agebins[age]
+                    simdata['densitybin'] = gam_bins[dens]
+                    simdata['infectiousness_bin'] = frac_infected_bins[infect]
+                    simdata['year'] = year
+                    adf = pd.concat([adf, simdata])
+    for sweep_var in analyzer.sweep_variables:
+        if sweep_var in simulation.tags.keys():
+            adf[sweep_var] = simulation.tags[sweep_var]
+    return adf
+
+
+def to_csv_string(df):
+    buffer = io.StringIO()
+    df.reset_index(drop=True).to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+class ParDensAgeAnalyzerTest(BaseTest):
+    def setUp(self) -> None:
+        super(ParDensAgeAnalyzerTest, self).setUp()
+        self.rng = np.random.default_rng(0)
+        self.simulation = SimpleNamespace(tags={'Run_Number': 3, 'Site': 'test_site'})
+        self.age_bins = [1, 5, 10, 15, 20, 40, 60, 1000]
+        self.dens_bins = [0, 50, 200, 500, 2000, 5000, 2000000]
+
+    def get_analyzer_and_data(self, end_year):
+        analyzer = ParDensAgeAnalyzer(expt_name='test_site', sweep_variables=['Run_Number', 'Site'],
+                                      start_year=0, end_year=end_year)
+        data = {fname: make_monthly_summary_report(self.rng, self.age_bins, self.dens_bins)
+                for fname in analyzer.filenames}
+        return analyzer, data
+
+    def test_map_matches_legacy_csv(self):
+        analyzer, data = self.get_analyzer_and_data(end_year=3)
+        new_df = analyzer.map(data, self.simulation)
+        legacy_df = legacy_par_dens_map(analyzer, data, self.simulation)
+        self.assertListEqual(list(new_df.columns), list(legacy_df.columns))
+        self.assertEqual(to_csv_string(new_df), to_csv_string(legacy_df))
+
+    def test_map_matches_legacy_csv_65_years(self):
+        analyzer, data = self.get_analyzer_and_data(end_year=65)
+        new_df = analyzer.map(data, self.simulation)
+        legacy_df = legacy_par_dens_map(analyzer, data, self.simulation)
+        self.assertEqual(to_csv_string(new_df), to_csv_string(legacy_df))
+
+
+class InfectiousnessByParDensAgeAnalyzerTest(BaseTest):
+    def setUp(self) -> None:
+        super(InfectiousnessByParDensAgeAnalyzerTest, self).setUp()
+        self.rng = np.random.default_rng(1)
+        self.simulation = SimpleNamespace(tags={'Run_Number': 0, 'Site': 'test_site'})
+        self.age_bins = [5, 15, 20, 1000]
+        self.dens_bins = [0, 50, 500, 5000, 2000000]
+        self.infect_bins = [0, 5, 20, 50, 80, 100]
+
+    def test_map_matches_legacy_csv(self):
+        analyzer = InfectiousnessByParDensAgeAnalyzer(expt_name='test_site', sweep_variables=['Run_Number', 'Site'],
+                                                      start_year=2, end_year=5)
+        data = {fname: make_infectiousness_report(self.rng, self.age_bins, self.dens_bins, self.infect_bins)
+                for fname in analyzer.filenames}
+        new_df = analyzer.map(data, self.simulation)
+        legacy_df = legacy_infectiousness_map(analyzer, data, self.simulation)
+        self.assertListEqual(list(new_df.columns), list(legacy_df.columns))
+        self.assertEqual(to_csv_string(new_df), to_csv_string(legacy_df))
+
+
+def make_patient_report(rng, npatients, ntsteps, birthdays):
+    """
+    Build a synthetic MalariaPatientReport json where each patient's channels start on the day after their birthday
+    """
+    patients = []
+    for i in range(npatients):
+        ndata = max(ntsteps - int(max(birthdays[i] + 1, 0)) - (i % 2), 0)  # some channels are one day short
+        patients.append({'id': i + 1,
+                         'birthday': birthdays[i],
+                         'initial_age': float(rng.integers(0, 20000)),
+                         'true_gametocytes': rng.integers(0, 1000, ndata).astype(float).tolist(),
+                         'true_asexual_parasites': rng.integers(0, 100000, ndata).astype(float).tolist(),
+                         'temps': (37 + 3 * rng.random(ndata)).tolist()})
+    return {'ntsteps': ntsteps, 'patient_array': patients}
+
+
+def legacy_patient_map(analyzer, data, simulation):
+    # per-patient implementation of PatientAnalyzer.map used as the reference output. Cells before a patient's first
+    # data are filled with NaN here (rather than left uninitialized) so that outputs can be compared.
+    patients = data[analyzer.filenames[0]]["patient_array"]
+    ntsteps = data[analyzer.filenames[0]]["ntsteps"]
+    patient_info_temp = np.full((ntsteps, 4+len(analyzer.channels)), np.nan, dtype='float')
+    patient_info_temp[:, 0] = np.arange(start=0, stop=ntsteps, step=1)
+    birthdays = [np.round(p['birthday'], decimals=0) for p in patients]
+    initial_ages = [np.round(p['initial_age'], decimals=0) for p in patients]
+    patient_df_list = []
+    for i, p in enumerate(patients):
+        patient_info = patient_info_temp.copy()
+        patient_info[:, 1] = np.repeat(p['id'], ntsteps)
+        pos_first_data = int(max(birthdays[i]+1, 0))
+        patient_info[pos_first_data:, 2] = np.arange(start=initial_ages[i], stop=(initial_ages[i] + ntsteps - pos_first_data))
+        patient_info[:, 3] = np.repeat(birthdays[i], ntsteps)
+        for c, channel in enumerate(analyzer.channels):
+            patient_info[pos_first_data:(pos_first_data + len(p[channel])), 4+c] = p[channel]
+        patient_df_list.append(pd.DataFrame(data=patient_info, columns=['simday', 'id', 'age', 'birthday'] + analyzer.channels))
+    patient_df = pd.concat(patient_df_list)
+    patient_df['simday'] = patient_df['simday'] - analyzer.start_report_day
+    patient_df = patient_df.loc[patient_df['simday'] >= 0]
+    for sweep_var in analyzer.sweep_variables:
+        if sweep_var in simulation.tags.keys():
+            patient_df[sweep_var] = simulation.tags[sweep_var]
+    return patient_df
+
+
+class PatientAnalyzerTest(BaseTest):
+    def setUp(self) -> None:
+        super(PatientAnalyzerTest, self).setUp()
+        self.rng = np.random.default_rng(2)
+        self.simulation = SimpleNamespace(tags={'Run_Number': 1, 'Site': 'test_site'})
+        self.ntsteps = 400
+        self.start_report_day = 150
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.working_dir = temp_dir.name
+
+    def get_analyzer(self):
+        analyzer = PatientAnalyzer(expt_name='test_site', working_dir=self.working_dir,
+                                   start_report_day=self.start_report_day, partition_by_run=False)
+        return analyzer
+
+    def test_map_matches_legacy_values(self):
+        birthdays = [-3000.4, -1.2, -250.0, -10.6]
+        data = {'output/MalariaPatientReport.json': make_patient_report(self.rng, 4, self.ntsteps, birthdays)}
+        analyzer = self.get_analyzer()
+        new_df = analyzer.map(data, self.simulation)
+        legacy_df = legacy_patient_map(analyzer, data, self.simulation).reset_index(drop=True)
+        self.assertListEqual(list(new_df.columns), list(legacy_df.columns))
+        pd.testing.assert_frame_equal(new_df, legacy_df, check_dtype=False, rtol=1e-6)
+
+    def test_map_compact_dtypes_and_report_window(self):
+        birthdays = [-500.0, 20.0, 200.3, 1000.0]  # born before, before and during the report window, and never
+        data = {'output/MalariaPatientReport.json': make_patient_report(self.rng, 4, self.ntsteps, birthdays)}
+        patients = data['output/MalariaPatientReport.json']['patient_array']
+        patient_df = self.get_analyzer().map(data, self.simulation)
+
+        ndays = self.ntsteps - self.start_report_day
+        self.assertEqual(len(patient_df), 4 * ndays)
+        self.assertEqual(patient_df['simday'].dtype, np.int32)
+        self.assertEqual(patient_df['id'].dtype, np.int32)
+        for channel in ['age', 'birthday', 'true_gametocytes', 'true_asexual_parasites', 'temps']:
+            self.assertEqual(patient_df[channel].dtype, np.float32)
+        self.assertEqual(patient_df['simday'].min(), 0)
+
+        # patient born on day 20 reports its values from start_report_day onward
+        p2 = patient_df[patient_df['id'] == 2]
+        offset = self.start_report_day - 21
+        np.testing.assert_allclose(p2['true_asexual_parasites'].values[:-1],
+                                   patients[1]['true_asexual_parasites'][offset:], rtol=1e-6)
+        self.assertTrue(np.isnan(p2['true_asexual_parasites'].values[-1]))
+        self.assertEqual(p2['age'].values[0], np.round(patients[1]['initial_age']) + offset)
+
+        # patient born during the report window has no values before its birth
+        p3 = patient_df[patient_df['id'] == 3]
+        first_day = 201 - self.start_report_day
+        self.assertTrue(p3['temps'].iloc[:first_day].isna().all())
+        np.testing.assert_allclose(p3['temps'].values[first_day:], patients[2]['temps'], rtol=1e-6)
+
+        # patient born after the end of the simulation has no values at all
+        self.assertTrue(patient_df[patient_df['id'] == 4]['temps'].isna().all())
+
+    def test_map_streams_requested_window(self):
+        birthdays = [-500.0, 20.0, 200.3, 1000.0]
+        report = make_patient_report(self.rng, 4, self.ntsteps, birthdays)
+        full_df = self.get_analyzer().map({'output/MalariaPatientReport.json': report}, self.simulation)
+
+        end_report_day = 300
+        analyzer = PatientAnalyzer(expt_name='test_site', working_dir=self.working_dir,
+                                   start_report_day=self.start_report_day, end_report_day=end_report_day,
+                                   channels=['true_asexual_parasites'], partition_by_run=False)
+        self.assertFalse(analyzer.parse)
+        window_df = analyzer.map({'output/MalariaPatientReport.json': json.dumps(report).encode()}, self.simulation)
+
+        expected_df = full_df.loc[full_df['simday'] < end_report_day - self.start_report_day,
+                                  ['simday', 'id', 'age', 'birthday', 'true_asexual_parasites', 'Run_Number', 'Site']]
+        pd.testing.assert_frame_equal(window_df, expected_df.reset_index(drop=True))
+
+    def test_later_days_analyzer_reports_simulation_day(self):
+        birthdays = [-500.0, 20.0]
+        data = {'output/MalariaPatientReport.json': make_patient_report(self.rng, 2, self.ntsteps, birthdays)}
+        relative_df = self.get_analyzer().map(data, self.simulation)
+        analyzer = PatientReportAnalyzer_laterDays.PatientAnalyzer(dir_name='test_site', working_dir=self.working_dir,
+                                                                   start_report_day=self.start_report_day)
+        absolute_df = analyzer.map(data, self.simulation)
+        np.testing.assert_array_equal(absolute_df['simday'], relative_df['simday'] + self.start_report_day)
+        pd.testing.assert_frame_equal(absolute_df.drop(columns='simday'), relative_df.drop(columns='simday'))
+
+    def test_map_writes_one_partition_per_run(self):
+        analyzer = PatientAnalyzer(expt_name='test_site', working_dir=self.working_dir,
+                                   start_report_day=self.start_report_day)
+        all_data = {}
+        expected_dfs = {}
+        for run_number in [2, 0, 1]:
+            data = {'output/MalariaPatientReport.json': make_patient_report(self.rng, 3, self.ntsteps,
+                                                                            [-500.0, 20.0, 200.3])}
+            simulation = MockSimulation(tags={'Run_Number': run_number, 'Site': 'test_site'})
+            all_data[simulation] = analyzer.map(data, simulation)
+            self.assertIsInstance(all_data[simulation], str)
+            self.assertTrue(os.path.isfile(all_data[simulation]))
+            expected_dfs[run_number] = self.get_analyzer().map(data, simulation)
+        analyzer.reduce(all_data)
+
+        output_fname = os.path.join(self.working_dir, 'test_site', 'patient_reports.csv')
+        self.assertFalse(os.path.isfile(output_fname))
+        self.assertTrue(analyzer_output_exists(output_fname))
+        partitions = list(iter_analyzer_output_partitions(output_fname, partition_column='Run_Number'))
+        self.assertListEqual([seed for seed, _ in partitions], [0, 1, 2])
+        for seed, partition_df in partitions:
+            pd.testing.assert_frame_equal(partition_df, pd.read_csv(io.StringIO(to_csv_string(expected_dfs[seed]))))
+
+        selected = list(iter_analyzer_output_partitions(output_fname, partition_column='Run_Number', values=[1]))
+        self.assertEqual(len(selected), 1)
+        self.assertEqual(selected[0][0], 1)
+
+    def test_partitions_keep_simulations_with_the_same_run_number(self):
+        # simulations with the same Run_Number and different values of another sweep variable
+        analyzer = PatientAnalyzer(expt_name='test_site', working_dir=self.working_dir,
+                                   start_report_day=self.start_report_day)
+        analyzer.initialize()
+        all_data = {}
+        expected_dfs = []
+        for lh_value in [0.1, 0.2]:
+            data = {'output/MalariaPatientReport.json': make_patient_report(self.rng, 2, self.ntsteps, [-5.0, 20.0])}
+            simulation = MockSimulation(tags={'Run_Number': 0, 'x_Temp_LH_values': lh_value, 'Site': 'test_site'})
+            all_data[simulation] = analyzer.map(data, simulation)
+            expected_dfs.append(self.get_analyzer().map(data, simulation))
+        analyzer.reduce(all_data)
+
+        output_fname = os.path.join(self.working_dir, 'test_site', 'patient_reports.csv')
+        partitions = list(iter_analyzer_output_partitions(output_fname, partition_column='Run_Number'))
+        self.assertEqual(len(partitions), 1)
+        self.assertListEqual(sorted(partitions[0][1]['x_Temp_LH_values'].unique().tolist()), [0.1, 0.2])
+        expected_df = pd.read_csv(io.StringIO(to_csv_string(pd.concat(expected_dfs))))
+        pd.testing.assert_frame_equal(partitions[0][1].sort_values(['x_Temp_LH_values', 'id', 'simday'])
+                                      .reset_index(drop=True), expected_df)
+
+    def test_initialize_clears_earlier_outputs(self):
+        output_fname = os.path.join(self.working_dir, 'test_site', 'patient_reports.csv')
+        data = {'output/MalariaPatientReport.json': make_patient_report(self.rng, 2, self.ntsteps, [-5.0, 20.0])}
+        # an earlier analysis with more seeds, and an unpartitioned output from an older analysis
+        analyzer = PatientAnalyzer(expt_name='test_site', working_dir=self.working_dir,
+                                   start_report_day=self.start_report_day)
+        analyzer.initialize()
+        for run_number in [0, 1, 2]:
+            analyzer.map(data, MockSimulation(tags={'Run_Number': run_number, 'Site': 'test_site'}))
+        self.get_analyzer().map(data, self.simulation).to_csv(output_fname, index=False)
+
+        analyzer.initialize()
+        self.assertFalse(analyzer_output_exists(output_fname))
+        analyzer.map(data, MockSimulation(tags={'Run_Number': 1, 'Site': 'test_site'}))
+        self.assertListEqual([seed for seed, _ in iter_analyzer_output_partitions(output_fname, 'Run_Number')], [1])
+
+    def test_unpartitioned_output_is_read_by_run(self):
+        analyzer = self.get_analyzer()
+        all_data = {}
+        for run_number in [1, 0]:
+            data = {'output/MalariaPatientReport.json': make_patient_report(self.rng, 2, self.ntsteps, [-5.0, 20.0])}
+            simulation = MockSimulation(tags={'Run_Number': run_number, 'Site': 'test_site'})
+            all_data[simulation] = analyzer.map(data, simulation)
+        analyzer.reduce(all_data)
+
+        output_fname = os.path.join(self.working_dir, 'test_site', 'patient_reports.csv')
+        self.assertTrue(os.path.isfile(output_fname))
+        full_df = pd.read_csv(output_fname)
+        for seed, partition_df in iter_analyzer_output_partitions(output_fname, partition_column='Run_Number'):
+            expected_df = full_df[full_df['Run_Number'] == seed].reset_index(drop=True)
+            pd.testing.assert_frame_equal(partition_df, expected_df)
+
+
+class AnalyzerOutputTest(BaseTest):
+    def setUp(self) -> None:
+        super(AnalyzerOutputTest, self).setUp()
+        self.rng = np.random.default_rng(3)
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.working_dir = temp_dir.name
+        self.age_bins = [1, 5, 10, 15, 20, 40, 60, 1000]
+        self.dens_bins = [0, 50, 200, 500, 2000, 5000, 2000000]
+
+    def reduce_par_dens(self, output_format):
+        analyzer = ParDensAgeAnalyzer(expt_name='test_site', sweep_variables=['Run_Number', 'Site'],
+                                      working_dir=self.working_dir, start_year=0, end_year=2,
+                                      output_format=output_format)
+        analyzer.initialize()
+        all_data = {}
+        for run_number in range(2):
+            data = {fname: make_monthly_summary_report(self.rng, self.age_bins, self.dens_bins)
+                    for fname in analyzer.filenames}
+            simulation = SimpleNamespace(tags={'Run_Number': run_number, 'Site': 'test_site'})
+            all_data[run_number] = analyzer.map(data, simulation)
+        analyzer.reduce(all_data)
+        return os.path.join(self.working_dir, 'test_site', 'parasite_densities_by_age_month.csv')
+
+    def test_csv_output_is_default(self):
+        csv_path = self.reduce_par_dens(output_format='csv')
+        self.assertTrue(os.path.isfile(csv_path))
+        self.assertTrue(analyzer_output_exists(csv_path))
+        pd.testing.assert_frame_equal(read_analyzer_output(csv_path), pd.read_csv(csv_path))
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'pyarrow is not installed')
+    def test_parquet_output_matches_csv(self):
+        csv_path = self.reduce_par_dens(output_format='csv')
+        csv_df = read_analyzer_output(csv_path)
+        os.remove(csv_path)
+        self.rng = np.random.default_rng(3)
+        self.reduce_par_dens(output_format='parquet')
+
+        parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+        self.assertFalse(os.path.isfile(csv_path))
+        self.assertTrue(os.path.isfile(parquet_path))
+        self.assertTrue(analyzer_output_exists(csv_path))
+        self.assertIsInstance(pd.read_parquet(parquet_path)['Site'].dtype, pd.CategoricalDtype)
+        pd.testing.assert_frame_equal(read_analyzer_output(csv_path), csv_df)
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'pyarrow is not installed')
+    def test_partition_in_both_formats_is_read_once(self):
+        filepath = os.path.join(self.working_dir, 'patient_reports.csv')
+        df = pd.DataFrame({'Run_Number': [0, 0], 'id': [1, 2], 'age': [0.5, 3.0]})
+        write_analyzer_output_partition(df, filepath, 'Run_Number', output_format='csv', partition_id='sim_a')
+        parquet_path = write_analyzer_output_partition(df, filepath, 'Run_Number', output_format='parquet',
+                                                       partition_id='sim_a')
+        csv_path = write_analyzer_output_partition(df, filepath, 'Run_Number', output_format='csv',
+                                                   partition_id='sim_b')
+
+        self.assertDictEqual(get_analyzer_output_partitions(filepath), {0: [parquet_path, csv_path]})
+        partitions = list(iter_analyzer_output_partitions(filepath, partition_column='Run_Number'))
+        self.assertEqual(len(partitions), 1)
+        pd.testing.assert_frame_equal(partitions[0][1], pd.concat([df, df]).reset_index(drop=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import pandas as pd
+from BaseTest import BaseTest
+
+import simulations.campaign_cache as campaign_cache
+from simulations.campaign_cache import get_campaign_input_filepaths, get_campaign_key, get_campaign_state, \
+    restore_campaign_state, load_cached_campaign, save_cached_campaign, get_package_versions
+
+
+def new_campaign():
+    # the parts of an emod_api campaign module used by the campaign cache
+    event_map = {}
+    camp = SimpleNamespace(campaign_dict={'Events': [], 'Use_Defaults': 1}, custom_coordinator_events=[],
+                           custom_node_events=[], implicits=[], get_adhocs=lambda: event_map)
+    camp.get_custom_coordinator_events = lambda: list(camp.custom_coordinator_events)
+    camp.get_custom_node_events = lambda: list(camp.custom_node_events)
+    return camp
+
+
+class CampaignCacheTest(BaseTest):
+    def setUp(self) -> None:
+        super(CampaignCacheTest, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.cache_dir = os.path.join(self.temp_dir, '.campaign_cache')
+        for filename in ['eir.csv', 'cm.csv']:
+            pd.DataFrame({'site_a': [1.0, 2.0]}).to_csv(os.path.join(self.temp_dir, filename), index=False)
+        self.coord_row = pd.Series({'EIR_filepath': 'eir.csv', 'CM_filepath': 'cm.csv', 'NMF_filepath': float('nan'),
+                                    'simulation_duration': 3650})
+
+    def get_key(self, coord_row=None):
+        coord_row = self.coord_row if coord_row is None else coord_row
+        return get_campaign_key('site_a', coord_row, get_campaign_input_filepaths(coord_row, self.temp_dir))
+
+    def test_campaign_key(self):
+        self.assertListEqual([os.path.basename(f) for f in get_campaign_input_filepaths(self.coord_row, self.temp_dir)],
+                             ['eir.csv', 'cm.csv'])
+        key = self.get_key()
+        self.assertEqual(self.get_key(), key)
+        self.assertNotEqual(get_campaign_key('site_b', self.coord_row, []),
+                            get_campaign_key('site_a', self.coord_row, []))
+        self.assertNotEqual(self.get_key(self.coord_row.replace(3650, 7300)), key)
+        # a new version of the campaign packages changes the key
+        with mock.patch.dict(campaign_cache._package_versions, {'emodpy-malaria': 'another version'}):
+            self.assertNotEqual(self.get_key(), key)
+        self.assertEqual(self.get_key(), key)
+        self.assertListEqual(sorted(get_package_versions().keys()), ['emod-api', 'emodpy', 'emodpy-malaria'])
+        # a changed input file is hashed again and changes the key
+        cm_filepath = os.path.join(self.temp_dir, 'cm.csv')
+        pd.DataFrame({'site_a': [1.0, 3.0]}).to_csv(cm_filepath, index=False)
+        stat = os.stat(cm_filepath)
+        os.utime(cm_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertNotEqual(self.get_key(), key)
+
+    def test_campaign_round_trip(self):
+        camp = new_campaign()
+        camp.campaign_dict['Events'].append({'Start_Day': 1, 'Event_Coordinator_Config': {'Demographic_Coverage': 0.5}})
+        camp.get_adhocs()['Received_NMF_Treatment'] = 'GP_EVENT_000'
+        camp.custom_node_events.append('node_event')
+        key = self.get_key()
+        self.assertIsNone(load_cached_campaign(self.cache_dir, key))
+        save_cached_campaign(self.cache_dir, key, get_campaign_state(camp))
+        self.assertListEqual(os.listdir(self.cache_dir), [key + '.json'])
+
+        restored = restore_campaign_state(new_campaign(), load_cached_campaign(self.cache_dir, key))
+        self.assertDictEqual(restored.campaign_dict, camp.campaign_dict)
+        self.assertDictEqual(restored.get_adhocs(), camp.get_adhocs())
+        self.assertListEqual(restored.get_custom_node_events(), ['node_event'])
+        self.assertListEqual(restored.get_custom_coordinator_events(), [])
+        # restored campaigns do not share events
+        restored.campaign_dict['Events'][0]['Start_Day'] = 2
+        self.assertEqual(restore_campaign_state(new_campaign(), load_cached_campaign(self.cache_dir, key))
+                         .campaign_dict['Events'][0]['Start_Day'], 1)
+
+        # campaigns with implicit config functions are not cached
+        camp.implicits.append(lambda config: config)
+        self.assertIsNone(get_campaign_state(camp))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+from BaseTest import BaseTest
+
+import simulations.manifest as manifest
+from simulations.campaign_compaction import get_nmf_event_plan, get_max_repetitions, get_case_management_plan, \
+    validate_case_management
+
+
+def get_treated_days(nmf_events):
+    # (age group, coverage, day) of each day of NMF treatment
+    return sorted((event.agemin, event.coverage, day) for event in nmf_events.itertuples()
+                  for day in range(event.start_day, event.start_day + event.repetitions))
+
+
+class CampaignCompactionTest(BaseTest):
+    def setUp(self) -> None:
+        super(CampaignCompactionTest, self).setUp()
+        self.nmf_row = pd.Series({'U5_nmf': 0.0082, 'adult_nmf': 0.0039})
+        # the jump_year27 case management schedules, with a change of drug and an adult coverage of 0
+        self.hs_df = pd.DataFrame({'simday': [0, 9855, 12000, 14000], 'duration': [9855, 2145, 2000, 3000],
+                                   'U5_coverage': [0.3, 0.3, 0.3, 0.7], 'adult_coverage': [0.3, 0.3, 0.3, 0],
+                                   'severe_coverage': [0.6, 0.6, 0.6, 0.8], 'drug_code': ['SP', 'SP', 'AL', 'AL']})
+
+    def test_uncompacted_events(self):
+        nmf_events = get_nmf_event_plan(self.hs_df.iloc[:1], self.nmf_row, compact=False)
+        # the row starts on day 1 and has an event every 1000 days for each age group
+        self.assertListEqual(nmf_events['start_day'].tolist()[::2], list(range(1, 9855, 1000)))
+        self.assertListEqual(nmf_events['repetitions'].tolist()[::2], [1000] * 9 + [854])
+        self.assertListEqual(nmf_events['agemin'].tolist()[:2], [0, 5])
+
+    def test_compacted_events(self):
+        uncompacted = get_nmf_event_plan(self.hs_df, self.nmf_row, compact=False)
+        nmf_events = get_nmf_event_plan(self.hs_df, self.nmf_row, max_repetitions=10000)
+        self.assertListEqual(get_treated_days(nmf_events), get_treated_days(uncompacted))
+        self.assertEqual(len(uncompacted), 36)
+        # SP until day 12000 (split at 10000 days), AL at coverage 0.3, then AL at 0.7 for U5 only
+        self.assertListEqual(nmf_events['start_day'].tolist(), [1, 1, 10001, 10001, 12000, 12000, 14000])
+        self.assertListEqual(nmf_events['repetitions'].tolist(), [10000, 10000, 1999, 1999, 2000, 2000, 3000])
+        self.assertListEqual(nmf_events['agemin'].tolist(), [0, 5, 0, 5, 0, 5, 0])
+        self.assertListEqual(nmf_events['drug_code'].tolist(), ['SP', 'SP', 'SP', 'SP', 'AL', 'AL', 'AL'])
+
+        # rows that never end (duration -1) have no events
+        forever_df = self.hs_df.iloc[:1].assign(duration=-1)
+        self.assertEqual(len(get_nmf_event_plan(forever_df, self.nmf_row)), 0)
+        self.assertEqual(len(get_nmf_event_plan(forever_df, self.nmf_row, compact=False)), 0)
+
+    def test_case_management_plan(self):
+        # a daily case management series with the same coverages every 30 days, then constant until the end
+        days = np.arange(0, 3650)
+        daily_df = pd.DataFrame({'simday': days, 'duration': 1, 'U5_coverage': 0.1 * (days // 30 % 2),
+                                 'adult_coverage': 0.1, 'severe_coverage': 0.5})
+        daily_df.loc[daily_df.index[-1], 'duration'] = -1
+        hs_plan = get_case_management_plan(daily_df)
+        self.assertEqual(len(hs_plan), int(np.ceil(3650 / 30)))
+        self.assertListEqual(hs_plan['simday'].tolist(), list(range(0, 3650, 30)))
+        self.assertListEqual(hs_plan['duration'].tolist()[:-1], [30] * (len(hs_plan) - 1))
+        self.assertEqual(hs_plan['duration'].iloc[-1], -1)
+        self.assertListEqual(hs_plan['drug_code'].unique().tolist(), ['AL'])
+        self.assertEqual(len(get_case_management_plan(daily_df, compact=False)), len(daily_df))
+        # rows with a different drug are not merged
+        self.assertListEqual(get_case_management_plan(self.hs_df)['simday'].tolist(), [0, 12000, 14000])
+
+    def test_case_management_validation(self):
+        for filename in os.listdir(manifest.input_files_path / 'case_management'):
+            validate_case_management(pd.read_csv(manifest.input_files_path / 'case_management' / filename))
+        with self.assertRaises(ValueError):
+            validate_case_management(self.hs_df.drop(columns='severe_coverage'))
+        with self.assertRaises(ValueError):
+            validate_case_management(self.hs_df.assign(U5_coverage=1.5))
+        with self.assertRaises(ValueError):
+            validate_case_management(self.hs_df.assign(duration=[9855, 2145, 0, 3000]))
+        with self.assertRaises(ValueError):
+            validate_case_management(self.hs_df.assign(duration=[9856, 2145, 2000, 3000]))
+        with self.assertRaises(ValueError):
+            validate_case_management(self.hs_df.assign(duration=[-1, 2145, 2000, 3000]))
+        with self.assertRaises(ValueError):
+            get_nmf_event_plan(self.hs_df, self.nmf_row.replace(0.0082, 2))
+
+    def test_max_repetitions(self):
+        self.assertEqual(get_max_repetitions(str(manifest.schema_file)), 10000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from BaseTest import BaseTest
+
+import simulations.manifest as manifest
+from simulations.daily_eir_store import get_site_eir, get_annual_eir, load_daily_eir_store
+
+
+class DailyEIRStoreTest(BaseTest):
+    def setUp(self) -> None:
+        super(DailyEIRStoreTest, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.input_dir = temp_dir.name
+        self.store_filepath = os.path.join(temp_dir.name, 'daily_eirs', 'daily_eir_store.npz')
+        pd.DataFrame({'month': range(1, 13), 'site_a': range(1, 13), 'site_b': [2.0] * 12}).to_csv(
+            os.path.join(self.input_dir, 'monthly_eirs.csv'))
+        pd.DataFrame({'site_c': np.linspace(0, 1, 365)}).to_csv(os.path.join(self.input_dir, 'daily_eirs.csv'))
+        self.coord_df = pd.DataFrame({'site': ['site_a', 'site_b', 'site_c'],
+                                      'EIR_filepath': ['monthly_eirs.csv', 'monthly_eirs.csv', 'daily_eirs.csv']}
+                                     ).set_index('site')
+
+    def test_daily_eir_store(self):
+        self.assertIsNone(load_daily_eir_store(self.store_filepath))
+        # monthly EIRs are kept as the 12 monthly values and daily EIRs as the 365 daily values
+        site_a = get_site_eir('site_a', self.coord_df, self.input_dir, self.store_filepath)
+        self.assertListEqual(site_a.tolist(), list(range(1, 13)))
+        self.assertTrue(os.path.exists(self.store_filepath))
+        self.assertListEqual(load_daily_eir_store(self.store_filepath)['sites'], ['site_a', 'site_b', 'site_c'])
+        self.assertEqual(get_annual_eir('site_a', self.coord_df, self.input_dir, self.store_filepath), 78)
+        np.testing.assert_array_equal(get_site_eir('site_c', self.coord_df, self.input_dir, self.store_filepath),
+                                      pd.read_csv(os.path.join(self.input_dir, 'daily_eirs.csv'))['site_c'])
+        # the store is not rebuilt while the EIR csvs are unchanged
+        store_mtime = os.stat(self.store_filepath).st_mtime_ns
+        np.testing.assert_array_equal(get_site_eir('site_a', self.coord_df, self.input_dir, self.store_filepath),
+                                      site_a)
+        self.assertEqual(os.stat(self.store_filepath).st_mtime_ns, store_mtime)
+
+        # a changed EIR csv rebuilds the store
+        pd.DataFrame({'month': range(1, 13), 'site_a': [1.0] * 12, 'site_b': [2.0] * 12}).to_csv(
+            os.path.join(self.input_dir, 'monthly_eirs.csv'))
+        self.assertEqual(get_annual_eir('site_a', self.coord_df, self.input_dir, self.store_filepath), 12)
+        # sites of another coordinator are kept in the store
+        other_coord_df = pd.DataFrame({'site': ['site_d'], 'EIR_filepath': ['daily_eirs.csv']}).set_index('site')
+        with self.assertRaises(ValueError):
+            get_site_eir('site_d', other_coord_df, self.input_dir, self.store_filepath)
+        self.assertListEqual(load_daily_eir_store(self.store_filepath)['sites'], ['site_a', 'site_b', 'site_c'])
+
+    def test_unsupported_eir_layouts(self):
+        # two years of monthly EIRs and 31 years of monthly EIRs (more rows than a year of daily EIRs)
+        for nmonths in [24, 372]:
+            pd.DataFrame({'site_a': np.ones(nmonths)}).to_csv(os.path.join(self.input_dir, 'monthly_eirs.csv'))
+            with self.assertRaises(ValueError):
+                get_site_eir('site_a', self.coord_df.loc[['site_a']], self.input_dir, self.store_filepath)
+
+    def test_coordinator_annual_eirs(self):
+        # the campaign EIRs and annual EIRs are the first 12 monthly EIRs and their sum, as read from the csv
+        coord_df = pd.read_csv(manifest.simulation_coordinator_path).set_index('site')
+        monthly_eirs = pd.read_csv(manifest.input_files_path / 'monthly_eirs' / 'eir_by_site.csv')
+        for site in ['chonyi_1999', 'dielmo_1990', 'navrongo_2000']:
+            self.assertListEqual(get_site_eir(site, coord_df, manifest.input_files_path, self.store_filepath).tolist(),
+                                 monthly_eirs.loc[monthly_eirs.index[0:12], site].tolist())
+            self.assertEqual(get_annual_eir(site, coord_df, manifest.input_files_path, self.store_filepath),
+                             sum(monthly_eirs.loc[monthly_eirs.index[0:12], site]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import unittest
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from BaseTest import BaseTest
+
+from create_plots.helpers_plot_ref_sim_comparisons import get_time_pos, get_frac_state_swaps, \
+    create_barplot_frac_comparison
+
+reference_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'reference_datasets',
+                              'Navrongo_infection_duration.csv')
+
+
+def legacy_get_time_pos(data, pos_thresh_dens):
+    # per-individual implementation of get_time_pos used as the reference output (with runs ending on the last sample
+    # counted as censored)
+    indIDs = data['SID'].unique()
+    days_positive = list()
+    sample_censored = list()
+    sample_ages = list()
+    sample_seeds = list()
+    seeds = data['seed'].unique() if 'seed' in data.columns else [0]
+    for ss in seeds:
+        data_ss = data[data['seed'] == ss] if 'seed' in data.columns else data
+        for ii in range(len(indIDs)):
+            data_cur = data_ss[data_ss['SID'] == indIDs[ii]]
+            data_cur = data_cur.sort_values(by='date')
+            cur_age = data_cur['age'].mean()
+            pos_bool = list(data_cur['DENSITY'] > pos_thresh_dens)
+            lengths, values = [], []
+            for pos in pos_bool:
+                if len(values) > 0 and values[-1] == pos:
+                    lengths[-1] += 1
+                else:
+                    lengths.append(1)
+                    values.append(pos)
+            start_index = [0] + list(np.cumsum(lengths))[:-1]
+            for tt in np.where(np.array(values))[0]:
+                sample_censored.append(tt == 0 or tt == len(lengths) - 1)
+                sample_ages.append(cur_age)
+                sample_seeds.append(ss)
+                first_day = data_cur['date'].iloc[start_index[tt]]
+                last_day = data_cur['date'].iloc[start_index[tt] + lengths[tt] - 1]
+                if isinstance(last_day, str):
+                    last_day = datetime.strptime(last_day, '%Y-%m-%d')
+                if isinstance(first_day, str):
+                    first_day = datetime.strptime(first_day, '%Y-%m-%d')
+                days_positive.append((last_day - first_day).days)
+    return pd.DataFrame({'days_positive': days_positive,
+                         'censored': sample_censored,
+                         'age': sample_ages,
+                         'seed': sample_seeds})
+
+
+def legacy_get_frac_state_swaps(data, pos_thresh_dens):
+    # per-individual implementation of get_frac_state_swaps used as the reference output
+    indIDs = data['SID'].unique()
+    sum_denom_pos = 0
+    sum_turn_neg = 0
+    sum_denom_neg = 0
+    sum_turn_pos = 0
+    for ii in range(len(indIDs)):
+        data_cur = data[data['SID'] == indIDs[ii]]
+        data_cur = data_cur.sort_values(by=['date'])
+        ind_pos = data_cur['DENSITY'] > pos_thresh_dens
+        pos_count = sum(ind_pos)
+        neg_count = len(ind_pos) - pos_count
+        last_obs_pos = (data_cur['DENSITY'].iloc[len(data_cur) - 1] > pos_thresh_dens)
+        sum_denom_pos = sum_denom_pos + pos_count - 1 if last_obs_pos else sum_denom_pos + pos_count
+        sum_denom_neg = sum_denom_neg + neg_count if last_obs_pos else sum_denom_neg + neg_count - 1
+        for i in range(len(ind_pos) - 1):
+            if ind_pos.iloc[i] and not ind_pos.iloc[i + 1]:
+                sum_turn_neg += 1
+            elif not ind_pos.iloc[i] and ind_pos.iloc[i + 1]:
+                sum_turn_pos += 1
+    return [sum_turn_neg / sum_denom_pos, sum_turn_pos / sum_denom_neg]
+
+
+def make_simulated_surveys(ref_df, rng, n_seeds=10):
+    """
+    Build simulated survey results with the same sampling days and ages as the reference, for several seeds (as
+    returned by get_sim_survey, with dates saved as strings)
+    """
+    sim_dfs = []
+    for seed in range(n_seeds):
+        sim_df = ref_df[['SID', 'date', 'age']].copy()
+        sim_df['SID'] = pd.factorize(sim_df['SID'])[0] + 1
+        sim_df['date'] = sim_df['date'].dt.strftime('%Y-%m-%d')
+        sim_df['DENSITY'] = rng.choice([0, 0, 20, 500, 10000], size=len(sim_df))
+        sim_df['seed'] = seed
+        sim_dfs.append(sim_df)
+    return pd.concat(sim_dfs, ignore_index=True)
+
+
+class InfectionDurationTest(BaseTest):
+    def setUp(self) -> None:
+        super(InfectionDurationTest, self).setUp()
+        self.rng = np.random.default_rng(0)
+        self.ref_df = pd.read_csv(reference_path)
+        self.ref_df['date'] = pd.to_datetime(self.ref_df['date'])
+        self.pos_thresh_dens = 39
+
+    def assert_time_pos_equal(self, new_df, legacy_df):
+        pd.testing.assert_frame_equal(new_df.reset_index(drop=True), legacy_df.reset_index(drop=True),
+                                      check_dtype=False)
+
+    def test_time_pos_reference_matches_legacy(self):
+        self.assert_time_pos_equal(get_time_pos(self.ref_df, self.pos_thresh_dens),
+                                   legacy_get_time_pos(self.ref_df, self.pos_thresh_dens))
+
+    def test_time_pos_handles_single_and_censored_runs(self):
+        data = pd.DataFrame({'SID': ['a', 'a', 'a', 'a', 'b', 'c', 'c'],
+                             'date': pd.to_datetime(['2000-01-05', '2000-01-01', '2000-01-20', '2000-01-10',
+                                                     '2000-01-01', '2000-01-01', '2000-01-08']),
+                             'DENSITY': [100, 0, 0, 100, 100, 0, 0],
+                             'age': [2, 2, 2, 2, 30, 5, 5]})
+        time_pos = get_time_pos(data, pos_thresh_dens=39)
+        self.assertListEqual(time_pos['days_positive'].tolist(), [5, 0])
+        self.assertListEqual(time_pos['censored'].tolist(), [False, True])
+        self.assertListEqual(time_pos['age'].tolist(), [2, 30])
+        self.assertListEqual(time_pos['seed'].tolist(), [0, 0])
+        self.assertEqual(len(get_time_pos(data.iloc[[]], pos_thresh_dens=39)), 0)
+
+    def test_time_pos_reference_and_10_seeds_match_legacy(self):
+        sim_df = make_simulated_surveys(self.ref_df, self.rng, n_seeds=10)
+        self.assert_time_pos_equal(get_time_pos(self.ref_df, self.pos_thresh_dens),
+                                   legacy_get_time_pos(self.ref_df, self.pos_thresh_dens))
+        self.assert_time_pos_equal(get_time_pos(sim_df, self.pos_thresh_dens),
+                                   legacy_get_time_pos(sim_df, self.pos_thresh_dens))
+
+    def test_frac_state_swaps_reference_matches_legacy(self):
+        np.testing.assert_allclose(get_frac_state_swaps(self.ref_df, self.pos_thresh_dens),
+                                   legacy_get_frac_state_swaps(self.ref_df, self.pos_thresh_dens))
+
+    def test_frac_state_swaps_by_seed(self):
+        sim_df = make_simulated_surveys(self.ref_df, self.rng, n_seeds=3)
+        by_seed = get_frac_state_swaps(sim_df, self.pos_thresh_dens, by_seed=True)
+        self.assertListEqual(by_seed['seed'].tolist(), [0, 1, 2])
+        for seed in range(3):
+            expected = legacy_get_frac_state_swaps(sim_df[sim_df['seed'] == seed], self.pos_thresh_dens)
+            np.testing.assert_allclose(by_seed.loc[by_seed['seed'] == seed, ['frac_pos_turn_neg_next_time',
+                                                                             'frac_neg_turn_pos_next_time']].values[0],
+                                       expected)
+
+    def test_barplot_frac_comparison_shows_seed_range(self):
+        sim_df = make_simulated_surveys(self.ref_df, self.rng, n_seeds=3)
+        gg = create_barplot_frac_comparison(self.ref_df.copy(), sim_df, self.pos_thresh_dens)
+        plot_df = gg.data.set_index(['source', 'measure'])
+        by_seed = get_frac_state_swaps(sim_df, self.pos_thresh_dens, by_seed=True)
+        sim_row = plot_df.loc[('simulation', 'positive to negative next time')]
+        self.assertAlmostEqual(sim_row['value'], by_seed['frac_pos_turn_neg_next_time'].mean())
+        self.assertAlmostEqual(sim_row['quant_low'], by_seed['frac_pos_turn_neg_next_time'].min())
+        self.assertAlmostEqual(sim_row['quant_high'], by_seed['frac_pos_turn_neg_next_time'].max())
+        self.assertTrue(np.isnan(plot_df.loc[('reference', 'positive to negative next time'), 'quant_low']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+from BaseTest import BaseTest
+
+from simulations.input_registry import load_input_csv, get_input_registry_counts, clear_input_registry, \
+    get_file_hash
+
+
+class InputRegistryTest(BaseTest):
+    def setUp(self) -> None:
+        super(InputRegistryTest, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.addCleanup(clear_input_registry)
+        clear_input_registry()
+        self.filepath = os.path.join(temp_dir.name, 'eir_by_site.csv')
+        pd.DataFrame({'month': range(1, 13), 'site_a': [1.0] * 12}).to_csv(self.filepath, index=False)
+
+    def test_input_is_read_once(self):
+        eir_df = load_input_csv(self.filepath)
+        # changes to a loaded dataframe are not kept in the registry
+        eir_df['site_a'] = 0
+        for _ in range(3):
+            pd.testing.assert_frame_equal(load_input_csv(self.filepath), pd.read_csv(self.filepath))
+        self.assertDictEqual(get_input_registry_counts(), {'reads': 1, 'hits': 3})
+        # different read_csv arguments are kept separately
+        self.assertListEqual(load_input_csv(self.filepath, index_col='month').columns.tolist(), ['site_a'])
+        self.assertEqual(get_input_registry_counts()['reads'], 2)
+
+    def test_changed_input_is_read_again(self):
+        self.assertEqual(load_input_csv(self.filepath)['site_a'].sum(), 12)
+        pd.DataFrame({'month': range(1, 13), 'site_a': [2.0] * 12}).to_csv(self.filepath, index=False)
+        stat = os.stat(self.filepath)
+        os.utime(self.filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(load_input_csv(self.filepath)['site_a'].sum(), 24)
+        self.assertDictEqual(get_input_registry_counts(), {'reads': 2, 'hits': 0})
+
+    def test_changed_file_is_hashed_again(self):
+        file_hash = get_file_hash(self.filepath)
+        self.assertEqual(get_file_hash(self.filepath), file_hash)
+        with open(self.filepath, 'a') as f:
+            f.write('13,1.0\n')
+        stat = os.stat(self.filepath)
+        os.utime(self.filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertNotEqual(get_file_hash(self.filepath), file_hash)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import math
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+from BaseTest import BaseTest
+from scipy import stats
+from scipy.special import gammaln, xlogy
+
+from create_plots.helpers_likelihood_and_metrics import binomial_logpmf, get_prev_loglikelihood, \
+    get_dens_loglikelihood, get_prev_loglikelihood_table, get_dens_loglikelihood_table
+
+
+def legacy_get_prev_loglikelihood(combined_df, sim_column='simulation'):
+    # per-site implementation of get_prev_loglikelihood (with scipy.stats.binom.logpmf) used as the reference output
+    combined_df['prob_pos_sim'] = combined_df[sim_column]
+    combined_df = combined_df.dropna(subset=['total_sampled'])
+    sites = combined_df['site_month'].unique()
+    loglik_by_site = [None] * len(sites)
+    for ss in range(len(sites)):
+        cur_df = combined_df[combined_df['site_month'] == sites[ss]]
+        if any(pd.isna(cur_df['prob_pos_sim'])):
+            loglik_by_site[ss] = np.nan
+        else:
+            loglik_by_site[ss] = sum(stats.binom.logpmf(cur_df['num_pos'], cur_df['total_sampled'],
+                                                        cur_df['prob_pos_sim']))
+    return pd.DataFrame({'site_month': sites, 'loglikelihood': loglik_by_site})
+
+
+def legacy_get_dens_loglikelihood(combined_df, sim_column='simulation'):
+    # per-site, per-age implementation of get_dens_loglikelihood used as the reference output (for inputs without
+    # missing reference bins)
+    combined_df = combined_df[~combined_df[sim_column].isna()]
+    site_months = combined_df['site_month'].unique()
+    loglik_by_site = []
+    for ss in site_months:
+        loglikelihood = 0
+        cur_agebins = combined_df[combined_df['site_month'] == ss]['agebin'].unique()
+        for aa in cur_agebins:
+            cur_df = combined_df[(combined_df['site_month'] == ss) & (combined_df['agebin'] == aa)]
+            if sum(cur_df['ref_bin_count']) == cur_df['ref_total'].iloc[0] and len(cur_df['ref_total'].unique()) == 1:
+                x = np.array(list(cur_df['ref_bin_count']))
+                n = sum(cur_df['ref_bin_count'])
+                p = np.array(list(cur_df[sim_column]))
+                try:
+                    loglikelihood += math.log(np.exp(gammaln(n + 1) + np.sum(xlogy(x, p) - gammaln(x + 1), axis=-1)))
+                except ValueError:
+                    loglikelihood = -np.inf
+        loglik_by_site.append(loglikelihood)
+    return pd.DataFrame({'site_month': site_months, 'loglikelihood': loglik_by_site})
+
+
+def make_combined_density(rng, nsites=100, nages=4, nbins=6, sample_size=20):
+    """
+    Build a combined reference/simulation parasite density dataframe with the density-bin distribution of several age
+    groups for each site-month
+    """
+    dfs = []
+    for ii in range(nsites):
+        for aa in range(nages):
+            freq_sim = rng.dirichlet(np.ones(nbins))
+            counts = rng.multinomial(sample_size, rng.dirichlet(np.ones(nbins)))
+            dfs.append(pd.DataFrame({'site_month': 'site_%d_month%d' % (ii, ii % 12 + 1), 'agebin': 5 * (aa + 1),
+                                     'densitybin': np.arange(nbins), 'ref_bin_count': counts,
+                                     'ref_total': sample_size, 'simulation': freq_sim}))
+    return pd.concat(dfs, ignore_index=True)
+
+
+def make_combined_prevalence(rng, nsites=200, nages=8):
+    """
+    Build a combined reference/simulation prevalence dataframe with several age groups for each site-month
+    """
+    total_sampled = rng.integers(1, 300, nsites * nages)
+    prevalence = rng.uniform(0, 1, nsites * nages)
+    return pd.DataFrame({'site_month': np.repeat(['site_%d_month%d' % (ii, ii % 12 + 1) for ii in range(nsites)],
+                                                 nages),
+                         'total_sampled': total_sampled,
+                         'num_pos': rng.binomial(total_sampled, prevalence),
+                         'simulation': np.clip(prevalence + rng.normal(0, 0.05, nsites * nages), 0.01, 0.99)})
+
+
+class LikelihoodTest(BaseTest):
+    def setUp(self) -> None:
+        super(LikelihoodTest, self).setUp()
+        self.rng = np.random.default_rng(0)
+
+    def test_binomial_logpmf_matches_scipy(self):
+        k = np.array([0, 3, 10, 2.5, 11, 3, 3, 0, 3, -1, 5, 0, 4])
+        n = np.array([10, 10, 10, 10, 10, 10.5, 10, 0, 10, 10, 10, 10, 10])
+        p = np.array([.3, .3, .3, .3, .3, .3, 1.2, .3, 0, .3, 1, 0, np.nan])
+        np.testing.assert_array_equal(binomial_logpmf(k, n, p), stats.binom.logpmf(k, n, p))
+
+        combined_df = make_combined_prevalence(self.rng)
+        np.testing.assert_allclose(binomial_logpmf(combined_df['num_pos'], combined_df['total_sampled'],
+                                                   combined_df['simulation']),
+                                   stats.binom.logpmf(combined_df['num_pos'], combined_df['total_sampled'],
+                                                      combined_df['simulation']))
+
+    def test_prev_loglikelihood_matches_legacy(self):
+        combined_df = make_combined_prevalence(self.rng, nsites=50)
+        # a site-month with a missing simulation value and a reference row without a sample size
+        combined_df.loc[3, 'simulation'] = np.nan
+        combined_df.loc[20, 'total_sampled'] = np.nan
+        new_df = get_prev_loglikelihood(combined_df.copy())
+        legacy_df = legacy_get_prev_loglikelihood(combined_df.copy())
+        pd.testing.assert_frame_equal(new_df, legacy_df, check_dtype=False)
+        self.assertTrue(np.isnan(new_df['loglikelihood'].iloc[0]))
+        self.assertTrue(np.isfinite(new_df['loglikelihood'].iloc[1:]).all())
+
+    def test_dens_loglikelihood_matches_legacy(self):
+        combined_df = make_combined_density(self.rng, nsites=30)
+        # a bin observed in the reference that never occurs in the simulation
+        combined_df.loc[combined_df.index[combined_df['ref_bin_count'] > 0][0], 'simulation'] = 0
+        new_df = get_dens_loglikelihood(combined_df.copy())
+        legacy_df = legacy_get_dens_loglikelihood(combined_df.copy())
+        pd.testing.assert_frame_equal(new_df, legacy_df, check_dtype=False)
+        self.assertEqual(new_df['loglikelihood'].iloc[0], -np.inf)
+
+    def test_dens_loglikelihood_is_stable_for_unlikely_distributions(self):
+        # large samples that are unlikely under the simulated frequencies: the probability underflows to 0 but the
+        # log-probability is finite
+        combined_df = make_combined_density(self.rng, nsites=3, sample_size=2000)
+        new_df = get_dens_loglikelihood(combined_df.copy())
+        legacy_df = legacy_get_dens_loglikelihood(combined_df.copy())
+        self.assertTrue(np.isfinite(new_df['loglikelihood']).all())
+        self.assertTrue(np.isneginf(legacy_df['loglikelihood']).all())
+        for ss, site_df in combined_df.groupby('site_month', sort=False):
+            expected = sum(stats.multinomial.logpmf(age_df['ref_bin_count'].to_numpy(), n=2000,
+                                                   p=age_df['simulation'].to_numpy())
+                           for aa, age_df in site_df.groupby('agebin'))
+            self.assertAlmostEqual(new_df.set_index('site_month').loc[ss, 'loglikelihood'], expected, places=6)
+
+    def test_dens_loglikelihood_skips_mismatched_totals_and_missing_bins(self):
+        combined_df = make_combined_density(self.rng, nsites=2, nages=2, nbins=3)
+        expected = legacy_get_dens_loglikelihood(combined_df.copy())
+        # density bins missing from the reference (and empty in the simulation) are removed
+        missing_bins = combined_df.iloc[:2].assign(densitybin=[10, 11], ref_bin_count=np.nan, simulation=0)
+        combined_df = pd.concat([combined_df, missing_bins], ignore_index=True)
+        pd.testing.assert_frame_equal(get_dens_loglikelihood(combined_df.copy()), expected, check_dtype=False)
+
+        combined_df.loc[0, 'ref_total'] = 100
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            new_df = get_dens_loglikelihood(combined_df.copy())
+        self.assertEqual(len(caught), 1)
+        first_age = combined_df.iloc[:3]
+        skipped = stats.multinomial.logpmf(first_age['ref_bin_count'].to_numpy(), n=20,
+                                             p=first_age['simulation'].to_numpy())
+        self.assertAlmostEqual(new_df['loglikelihood'].iloc[0], expected['loglikelihood'].iloc[0] - skipped)
+
+    def test_loglikelihood_tables_match_single_columns(self):
+        prev_df = make_combined_prevalence(self.rng, nsites=20)
+        dens_df = make_combined_density(self.rng, nsites=20)
+        for combined_df, get_table, get_single in [(prev_df, get_prev_loglikelihood_table, get_prev_loglikelihood),
+                                                   (dens_df, get_dens_loglikelihood_table, get_dens_loglikelihood)]:
+            sim_values = self.rng.uniform(0, 1, (len(combined_df), 5))
+            sim_values[3, 2] = np.nan  # one simulation without output for a row of the first site-month
+            for ii in range(5):
+                combined_df[f'sim_{ii}'] = sim_values[:, ii]
+
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                from_columns = get_table(combined_df, sim_columns=[f'sim_{ii}' for ii in range(5)])
+                from_matrix = get_table(combined_df, sim_values=sim_values)
+            self.assertListEqual(list(from_columns.index), [f'sim_{ii}' for ii in range(5)])
+            self.assertListEqual(list(from_matrix.index), list(range(5)))
+            self.assertListEqual(list(from_columns.columns), list(combined_df['site_month'].unique()))
+            np.testing.assert_array_equal(from_columns.to_numpy(), from_matrix.to_numpy())
+            for ii in range(5):
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    single = get_single(combined_df.copy(), sim_column=f'sim_{ii}')
+                np.testing.assert_allclose(from_columns.loc[f'sim_{ii}', single['site_month']].to_numpy(dtype=float),
+                                           single['loglikelihood'].to_numpy(dtype=float))
+        # density rows without output are left out of their age group, which no longer matches the reference total
+        self.assertFalse(np.isnan(from_matrix.loc[2].iloc[0]))
+
+        with self.assertRaises(ValueError):
+            get_prev_loglikelihood_table(prev_df, sim_columns=['sim_0'], sim_values=sim_values)
+        with self.assertRaises(ValueError):
+            get_prev_loglikelihood_table(prev_df, sim_values=sim_values[:10])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+from BaseTest import BaseTest
+from plotnine import ggplot, aes, geom_point, scale_color_manual
+
+from create_plots.helpers_plot_rendering import render_plots, get_plot_key
+
+
+class PlotRenderingTest(BaseTest):
+    def setUp(self) -> None:
+        super(PlotRenderingTest, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+
+    def get_plot_jobs(self, output_dir, num_sites=3, offset=0):
+        os.makedirs(output_dir)
+        plot_jobs = []
+        for ii in range(num_sites):
+            df = pd.DataFrame({'x': [1, 2, 3], 'y': [ii, ii + 1, ii + 3 + offset], 'type': ['a', 'b', 'a']})
+            # manual scales cannot be pickled, as in the site comparison plots
+            gg = ggplot(df, aes('x', 'y', color='type')) + geom_point() + scale_color_manual(values=['red', 'blue'])
+            plot_jobs.append((gg, os.path.join(output_dir, f'site_{ii}.png'), dict(width=2, height=2, units='in')))
+        return plot_jobs
+
+    def test_pool_renders_same_files(self):
+        serial_dir = os.path.join(self.temp_dir, 'serial')
+        pool_dir = os.path.join(self.temp_dir, 'pool')
+        serial_timing = render_plots(self.get_plot_jobs(serial_dir), plot_workers=1)
+        pool_timing = render_plots(self.get_plot_jobs(pool_dir), plot_workers=2)
+        self.assertListEqual(serial_timing['filename'].tolist(), ['site_0.png', 'site_1.png', 'site_2.png'])
+        self.assertListEqual(pool_timing['filename'].tolist(), serial_timing['filename'].tolist())
+        self.assertTrue((pool_timing['render_seconds'] > 0).all())
+        for filename in serial_timing['filename']:
+            with open(os.path.join(serial_dir, filename), 'rb') as f1, open(os.path.join(pool_dir, filename), 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+        self.assertEqual(len(render_plots([], plot_workers=2)), 0)
+
+    def test_plot_key(self):
+        gg, _, save_kwargs = self.get_plot_jobs(os.path.join(self.temp_dir, 'a'))[0]
+        same_gg, _, _ = self.get_plot_jobs(os.path.join(self.temp_dir, 'b'))[0]
+        changed_gg, _, _ = self.get_plot_jobs(os.path.join(self.temp_dir, 'c'), offset=1)[0]
+        self.assertEqual(get_plot_key(gg, save_kwargs), get_plot_key(same_gg, save_kwargs))
+        self.assertNotEqual(get_plot_key(gg, save_kwargs), get_plot_key(changed_gg, save_kwargs))
+        self.assertNotEqual(get_plot_key(gg, save_kwargs), get_plot_key(gg, dict(save_kwargs, width=3)))
+        self.assertNotEqual(get_plot_key(gg, save_kwargs),
+                            get_plot_key(gg + scale_color_manual(values=['red', 'green']), save_kwargs))
+
+    def test_plot_cache(self):
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        timing_df = render_plots(self.get_plot_jobs(os.path.join(self.temp_dir, 'run_1')), plot_cache_dir=cache_dir)
+        self.assertFalse(timing_df['cached'].any())
+        # unchanged plots are copied from the cache, changed plots are rendered
+        plot_jobs = self.get_plot_jobs(os.path.join(self.temp_dir, 'run_2'))
+        plot_jobs[1] = self.get_plot_jobs(os.path.join(self.temp_dir, 'changed'), offset=1)[1]
+        timing_df = render_plots(plot_jobs, plot_workers=2, plot_cache_dir=cache_dir)
+        self.assertListEqual(timing_df['cached'].tolist(), [True, False, True])
+        for filename in ['site_0.png', 'site_2.png']:
+            with open(os.path.join(self.temp_dir, 'run_1', filename), 'rb') as f1, \
+                    open(os.path.join(self.temp_dir, 'run_2', filename), 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+        self.assertEqual(len(os.listdir(cache_dir)), 4)
+
+        # the least recently used plots are removed when the cache is full
+        cache_bytes = sum(os.path.getsize(os.path.join(cache_dir, filename)) for filename in os.listdir(cache_dir))
+        oldest = sorted(os.listdir(cache_dir))[0]
+        os.utime(os.path.join(cache_dir, oldest), (0, 0))
+        plot_jobs = self.get_plot_jobs(os.path.join(self.temp_dir, 'run_3'), num_sites=1, offset=2)
+        new_key = get_plot_key(plot_jobs[0][0], plot_jobs[0][2])
+        render_plots(plot_jobs, plot_cache_dir=cache_dir, plot_cache_max_bytes=cache_bytes)
+        cache_files = os.listdir(cache_dir)
+        self.assertNotIn(oldest, cache_files)
+        self.assertIn(new_key + '.png', cache_files)
+        self.assertLessEqual(sum(os.path.getsize(os.path.join(cache_dir, filename)) for filename in cache_files),
+                             cache_bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
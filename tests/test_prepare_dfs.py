@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+from BaseTest import BaseTest
+
+from create_plots.helpers_reformat_sim_ref_dfs import load_site_outputs, index_coordinator_by_site, concat_site_dfs
+from simulations.analyzers.analyzer_output import write_analyzer_output
+
+
+class PrepareDfsTest(BaseTest):
+    def setUp(self) -> None:
+        super(PrepareDfsTest, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.sim_dir = os.path.join(temp_dir.name, 'simulation')
+        self.bench_dir = os.path.join(temp_dir.name, 'benchmark')
+        self.sites = ['site_%d' % ii for ii in range(12)]
+        for ii, site in enumerate(self.sites):
+            os.makedirs(os.path.join(self.sim_dir, site))
+            write_analyzer_output(pd.DataFrame({'Site': site, 'value': [ii, ii + 1]}),
+                                  os.path.join(self.sim_dir, site, 'output.csv'),
+                                  output_format='parquet' if ii % 2 else 'csv')
+            # benchmark output only exists for some of the sites
+            if ii % 3 == 0:
+                os.makedirs(os.path.join(self.bench_dir, site))
+                write_analyzer_output(pd.DataFrame({'Site': site, 'value': [-ii]}),
+                                      os.path.join(self.bench_dir, site, 'output.csv'))
+
+    def test_load_site_outputs(self):
+        sim_dfs, bench_dfs = load_site_outputs(self.sites, 'output.csv', self.sim_dir,
+                                               benchmark_simulation_filepath=self.bench_dir, max_workers=4)
+        self.assertListEqual(list(sim_dfs.keys()), self.sites)
+        self.assertListEqual(list(bench_dfs.keys()), self.sites[::3])
+        for ii, site in enumerate(self.sites):
+            self.assertListEqual(sim_dfs[site]['value'].tolist(), [ii, ii + 1])
+        self.assertListEqual(concat_site_dfs(bench_dfs.values())['value'].tolist(), [0, -3, -6, -9])
+
+        sim_dfs, bench_dfs = load_site_outputs(self.sites[:2], 'output.csv', self.sim_dir)
+        self.assertEqual(len(sim_dfs), 2)
+        self.assertEqual(len(bench_dfs), 0)
+        self.assertEqual(load_site_outputs([], 'output.csv', self.sim_dir), ({}, {}))
+        self.assertEqual(len(concat_site_dfs([pd.DataFrame(), pd.DataFrame()])), 0)
+
+    def test_index_coordinator_by_site(self):
+        coord_csv = pd.DataFrame({'site': ['a', 'b', None, 'a'], 'p_detect_case': [0.5, 0.6, 0.7, 0.8]})
+        coord_by_site = index_coordinator_by_site(coord_csv)
+        self.assertListEqual(list(coord_by_site.index), ['a', 'b'])
+        self.assertEqual(coord_by_site.at['a', 'p_detect_case'], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
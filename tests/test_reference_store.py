@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+from BaseTest import BaseTest
+
+import create_plots.helpers_reference_store as reference_store
+from create_plots.helpers_reference_store import get_mean_from_upper_age, get_reference_site_df, load_reference_store
+
+base_reference_filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'reference_datasets')
+coordinator_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulation_inputs',
+                                'simulation_coordinator.csv')
+
+
+def legacy_reference_site_df(filepath_ref, relationship_name, cur_site):
+    # per-site reading and formatting of the reference data, as previously done in the prepare_* functions
+    ref_df_cur = pd.read_csv(filepath_ref)
+    if relationship_name == 'age_incidence':
+        ref_df_cur = ref_df_cur[ref_df_cur['Site'].str.lower() == cur_site.lower()]
+        return pd.DataFrame({'reference': ref_df_cur['INC'] / 1000,
+                             'mean_age': (ref_df_cur['INC_LAR'] + ref_df_cur['INC_UAR']) / 2,
+                             'Site': ref_df_cur['Site'],
+                             'ref_pop_size': ref_df_cur['POP'],
+                             'ref_year': ref_df_cur['START_YEAR']})
+    elif relationship_name == 'age_prevalence':
+        ref_df_cur = ref_df_cur[ref_df_cur['Site'].str.lower() == cur_site.lower()].copy()
+        if 'agebin' in ref_df_cur.columns:
+            upper_ages = sorted(ref_df_cur['agebin'].unique())
+            ref_df_cur['mean_age'] = ref_df_cur['agebin'].apply(get_mean_from_upper_age, upper_ages=upper_ages)
+        else:
+            ref_df_cur['mean_age'] = (ref_df_cur['PR_LAR'] + ref_df_cur['PR_UAR']) / 2
+        ref_df_cur.rename(columns={'PR_MONTH': 'month', 'PR': 'prevalence', 'N': 'total_sampled', 'N_POS': 'num_pos',
+                                   'PR_YEAR': 'year'}, inplace=True)
+        ref_df_cur = ref_df_cur[["Site", "mean_age", 'month', 'total_sampled', 'num_pos', 'prevalence', 'year']]
+        return ref_df_cur[~ref_df_cur['prevalence'].isna()]
+    elif relationship_name == 'age_parasite_density':
+        ref_df_cur = ref_df_cur[ref_df_cur['Site'].str.lower() == cur_site.lower()].copy()
+        ref_df_cur['Site'] = ref_df_cur['Site'].str.lower()
+        upper_ages = sorted(ref_df_cur['agebin'].unique())
+        ref_df_cur['mean_age'] = ref_df_cur['agebin'].apply(get_mean_from_upper_age, upper_ages=upper_ages)
+        return ref_df_cur
+    elif relationship_name == 'infectiousness_to_mosquitos':
+        ref_df_cur = ref_df_cur[ref_df_cur['site'].str.lower() == str(cur_site).lower()]
+        ref_df_cur = ref_df_cur.rename(columns={'site': 'Site'})
+        return pd.DataFrame({'reference': ref_df_cur['freq_frac_infect'],
+                             'agebin': ref_df_cur['agebin'],
+                             'densitybin': ref_df_cur['densitybin'],
+                             'fraction_infected_bin': ref_df_cur['fraction_infected_bin'],
+                             'Site': ref_df_cur['Site'],
+                             'month': ref_df_cur['month'],
+                             'site_month': ref_df_cur['Site'] + '_month' + ref_df_cur['month'].astype('str'),
+                             'ref_total': ref_df_cur['num_in_group'],
+                             'ref_bin_count': ref_df_cur['count']})
+    else:
+        ref_df_cur = ref_df_cur[ref_df_cur['site'].str.lower() == cur_site.lower()].copy()
+        ref_df_cur['date'] = pd.to_datetime(ref_df_cur['date'])
+        return ref_df_cur
+
+
+class ReferenceStoreTest(BaseTest):
+    def setUp(self) -> None:
+        super(ReferenceStoreTest, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.cache_dir = os.path.join(temp_dir.name, 'cache')
+        self.temp_reference_filepath = os.path.join(temp_dir.name, 'reference_datasets')
+        shutil.copytree(base_reference_filepath, self.temp_reference_filepath)
+        self.coord_csv = pd.read_csv(coordinator_path)
+        reference_store._loaded_reference_datasets.clear()
+        self.addCleanup(reference_store._loaded_reference_datasets.clear)
+
+    def test_site_dfs_match_legacy_formatting(self):
+        checked = 0
+        for relationship_name, (ref_column, _) in reference_store.reference_columns.items():
+            coord_rows = self.coord_csv[(self.coord_csv[relationship_name] == 1) & self.coord_csv[ref_column].notna()]
+            for cur_site, ref_filename in zip(coord_rows['site'], coord_rows[ref_column]):
+                site_df = get_reference_site_df(self.temp_reference_filepath, ref_filename, relationship_name,
+                                                cur_site, cache_dir=self.cache_dir)
+                legacy_df = legacy_reference_site_df(os.path.join(self.temp_reference_filepath, ref_filename),
+                                                     relationship_name, cur_site)
+                pd.testing.assert_frame_equal(site_df, legacy_df)
+                checked += 1
+        self.assertGreater(checked, 10)
+        self.assertEqual(len(get_reference_site_df(self.temp_reference_filepath, 'garki_prev_by_age_bin.csv',
+                                                   'age_prevalence', 'not_a_site', cache_dir=self.cache_dir)), 0)
+
+    def test_cache_is_reused_until_reference_changes(self):
+        loaded = load_reference_store(self.coord_csv, self.temp_reference_filepath, cache_dir=self.cache_dir)
+        self.assertEqual(loaded[('age_prevalence', 'garki_prev_by_age_bin.csv')], 3)
+        self.assertEqual(len(os.listdir(self.cache_dir)), len(loaded))
+        expected = get_reference_site_df(self.temp_reference_filepath, 'garki_prev_by_age_bin.csv',
+                                          'age_prevalence', 'Sugungum_1970', cache_dir=self.cache_dir)
+
+        # in a new process (nothing in memory), the datasets are read from the cache files instead of the csvs
+        reference_store._loaded_reference_datasets.clear()
+        with mock.patch.object(reference_store, 'build_reference_dataset', side_effect=AssertionError):
+            site_df = get_reference_site_df(self.temp_reference_filepath, 'garki_prev_by_age_bin.csv',
+                                            'age_prevalence', 'Sugungum_1970', cache_dir=self.cache_dir)
+        pd.testing.assert_frame_equal(site_df, expected)
+        # slices are copies, so changing them does not change the store
+        site_df['prevalence'] = 0
+        pd.testing.assert_frame_equal(get_reference_site_df(self.temp_reference_filepath, 'garki_prev_by_age_bin.csv',
+                                                            'age_prevalence', 'sugungum_1970',
+                                                            cache_dir=self.cache_dir), expected)
+
+        # a changed reference file is re-read, and the cache file for its previous contents is replaced
+        ref_path = os.path.join(self.temp_reference_filepath, 'garki_prev_by_age_bin.csv')
+        ref_df = pd.read_csv(ref_path)
+        ref_df['prevalence'] = ref_df['prevalence'] / 2
+        ref_df.to_csv(ref_path, index=False)
+        site_df = get_reference_site_df(self.temp_reference_filepath, 'garki_prev_by_age_bin.csv',
+                                        'age_prevalence', 'Sugungum_1970', cache_dir=self.cache_dir)
+        pd.testing.assert_series_equal(site_df['prevalence'], expected['prevalence'] / 2)
+        self.assertEqual(len([f for f in os.listdir(self.cache_dir) if f.startswith('age_prevalence_garki')]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
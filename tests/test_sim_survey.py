@@ -0,0 +1,122 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from BaseTest import BaseTest
+
+from create_plots.helpers_reformat_sim_ref_dfs import get_sim_survey, find_survey_candidates
+
+
+def make_patient_reports(rng, seeds, npatients=300, ndays=500):
+    """
+    Build a synthetic patient report (as written by PatientAnalyzer) with ages spread between 0 and 80 years
+    """
+    dfs = []
+    for seed in seeds:
+        initial_ages = rng.integers(0, 80 * 365, npatients)
+        dfs.append(pd.DataFrame({'simday': np.tile(np.arange(ndays), npatients),
+                                 'id': np.repeat(np.arange(1, npatients + 1), ndays),
+                                 'age': np.repeat(initial_ages, ndays) + np.tile(np.arange(ndays), npatients),
+                                 'true_asexual_parasites': rng.integers(0, 1000, npatients * ndays),
+                                 'Run_Number': seed}))
+    return pd.concat(dfs, ignore_index=True)
+
+
+def make_reference_survey(rng, nindividuals=40):
+    """
+    Build a synthetic reference survey with a few samples per individual in 2000
+    """
+    rows = []
+    for ii in range(nindividuals):
+        age = rng.uniform(0, 70)
+        dates = sorted(rng.choice(pd.date_range('2000-02-01', '2000-12-01'), 4, replace=False))
+        for jj, date in enumerate(dates):
+            rows.append({'SID': 'MD%03d' % ii, 'date': date, 'DENSITY': 0, 'age': age + jj / 12, 'site': 'test_site'})
+    return pd.DataFrame(rows)
+
+
+class SimSurveyTest(BaseTest):
+    def setUp(self) -> None:
+        super(SimSurveyTest, self).setUp()
+        self.rng = np.random.default_rng(0)
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.working_dir = temp_dir.name
+        self.sim_full = make_patient_reports(self.rng, seeds=[0, 1, 2])
+        self.ref_df = make_reference_survey(self.rng)
+
+    def get_survey(self, sim_dir, **kwargs):
+        os.makedirs(sim_dir, exist_ok=True)
+        self.sim_full.to_csv(os.path.join(sim_dir, 'patient_reports.csv'), index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return get_sim_survey(sim_dir=sim_dir, ref_df=self.ref_df.copy(), **kwargs)
+
+    def test_survey_is_reproducible(self):
+        survey1 = self.get_survey(os.path.join(self.working_dir, 'run1'), random_seed=4)
+        survey2 = self.get_survey(os.path.join(self.working_dir, 'run2'), random_seed=4)
+        pd.testing.assert_frame_equal(survey1.reset_index(drop=True), survey2.reset_index(drop=True))
+
+    def test_survey_is_independent_of_workers_and_seed_subset(self):
+        sequential = self.get_survey(os.path.join(self.working_dir, 'sequential'), random_seed=4, jobs=1)
+        parallel = self.get_survey(os.path.join(self.working_dir, 'parallel'), random_seed=4, jobs=2)
+        pd.testing.assert_frame_equal(sequential.reset_index(drop=True), parallel.reset_index(drop=True))
+
+        subset = self.get_survey(os.path.join(self.working_dir, 'subset'), random_seed=4, seeds=[2])
+        pd.testing.assert_frame_equal(subset.reset_index(drop=True),
+                                      sequential[sequential['seed'] == 2].reset_index(drop=True))
+
+        other_seed = self.get_survey(os.path.join(self.working_dir, 'other'), random_seed=5)
+        self.assertFalse(other_seed['SID'].reset_index(drop=True).equals(sequential['SID'].reset_index(drop=True)))
+
+    def test_saved_survey_is_resampled_when_requested(self):
+        sim_dir = os.path.join(self.working_dir, 'run')
+        survey = self.get_survey(sim_dir, seeds=[0])
+        # the saved subsample is reused unless it is resampled (e.g., after the patient report changed)
+        self.assertListEqual(self.get_survey(sim_dir)['seed'].unique().tolist(), [0])
+        resampled = self.get_survey(sim_dir, resample=True)
+        self.assertListEqual(sorted(resampled['seed'].unique()), [0, 1, 2])
+        pd.testing.assert_frame_equal(resampled[resampled['seed'] == 0].reset_index(drop=True),
+                                      survey.reset_index(drop=True), check_dtype=False)
+
+    def test_unmatched_reference_individuals_are_counted(self):
+        # a reference individual older than every simulated individual (by more than the widest age window)
+        old_individual = self.ref_df[self.ref_df['SID'] == 'MD000'].assign(SID='MD999', age=250)
+        self.ref_df = pd.concat([self.ref_df, old_individual], ignore_index=True)
+        with self.assertWarnsRegex(UserWarning, 'for 1 of the 41 reference individuals in seed 0'):
+            survey = self.get_survey(os.path.join(self.working_dir, 'run'), seeds=[0])
+        self.assertEqual(survey['SID'].nunique(), 40)
+
+    def test_survey_matches_reference_dates_and_ages(self):
+        survey = self.get_survey(os.path.join(self.working_dir, 'run'))
+        self.assertListEqual(sorted(survey['seed'].unique()), [0, 1, 2])
+        ref_dates = self.ref_df.groupby('SID')['date'].apply(lambda x: set(x.dt.date))
+        first_samples = self.ref_df.sort_values('date').groupby('SID').first()
+        for seed, survey_seed in survey.groupby('seed'):
+            # each simulated individual is sampled at most once
+            sampled_dates = survey_seed.groupby('SID')['date'].apply(set)
+            self.assertEqual(len(sampled_dates), len(ref_dates))
+            # every simulated individual is sampled on exactly the days of one reference individual, with an age
+            # within the matching window on the first day
+            for sim_id, dates in sampled_dates.items():
+                matches = [sid for sid, cur_dates in ref_dates.items() if cur_dates == dates]
+                self.assertGreater(len(matches), 0)
+                first_day = survey_seed[(survey_seed['SID'] == sim_id)].sort_values('simday').iloc[0]
+                self.assertTrue(any(abs(round(first_day['age']) - round(first_samples.loc[sid, 'age'])) <= 5
+                                    for sid in matches))
+
+    def test_find_survey_candidates_widens_age_window(self):
+        ages_on_day = {10: np.array([1, 2]), 13: np.array([3]), 17: np.array([4, 5]), 40: np.array([6])}
+        self.assertEqual(find_survey_candidates(ages_on_day, 10.2, included_ids=set()), ([1, 2], 0))
+        self.assertEqual(find_survey_candidates(ages_on_day, 10.2, included_ids={1, 2}), ([3], 5))
+        self.assertEqual(find_survey_candidates(ages_on_day, 10.2, included_ids={1, 2, 3}), ([4, 5], 10))
+        self.assertEqual(find_survey_candidates(ages_on_day, 10.2, included_ids={1, 2, 3, 4, 5},
+                                                max_year_range=25), ([], None))
+        self.assertEqual(find_survey_candidates({}, 10.2, included_ids=set()), ([], None))
+
+
+if __name__ == '__main__':
+    unittest.main()
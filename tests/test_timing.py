@@ -0,0 +1,68 @@
+import json
+import os
+import pstats
+import tempfile
+import unittest
+
+import pandas as pd
+from BaseTest import BaseTest
+
+from create_plots.helpers_likelihood_and_metrics import get_prev_loglikelihood_table
+from create_plots.helpers_timing import record_timing, run_timed, write_timing_report
+
+
+@record_timing
+def prepare_site_df(site, num_rows):
+    return pd.DataFrame({'Site': site, 'value': range(num_rows)})
+
+
+@record_timing
+def generate_test_outputs(sites):
+    site_dfs = [prepare_site_df(site=site, num_rows=ii + 2) for ii, site in enumerate(sites)]
+    combined_df = pd.concat(site_dfs)
+    return combined_df
+
+
+class TimingTest(BaseTest):
+    def setUp(self) -> None:
+        super(TimingTest, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+
+    def test_run_timed_records(self):
+        profile_filepath = os.path.join(self.temp_dir, 'profiles', 'test.prof')
+        records = run_timed(generate_test_outputs, ['a', 'b'], profile_filepath=profile_filepath)
+        records_df = pd.DataFrame(records)
+        self.assertListEqual(records_df['step'].tolist(), ['prepare_site_df', 'prepare_site_df',
+                                                           'generate_test_outputs'])
+        self.assertTrue((records_df['relationship'] == 'generate_test_outputs').all())
+        self.assertListEqual(records_df['depth'].tolist(), [1, 1, 0])
+        self.assertListEqual(records_df['site'].tolist()[:2], ['a', 'b'])
+        self.assertListEqual(records_df['rows_out'].tolist(), [2, 3, 5])
+        self.assertTrue((records_df['wall_seconds'] >= 0).all())
+        self.assertTrue(records_df['peak_rss_mb'].isna().all() or (records_df['peak_rss_mb'] > 0).all())
+        self.assertGreater(pstats.Stats(profile_filepath).total_calls, 0)
+        # records are only returned once
+        self.assertEqual(len(run_timed(len, [1])), 0)
+
+        # decorated pipeline functions record the rows of the dataframe they score
+        combined_df = pd.DataFrame({'Site': 'a', 'site_month': ['a_1', 'a_1', 'a_2'], 'total_sampled': [10, 20, 10],
+                                    'num_pos': [1, 2, 3], 'simulation': [0.1, 0.2, 0.3]})
+        records = run_timed(get_prev_loglikelihood_table, combined_df, sim_columns=['simulation'])
+        self.assertEqual(records[0]['rows_in'], 3)
+        self.assertEqual(records[0]['rows_out'], 1)
+        self.assertEqual(records[0]['site'], 'a')
+
+        timing_df = write_timing_report(records + pd.DataFrame(records_df).to_dict('records'), self.temp_dir)
+        pd.testing.assert_frame_equal(pd.read_csv(os.path.join(self.temp_dir, 'timing_report.csv')), timing_df,
+                                      check_dtype=False)
+        with open(os.path.join(self.temp_dir, 'timing_report.json')) as f:
+            report = json.load(f)
+        self.assertEqual(len(report['records']), 4)
+        self.assertSetEqual(set(report['relationship_seconds']), {'get_prev_loglikelihood_table',
+                                                                  'generate_test_outputs'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from BaseTest import BaseTest
+
+from create_plots.helpers_likelihood_and_metrics import add_to_summary_table, merge_summary_table_shards
+from create_plots.helpers_validation_manifest import get_relationship_fingerprints, get_changed_sites, \
+    load_validation_manifest, save_validation_manifest
+from simulations.analyzers.analyzer_output import write_analyzer_output
+
+
+class ValidationManifestTest(BaseTest):
+    def setUp(self) -> None:
+        super(ValidationManifestTest, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.sim_dir = os.path.join(self.temp_dir, 'simulation')
+        self.bench_dir = os.path.join(self.temp_dir, 'benchmark')
+        self.ref_dir = os.path.join(self.temp_dir, 'reference')
+        os.makedirs(self.ref_dir)
+        self.sites = ['site_a', 'site_b', 'site_c']
+        self.coord_csv = pd.DataFrame({'site': self.sites + ['site_d'],
+                                       'age_prevalence': [1, 1, 1, 0],
+                                       'age_prevalence_ref': ['ref_1.csv', 'ref_1.csv', 'ref_2.csv', 'ref_2.csv'],
+                                       'p_detect_case': [0.5, 0.5, 0.5, 0.5]})
+        for ref_filename in ['ref_1.csv', 'ref_2.csv']:
+            pd.DataFrame({'Site': self.sites, 'PR': [0.1, 0.2, 0.3]}).to_csv(os.path.join(self.ref_dir, ref_filename),
+                                                                             index=False)
+        # site_c has no simulation output, site_d is not used for this relationship
+        for site in ['site_a', 'site_b', 'site_d']:
+            for output_dir in [self.sim_dir, self.bench_dir]:
+                os.makedirs(os.path.join(output_dir, site))
+                write_analyzer_output(pd.DataFrame({'Site': site, 'prevalence': [0.1, 0.2]}),
+                                      os.path.join(output_dir, site, 'prev_inc_by_age_month.csv'))
+
+    def get_fingerprints(self):
+        return get_relationship_fingerprints(self.coord_csv, 'age_prevalence', self.sim_dir, self.ref_dir,
+                                             benchmark_simulation_filepath=self.bench_dir)
+
+    def test_fingerprints_change_with_site_inputs(self):
+        fingerprints = self.get_fingerprints()
+        self.assertListEqual(list(fingerprints.keys()), ['site_a', 'site_b'])
+        self.assertNotEqual(fingerprints['site_a'], fingerprints['site_b'])
+        self.assertDictEqual(self.get_fingerprints(), fingerprints)
+        self.assertListEqual(get_changed_sites(fingerprints, fingerprints), [])
+        self.assertListEqual(get_changed_sites(None, fingerprints), ['site_a', 'site_b'])
+
+        # changed simulation output (written in another format) only changes that site
+        write_analyzer_output(pd.DataFrame({'Site': 'site_b', 'prevalence': [0.1, 0.3]}),
+                              os.path.join(self.sim_dir, 'site_b', 'prev_inc_by_age_month.csv'),
+                              output_format='parquet')
+        new_fingerprints = self.get_fingerprints()
+        self.assertListEqual(get_changed_sites(fingerprints, new_fingerprints), ['site_b'])
+        fingerprints = new_fingerprints
+
+        # changed benchmark output
+        write_analyzer_output(pd.DataFrame({'Site': 'site_a', 'prevalence': [0.0]}),
+                              os.path.join(self.bench_dir, 'site_a', 'prev_inc_by_age_month.csv'))
+        new_fingerprints = self.get_fingerprints()
+        self.assertListEqual(get_changed_sites(fingerprints, new_fingerprints), ['site_a'])
+        fingerprints = new_fingerprints
+
+        # changed reference file: all sites using that file
+        pd.DataFrame({'Site': self.sites, 'PR': [0.2]*3}).to_csv(os.path.join(self.ref_dir, 'ref_1.csv'), index=False)
+        new_fingerprints = self.get_fingerprints()
+        self.assertListEqual(get_changed_sites(fingerprints, new_fingerprints), ['site_a', 'site_b'])
+        fingerprints = new_fingerprints
+
+        # changed coordinator row
+        self.coord_csv.loc[self.coord_csv['site'] == 'site_a', 'p_detect_case'] = 0.9
+        new_fingerprints = self.get_fingerprints()
+        self.assertListEqual(get_changed_sites(fingerprints, new_fingerprints), ['site_a'])
+
+        # a site added to the relationship
+        os.makedirs(os.path.join(self.sim_dir, 'site_c'))
+        write_analyzer_output(pd.DataFrame({'Site': 'site_c', 'prevalence': [0.1]}),
+                              os.path.join(self.sim_dir, 'site_c', 'prev_inc_by_age_month.csv'))
+        self.assertListEqual(get_changed_sites(new_fingerprints, self.get_fingerprints()), ['site_c'])
+
+    def test_manifest_round_trip(self):
+        self.assertDictEqual(load_validation_manifest(self.temp_dir), {})
+        manifest = {'age_prevalence': self.get_fingerprints()}
+        save_validation_manifest(self.temp_dir, manifest)
+        self.assertDictEqual(load_validation_manifest(self.temp_dir), manifest)
+
+    def test_summary_table_row_is_replaced(self):
+        combined_df = pd.DataFrame({'Site': ['a', 'a', 'b', 'b'], 'mean_age': [1, 2, 1, 2],
+                                    'reference': [0.5, 0.6, 0.2, 0.4], 'simulation': [0.4, 0.6, 0.3, 0.4],
+                                    'benchmark': [0.5, 0.5, 0.1, 0.1]})
+        add_to_summary_table(combined_df, self.temp_dir, 'prevalence')
+        add_to_summary_table(combined_df, self.temp_dir, 'incidence')
+        combined_df['simulation'] = combined_df['reference']
+        add_to_summary_table(combined_df, self.temp_dir, 'prevalence')
+        summary_df = pd.read_csv(os.path.join(self.temp_dir, 'summary_table_sim_benchmark.csv'))
+        self.assertListEqual(summary_df['validation_relationship'].tolist(), ['prevalence', 'incidence'])
+        self.assertEqual(summary_df['abs_diff_new'].iloc[0], 0)
+        self.assertGreater(summary_df['abs_diff_new'].iloc[1], 0)
+
+    def test_summary_table_shards_are_merged(self):
+        combined_df = pd.DataFrame({'Site': ['a', 'a', 'b', 'b'], 'mean_age': [1, 2, 1, 2],
+                                    'reference': [0.5, 0.6, 0.2, 0.4], 'simulation': [0.4, 0.6, 0.3, 0.4],
+                                    'benchmark': [0.5, 0.5, 0.1, 0.1]})
+        add_to_summary_table(combined_df, self.temp_dir, 'infectiousness')
+        # relationships created in parallel processes only write their own shards
+        names = ['gamet_par_dens', 'age_prevalence', 'asexual_par_dens', 'age_incidence', 'infectiousness']
+        with ProcessPoolExecutor(max_workers=3) as executor:
+            list(executor.map(add_to_summary_table, [combined_df] * len(names), [self.temp_dir] * len(names), names,
+                              [0.1] * len(names), [False] * len(names)))
+        self.assertEqual(len(os.listdir(os.path.join(self.temp_dir, 'summary_table_shards'))), len(names))
+        summary_df = merge_summary_table_shards(self.temp_dir)
+        self.assertListEqual(summary_df['validation_relationship'].tolist(),
+                             ['infectiousness', 'age_incidence', 'age_prevalence', 'asexual_par_dens',
+                              'gamet_par_dens'])
+        pd.testing.assert_frame_equal(pd.read_csv(os.path.join(self.temp_dir, 'summary_table_sim_benchmark.csv')),
+                                      summary_df.reset_index(drop=True), check_dtype=False)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, 'summary_table_shards')))
+        self.assertIsNone(merge_summary_table_shards(os.path.join(self.temp_dir, 'no_outputs')))
+
+        # a shard that is still being written is neither merged nor removed
+        add_to_summary_table(combined_df, self.temp_dir, 'age_incidence', merge_summary_table=False)
+        shard_dir = os.path.join(self.temp_dir, 'summary_table_shards')
+        with open(os.path.join(shard_dir, 'age_prevalence.csv.tmp'), 'w') as f:
+            f.write('validation_relationship\n')
+        merge_summary_table_shards(self.temp_dir)
+        self.assertListEqual(os.listdir(shard_dir), ['age_prevalence.csv.tmp'])
+
+
+if __name__ == '__main__':
+    unittest.main()